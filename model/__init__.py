@@ -13,10 +13,34 @@
 # limitations under the License.
 # ==============================================================================
 
-"""Makes helper libraries available in the carc19 package."""
+"""Makes helper libraries available in the carc19 package.
+
+Submodules are imported on first access, e.g. carc19.carc19_labels, so that
+importing the package does not load TensorFlow or define the flags.
+"""
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import carc19
-import carc19_input
+import importlib
+import sys
+
+_SUBMODULES = ('carc19', 'carc19_cache', 'carc19_class', 'carc19_input',
+               'carc19_labels', 'carc19_model', 'carc19_predict')
+
+if sys.version_info >= (3, 7):
+
+  def __getattr__(name):
+    if name not in _SUBMODULES:
+      raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    module = importlib.import_module(name)
+    globals()[name] = module
+    return module
+
+  def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULES))
+
+else:
+  # Module __getattr__ needs Python 3.7, import eagerly as before.
+  import carc19
+  import carc19_input
@@ -35,131 +35,104 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import os
-import re
-import sys
-import tarfile
+import math
 
-from six.moves import urllib
 import tensorflow as tf
 
 import carc19_input
 
+# The network and its flags live in carc19_model, so that prediction can
+# build it without the training flags; they are re-exported here for the
+# training and evaluation binaries.
+# pylint: disable=unused-import
+from carc19_model import BATCH_NORM_DECAY
+from carc19_model import BATCH_NORM_EPSILON
+from carc19_model import HFLIP_CLASS_MAP
+from carc19_model import IMAGE_SIZE
+from carc19_model import MODEL_WIDTHS
+from carc19_model import MOVING_AVERAGE_DECAY
+from carc19_model import NORMS
+from carc19_model import NUM_CLASSES
+from carc19_model import STEMS
+from carc19_model import TOWER_NAME
+from carc19_model import TTA_CROP_FRACTION
+from carc19_model import TTA_VIEWS
+from carc19_model import XLA_MODES
+from carc19_model import _jit_scope
+from carc19_model import dataset_stats
+from carc19_model import inference
+from carc19_model import inference_tta
+from carc19_model import no_summaries
+from carc19_model import parse_widths
+# pylint: enable=unused-import
+
 FLAGS = tf.app.flags.FLAGS
 
-# Basic model parameters.
-# TODO tf_home must be changed to be your tensorflow working dir. Structure like:
-# ex. ${tf_home}/tmp/carc19/{label_for_test.dat,label_for_train.dat,image/...}
-# tf_home = /home/work/tensorflow
-# mkdir -p /home/work/tensorflow/tmp
-# mv small4w /home/work/tensorflow/tmp/carc19   
-# OR mv big34w /home/work/tensorflow/tmp/carc19
-# cd ???/carc19/model
-# python carc19_train.py
-tf.app.flags.DEFINE_string('tf_home', '/home/xiusir/WorkShop/TensorFlow/MyFirstModel',
-                           """Basic path containing working directories, """
-                           """as data_dir, eval_dir, checkpoint_dir, train_dir""")
-tf.app.flags.DEFINE_integer('batch_size', 32,
-                            """Number of images to process in a batch.""")
-tf.app.flags.DEFINE_string('data_dir', '%s/tmp/carc19/' % FLAGS.tf_home,
-                           """Path to the CARC-19 data directory.""")
-tf.app.flags.DEFINE_boolean('use_fp16', False,
-                            """Train the model using fp16.""")
+# Input pipeline parameters. The model flags, like batch_size, data_dir or
+# image_size, are defined by carc19_model.py.
+tf.app.flags.DEFINE_integer('shuffle_buffer_mb',
+                            carc19_input.SHUFFLE_BUFFER_BYTES // (1024 * 1024),
+                            """Memory cap in MB of the training shuffle """
+                            """queue.""")
+tf.app.flags.DEFINE_boolean('uint8_queue', False,
+                            """Queue uint8 images and convert, distort and """
+                            """standardize them per batch.""")
+tf.app.flags.DEFINE_string('hard_examples_file', '',
+                           """Manifest of hard examples, written by """
+                           """carc19_eval.py --analyze and read by """
+                           """training.""")
+tf.app.flags.DEFINE_integer('hard_example_repeat', 1,
+                            """Times per epoch each hard training example """
+                            """is read.""")
+tf.app.flags.DEFINE_string('class_sampling', '',
+                           """Draw training examples from per-class """
+                           """streams weighted 'uniform' or 'sqrt' of the """
+                           """class frequency. Empty reads the label file """
+                           """uniformly.""")
 
 # Global constants describing the CARC-19 data set.
-IMAGE_SIZE = carc19_input.IMAGE_SIZE
-NUM_CLASSES = carc19_input.NUM_CLASSES
 NUM_EXAMPLES_PER_EPOCH_FOR_TRAIN = carc19_input.NUM_EXAMPLES_PER_EPOCH_FOR_TRAIN
 NUM_EXAMPLES_PER_EPOCH_FOR_EVAL = carc19_input.NUM_EXAMPLES_PER_EPOCH_FOR_EVAL
 
 
 # Constants describing the training process.
-MOVING_AVERAGE_DECAY = 0.9999     # The decay to use for the moving average.
 NUM_EPOCHS_PER_DECAY = 250.0      # Epochs after which learning rate decays.
 LEARNING_RATE_DECAY_FACTOR = 0.05  # Learning rate decay factor.
 INITIAL_LEARNING_RATE = 0.01       # Initial learning rate.
 
-# If a model is trained with multiple GPUs, prefix all Op names with tower_name
-# to differentiate the operations. Note that this prefix is removed from the
-# names of the summaries when visualizing a model.
-TOWER_NAME = 'tower'
-
-
-
-def _activation_summary(x):
-  """Helper to create summaries for activations.
-
-  Creates a summary that provides a histogram of activations.
-  Creates a summary that measures the sparsity of activations.
-
-  Args:
-    x: Tensor
-  Returns:
-    nothing
-  """
-  # Remove 'tower_[0-9]/' from the name in case this is a multi-GPU training
-  # session. This helps the clarity of presentation on tensorboard.
-  tensor_name = re.sub('%s_[0-9]*/' % TOWER_NAME, '', x.op.name)
-  tf.summary.histogram(tensor_name + '/activations', x)
-  tf.summary.scalar(tensor_name + '/sparsity',
-                                       tf.nn.zero_fraction(x))
-
-
-def _variable_on_cpu(name, shape, initializer, use_cpu=True):
-  """Helper to create a Variable stored on CPU memory.
-
-  Args:
-    name: name of the variable
-    shape: list of ints
-    initializer: initializer for Variable
-
-  Returns:
-    Variable Tensor
-  """
-  if use_cpu:
-    with tf.device('/cpu:0'):
-      dtype = tf.float16 if FLAGS.use_fp16 else tf.float32
-      #var = tf.get_variable(name, shape, initializer=initializer, dtype=dtype)
-      var = tf.Variable(initializer(shape, dtype=dtype), name=name)
-  else:
-    dtype = tf.float16 if FLAGS.use_fp16 else tf.float32
-    var = tf.Variable(initializer(shape, dtype=dtype), name=name)
-
-  return var
-
-
-def _variable_with_weight_decay(name, shape, stddev, wd):
-  """Helper to create an initialized Variable with weight decay.
-
-  Note that the Variable is initialized with a truncated normal distribution.
-  A weight decay is added only if one is specified.
+# Optimizer and learning rate schedule, defaulting to the constants above.
+tf.app.flags.DEFINE_string('optimizer', 'sgd',
+                           """Optimizer: 'sgd', 'momentum' or 'adam'.""")
+tf.app.flags.DEFINE_float('momentum', 0.9,
+                          """Momentum of the 'momentum' optimizer.""")
+tf.app.flags.DEFINE_float('learning_rate', INITIAL_LEARNING_RATE,
+                          """Initial learning rate.""")
+tf.app.flags.DEFINE_string('lr_schedule', 'step',
+                           """Learning rate schedule: 'step' (decay by """
+                           """LEARNING_RATE_DECAY_FACTOR every """
+                           """num_epochs_per_decay) or 'cosine' (decay to """
+                           """zero over num_epochs_per_decay).""")
+tf.app.flags.DEFINE_float('num_epochs_per_decay', NUM_EPOCHS_PER_DECAY,
+                          """Epochs of the learning rate schedule.""")
+tf.app.flags.DEFINE_float('warmup_epochs', 0.0,
+                          """Epochs of linear learning rate warmup.""")
+tf.app.flags.DEFINE_integer('accum_steps', 1,
+                            """Micro-batches of batch_size whose gradients """
+                            """are summed into one update.""")
+
+
+def train_inputs(image_size=None, num_shards=1, shard_index=0,
+                 num_holdout=0):
+  """Construct distorted input for CARC training using the Reader ops.
 
   Args:
-    name: name of the variable
-    shape: list of ints
-    stddev: standard deviation of a truncated Gaussian
-    wd: add L2Loss weight decay multiplied by this float. If None, weight
-        decay is not added for this Variable.
+    image_size: side of the input images, defaults to FLAGS.image_size.
+    num_shards: number of disjoint shards of the training set.
+    shard_index: shard read by this process.
+    num_holdout: size of the validation subset left out of training.
 
   Returns:
-    Variable Tensor
-  """
-  dtype = tf.float16 if FLAGS.use_fp16 else tf.float32
-  var = _variable_on_cpu(
-      name,
-      shape,
-      tf.truncated_normal_initializer(stddev=stddev, dtype=dtype))
-  if wd is not None:
-    weight_decay = tf.multiply(tf.nn.l2_loss(var), wd, name='weight_loss')
-    tf.add_to_collection('losses', weight_decay)
-  return var
-
-
-def train_inputs():
-  """Construct distorted input for CARC training using the Reader ops.
-
-  Returns:
-    images: Images. 4D tensor of [batch_size, IMAGE_SIZE, IMAGE_SIZE, 3] size.
+    images: Images. 4D tensor of [batch_size, image_size, image_size, 3] size.
     labels: Labels. 1D tensor of [batch_size] size.
 
   Raises:
@@ -168,22 +141,44 @@ def train_inputs():
   if not FLAGS.data_dir:
     raise ValueError('Please supply a data_dir')
   data_dir = FLAGS.data_dir
-  images, labels = carc19_input.train_inputs(data_dir=data_dir,
-                                             batch_size=FLAGS.batch_size)
+  images, labels = carc19_input.train_inputs(
+      data_dir=data_dir,
+      batch_size=FLAGS.batch_size,
+      shuffle_buffer_bytes=FLAGS.shuffle_buffer_mb * 1024 * 1024,
+      uint8_queue=FLAGS.uint8_queue,
+      decode_ratio=FLAGS.jpeg_decode_ratio,
+      raw_mode=FLAGS.raw_mode or None,
+      image_size=image_size or FLAGS.image_size,
+      hard_examples_file=FLAGS.hard_examples_file or None,
+      hard_example_repeat=FLAGS.hard_example_repeat,
+      class_sampling=FLAGS.class_sampling or None,
+      dataset_stats=dataset_stats(),
+      num_shards=num_shards,
+      shard_index=shard_index,
+      num_holdout=num_holdout)
   if FLAGS.use_fp16:
     images = tf.cast(images, tf.float16)
     labels = tf.cast(labels, tf.float16)
   return images, labels
 
 
-def evaluate_inputs(eval_data):
+def evaluate_inputs(eval_data, image_size=None, max_examples=None,
+                    sample_seed=None, num_epochs=None, num_holdout=0):
   """Construct input for CARC evaluation using the Reader ops.
 
   Args:
     eval_data: bool, indicating if one should use the train or eval data set.
+    image_size: side of the input images, defaults to FLAGS.image_size.
+    max_examples: if set, only read max_examples examples.
+    sample_seed: if set, draw the max_examples at random with this seed
+      instead of taking the head of the label file.
+    num_epochs: if set, make this many ordered passes, then stop; see
+      carc19_input.evaluate_inputs().
+    num_holdout: with eval_data False, read only the validation subset of
+      this size that train_inputs() leaves out.
 
   Returns:
-    images: Images. 4D tensor of [batch_size, IMAGE_SIZE, IMAGE_SIZE, 3] size.
+    images: Images. 4D tensor of [batch_size, image_size, image_size, 3] size.
     labels: Labels. 1D tensor of [batch_size] size.
 
   Raises:
@@ -192,155 +187,25 @@ def evaluate_inputs(eval_data):
   if not FLAGS.data_dir:
     raise ValueError('Please supply a data_dir')
   data_dir = FLAGS.data_dir
-  images, labels, keys = carc19_input.evaluate_inputs(eval_data=eval_data,
-                                        data_dir=data_dir,
-                                        batch_size=FLAGS.batch_size)
+  images, labels, keys = carc19_input.evaluate_inputs(
+      eval_data=eval_data,
+      data_dir=data_dir,
+      batch_size=FLAGS.batch_size,
+      uint8_queue=FLAGS.uint8_queue,
+      decode_ratio=FLAGS.jpeg_decode_ratio,
+      raw_mode=FLAGS.raw_mode or None,
+      image_size=image_size or FLAGS.image_size,
+      max_examples=max_examples,
+      sample_seed=sample_seed,
+      dataset_stats=dataset_stats(),
+      num_epochs=num_epochs,
+      num_holdout=num_holdout)
   if FLAGS.use_fp16:
     images = tf.cast(images, tf.float16)
     labels = tf.cast(labels, tf.float16)
   return images, labels, keys
 
 
-def inference(images):
-  """Build the CARC-19 model.
-
-  Args:
-    images: Images returned from distorted_inputs() or inputs().
-
-  Returns:
-    Logits.
-  """
-  # We instantiate all variables using tf.get_variable() instead of
-  # tf.Variable() in order to share variables across multiple GPU training runs.
-  # If we only ran this model on a single GPU, we could simplify this function
-  # by replacing all instances of tf.get_variable() with tf.Variable().
-  #
-  # conv1
-  with tf.variable_scope('conv1') as scope:
-    kernel = _variable_with_weight_decay('weights',
-                                         shape=[11, 11, 3, 32],
-                                         stddev=5e-2,
-                                         wd=0.0)
-    conv = tf.nn.conv2d(images, kernel, [1, 1, 1, 1], padding='SAME')
-    biases = _variable_on_cpu('biases', [32], tf.constant_initializer(0.0))
-    pre_activation = tf.nn.bias_add(conv, biases)
-    conv1 = tf.nn.relu(pre_activation, name=scope.name)
-    _activation_summary(conv1)
-
-  # pool1
-  pool1 = tf.nn.max_pool(conv1, ksize=[1, 3, 3, 1], strides=[1, 4, 4, 1],
-                         padding='SAME', name='pool1')
-  # norm1
-  norm1 = tf.nn.lrn(pool1, 4, bias=1.0, alpha=0.001 / 9.0, beta=0.75,
-                    name='norm1')
-
-  # conv2
-  with tf.variable_scope('conv2') as scope:
-    kernel = _variable_with_weight_decay('weights',
-                                         shape=[5, 5, 32, 96],
-                                         stddev=5e-2,
-                                         wd=0.0)
-    conv = tf.nn.conv2d(norm1, kernel, [1, 1, 1, 1], padding='SAME')
-    biases = _variable_on_cpu('biases', [96], tf.constant_initializer(0.1))
-    pre_activation = tf.nn.bias_add(conv, biases)
-    conv2 = tf.nn.relu(pre_activation, name=scope.name)
-    _activation_summary(conv2)
-
-  # norm2
-  norm2 = tf.nn.lrn(conv2, 4, bias=1.0, alpha=0.001 / 9.0, beta=0.75,
-                    name='norm2')
-  # pool2
-  pool2 = tf.nn.max_pool(norm2, ksize=[1, 3, 3, 1],
-                         strides=[1, 2, 2, 1], padding='SAME', name='pool2')
-
-  # conv3
-  with tf.variable_scope('conv3') as scope:
-    kernel = _variable_with_weight_decay('weights',
-                                         shape=[3, 3, 96, 192],
-                                         stddev=5e-2,
-                                         wd=0.0)
-    conv = tf.nn.conv2d(pool2, kernel, [1, 1, 1, 1], padding='SAME')
-    biases = _variable_on_cpu('biases', [192], tf.constant_initializer(0.1))
-    pre_activation = tf.nn.bias_add(conv, biases)
-    conv3 = tf.nn.relu(pre_activation, name=scope.name)
-    _activation_summary(conv3)
-  #### norm3
-  ###norm3 = tf.nn.lrn(conv3, 4, bias=1.0, alpha=0.001 / 9.0, beta=0.75,
-  ###                  name='norm3')
-  #### pool3
-  ###pool3 = tf.nn.max_pool(norm3, ksize=[1, 3, 3, 1],
-  ###                       strides=[1, 2, 2, 1], padding='SAME', name='pool3')
-
-  #### conv4
-  ###with tf.variable_scope('conv4') as scope:
-  ###  kernel = _variable_with_weight_decay('weights',
-  ###                                       shape=[3, 3, 192, 256],
-  ###                                       stddev=5e-2,
-  ###                                       wd=0.0)
-  ###  conv = tf.nn.conv2d(layer3, kernel, [1, 1, 1, 1], padding='SAME')
-  ###  biases = _variable_on_cpu('biases', [256], tf.constant_initializer(0.1))
-  ###  pre_activation = tf.nn.bias_add(conv, biases)
-  ###  conv4 = tf.nn.relu(pre_activation, name=scope.name)
-  ###  _activation_summary(conv4)
-  #### norm4
-  ###norm4 = tf.nn.lrn(conv4, 4, bias=1.0, alpha=0.001 / 9.0, beta=0.75,
-  ###                  name='norm4')
-  #### pool4
-  ###pool4 = tf.nn.max_pool(norm4, ksize=[1, 3, 3, 1],
-  ###                       strides=[1, 2, 2, 1], padding='SAME', name='pool3')
-
-  # conv5
-  with tf.variable_scope('conv5') as scope:
-    kernel = _variable_with_weight_decay('weights',
-                                         shape=[3, 3, 192, 128],
-                                         stddev=5e-2,
-                                         wd=0.0)
-    conv = tf.nn.conv2d(conv3, kernel, [1, 1, 1, 1], padding='SAME')
-    biases = _variable_on_cpu('biases', [128], tf.constant_initializer(0.1))
-    pre_activation = tf.nn.bias_add(conv, biases)
-    conv5 = tf.nn.relu(pre_activation, name=scope.name)
-    _activation_summary(conv5)
-  # norm5
-  norm5 = tf.nn.lrn(conv5, 4, bias=1.0, alpha=0.001 / 9.0, beta=0.75,
-                    name='norm5')
-  # pool5
-  pool5 = tf.nn.max_pool(norm5, ksize=[1, 3, 3, 1],
-                         strides=[1, 2, 2, 1], padding='SAME', name='pool3')
-
-  # local6
-  with tf.variable_scope('local6') as scope:
-    # Move everything into depth so we can perform a single matrix multiply.
-    reshape = tf.reshape(pool5, [FLAGS.batch_size, -1])
-    dim = reshape.get_shape()[1].value
-    weights = _variable_with_weight_decay('weights', shape=[dim, 1024],
-                                          stddev=0.04, wd=0.004)
-    biases = _variable_on_cpu('biases', [1024], tf.constant_initializer(0.1))
-    local6 = tf.nn.relu(tf.matmul(reshape, weights) + biases, name=scope.name)
-    _activation_summary(local6)
-
-  #### local7
-  ###with tf.variable_scope('local7') as scope:
-  ###  weights = _variable_with_weight_decay('weights', shape=[1024, 512],
-  ###                                        stddev=0.04, wd=0.004)
-  ###  biases = _variable_on_cpu('biases', [512], tf.constant_initializer(0.1))
-  ###  local7 = tf.nn.relu(tf.matmul(layer6, weights) + biases, name=scope.name)
-  ###  _activation_summary(local7)
-
-  # linear layer(WX + b),
-  # We don't apply softmax here because
-  # tf.nn.sparse_softmax_cross_entropy_with_logits accepts the unscaled logits
-  # and performs the softmax internally for efficiency.
-  with tf.variable_scope('softmax_linear') as scope:
-    weights = _variable_with_weight_decay('weights', [1024, NUM_CLASSES],
-                                          stddev=1/1024.0, wd=0.0)
-    biases = _variable_on_cpu('biases', [NUM_CLASSES],
-                              tf.constant_initializer(0.0))
-    softmax_linear = tf.add(tf.matmul(local6, weights), biases, name=scope.name)
-    _activation_summary(softmax_linear)
-
-  return softmax_linear
-
-
 def loss(logits, labels):
   """Add L2Loss to all the trainable variables.
 
@@ -392,29 +257,111 @@ def _add_loss_summaries(total_loss):
   return loss_averages_op
 
 
-def train(total_loss, global_step):
-  """Train CARC-19 model.
+OPTIMIZERS = ('sgd', 'momentum', 'adam')
+LR_SCHEDULES = ('step', 'cosine')
 
-  Create an optimizer and apply to all trainable variables. Add moving
-  average for all trainable variables.
+
+def _num_examples_per_epoch_for_train():
+  """Number of lines of label_for_train.dat, or the big34w default."""
+  try:
+    return carc19_input.count_examples(FLAGS.data_dir)
+  except IOError:
+    return NUM_EXAMPLES_PER_EPOCH_FOR_TRAIN
+
+
+def _learning_rate(global_step, num_batches_per_epoch):
+  """Build the learning rate schedule selected by the flags.
 
   Args:
-    total_loss: Total loss from loss().
     global_step: Integer Variable counting the number of training steps
       processed.
+    num_batches_per_epoch: float, training steps in one epoch.
+
   Returns:
-    train_op: op for training.
+    lr: scalar float Tensor.
+
+  Raises:
+    ValueError: on an unknown FLAGS.lr_schedule.
   """
-  # Variables that affect learning rate.
-  num_batches_per_epoch = NUM_EXAMPLES_PER_EPOCH_FOR_TRAIN / FLAGS.batch_size
-  decay_steps = int(num_batches_per_epoch * NUM_EPOCHS_PER_DECAY)
-
-  # Decay the learning rate exponentially based on the number of steps.
-  lr = tf.train.exponential_decay(INITIAL_LEARNING_RATE,
-                                  global_step,
-                                  decay_steps,
-                                  LEARNING_RATE_DECAY_FACTOR,
-                                  staircase=True)
+  decay_steps = max(int(num_batches_per_epoch * FLAGS.num_epochs_per_decay), 1)
+  if FLAGS.lr_schedule == 'step':
+    # Decay the learning rate exponentially based on the number of steps.
+    lr = tf.train.exponential_decay(FLAGS.learning_rate,
+                                    global_step,
+                                    decay_steps,
+                                    LEARNING_RATE_DECAY_FACTOR,
+                                    staircase=True)
+  elif FLAGS.lr_schedule == 'cosine':
+    progress = tf.minimum(tf.cast(global_step, tf.float32) / decay_steps, 1.0)
+    lr = FLAGS.learning_rate * 0.5 * (1.0 + tf.cos(math.pi * progress))
+  else:
+    raise ValueError('Unknown lr_schedule %s, expected one of %s' %
+                     (FLAGS.lr_schedule, LR_SCHEDULES))
+
+  warmup_steps = int(num_batches_per_epoch * FLAGS.warmup_epochs)
+  if warmup_steps > 0:
+    step = tf.cast(global_step, tf.float32)
+    lr = tf.where(step < warmup_steps,
+                  FLAGS.learning_rate * (step + 1.0) / warmup_steps, lr)
+  return lr
+
+
+def _optimizer(lr):
+  """Create the optimizer selected by FLAGS.optimizer.
+
+  Raises:
+    ValueError: on an unknown FLAGS.optimizer.
+  """
+  if FLAGS.optimizer == 'sgd':
+    return tf.train.GradientDescentOptimizer(lr)
+  elif FLAGS.optimizer == 'momentum':
+    return tf.train.MomentumOptimizer(lr, FLAGS.momentum)
+  elif FLAGS.optimizer == 'adam':
+    return tf.train.AdamOptimizer(lr)
+  raise ValueError('Unknown optimizer %s, expected one of %s' %
+                   (FLAGS.optimizer, OPTIMIZERS))
+
+
+def _accumulate_gradients(grads, extra_ops):
+  """Sum gradients of successive micro-batches into non-trainable Variables.
+
+  Args:
+    grads: list of (gradient, variable) pairs from compute_gradients().
+    extra_ops: ops to run with every micro-batch, e.g. batch norm updates.
+
+  Returns:
+    accumulate_op: op adding the gradients of one micro-batch.
+    accumulated_grads: list of (summed gradient, variable) pairs, read after
+      accumulate_op.
+    accumulators: list of the accumulator Variables.
+  """
+  accumulators = []
+  for grad, var in grads:
+    if grad is None:
+      continue
+    with tf.colocate_with(var):
+      accumulators.append((tf.Variable(
+          tf.zeros(var.get_shape(), dtype=var.dtype.base_dtype),
+          trainable=False, name=var.op.name + '/accumulator'), grad, var))
+
+  accumulate_op = tf.group(*([acc.assign_add(grad)
+                              for acc, grad, _ in accumulators] + extra_ops),
+                           name='accumulate')
+  with tf.control_dependencies([accumulate_op]):
+    accumulated_grads = [(acc.read_value(), var)
+                         for acc, _, var in accumulators]
+  return (accumulate_op, accumulated_grads,
+          [acc for acc, _, _ in accumulators])
+
+
+def _train(total_loss, global_step, accum_steps):
+  """Build the training ops, see train() and train_with_accumulation()."""
+  # Variables that affect learning rate. The epoch is the real size of the
+  # training set, so that schedules mean the same on small3k and big34w.
+  # global_step counts updates, each of accum_steps micro-batches.
+  num_batches_per_epoch = (_num_examples_per_epoch_for_train() /
+                           (FLAGS.batch_size * accum_steps))
+  lr = _learning_rate(global_step, num_batches_per_epoch)
   tf.summary.scalar('learning_rate', lr)
 
   # Generate moving averages of all losses and associated summaries.
@@ -422,11 +369,25 @@ def train(total_loss, global_step):
 
   # Compute gradients.
   with tf.control_dependencies([loss_averages_op]):
-    opt = tf.train.GradientDescentOptimizer(lr)
+    opt = _optimizer(lr)
     grads = opt.compute_gradients(total_loss)
 
+  # Update the batch norm moving statistics, if any.
+  update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
+
   # Apply gradients.
-  apply_gradient_op = opt.apply_gradients(grads, global_step=global_step)
+  if accum_steps > 1:
+    # The summed gradient of accum_steps micro-batches is the gradient of the
+    # mean loss over the large batch scaled by accum_steps, so applying it
+    # scales the learning rate linearly with the effective batch size.
+    accumulate_op, accumulated_grads, accumulators = _accumulate_gradients(
+        grads, update_ops)
+    apply_gradient_op = opt.apply_gradients(accumulated_grads,
+                                            global_step=global_step)
+    update_ops = []
+  else:
+    accumulate_op = None
+    apply_gradient_op = opt.apply_gradients(grads, global_step=global_step)
 
   # Add histograms for trainable variables.
   for var in tf.trainable_variables():
@@ -442,10 +403,67 @@ def train(total_loss, global_step):
       MOVING_AVERAGE_DECAY, global_step)
   variables_averages_op = variable_averages.apply(tf.trainable_variables())
 
-  with tf.control_dependencies([apply_gradient_op, variables_averages_op]):
-    train_op = tf.no_op(name='train')
+  with tf.control_dependencies([apply_gradient_op, variables_averages_op] +
+                               update_ops):
+    if accumulate_op is None:
+      train_op = tf.no_op(name='train')
+    else:
+      # Clear the accumulators once the update has read them.
+      train_op = tf.group(*[acc.assign(tf.zeros_like(acc))
+                            for acc in accumulators], name='train')
+
+  return accumulate_op, train_op
+
 
-  return train_op
+def train(total_loss, global_step):
+  """Train CARC-19 model.
+
+  Create an optimizer and apply to all trainable variables. Add moving
+  average for all trainable variables.
+
+  Args:
+    total_loss: Total loss from loss().
+    global_step: Integer Variable counting the number of training steps
+      processed.
+  Returns:
+    train_op: op for training.
+  """
+  with _jit_scope(FLAGS.xla == 'train'):
+    return _train(total_loss, global_step, 1)[1]
+
+
+def train_with_accumulation(total_loss, global_step, accum_steps):
+  """Train CARC-19 model with gradients accumulated over micro-batches.
+
+  Run accumulate_op on accum_steps - 1 micro-batches and then train_op on
+  the last one. train_op adds the last gradients, applies the sum, updates
+  the moving averages, increments global_step once and clears the
+  accumulators.
+
+  Args:
+    total_loss: Total loss from loss() of one micro-batch.
+    global_step: Integer Variable counting the number of updates processed.
+    accum_steps: int > 1, micro-batches per update.
+  Returns:
+    accumulate_op: op adding the gradients of one micro-batch.
+    train_op: op for training.
+  """
+  with _jit_scope(FLAGS.xla == 'train'):
+    return _train(total_loss, global_step, accum_steps)
+
+
+def strip_flag(args, name):
+  """Drop both the --name=value and the --name value forms from args."""
+  stripped = []
+  skip_value = False
+  for arg in args:
+    if skip_value:
+      skip_value = False
+    elif arg == '--' + name:
+      skip_value = True
+    elif not arg.startswith('--%s=' % name):
+      stripped.append(arg)
+  return stripped
 
 
 def maybe_download_and_extract():
@@ -0,0 +1,216 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Content-addressed cache of CARC-19 class probabilities.
+
+Listing photos are re-uploaded a lot, so the probabilities of an image are
+cached under the sha1 of its jpeg bytes and the global step of the
+checkpoint that scored it. A new checkpoint therefore never sees stale
+results.
+
+There are two tiers:
+  memory: an LRU dict of at most --prediction_cache_entries rows.
+  disk:   one .npy file per image under --prediction_cache_dir, shared by
+          all processes using the same directory. When the directory grows
+          over --prediction_cache_mb the least recently used files are
+          deleted.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import hashlib
+import os
+
+import numpy as np
+import tensorflow as tf
+
+FLAGS = tf.app.flags.FLAGS
+
+tf.app.flags.DEFINE_string('prediction_cache_dir', '',
+                           """If set, cache predictions on disk in this """
+                           """directory, keyed by image content and """
+                           """checkpoint step.""")
+tf.app.flags.DEFINE_integer('prediction_cache_entries', 100000,
+                            """Predictions kept in the in-memory LRU.""")
+tf.app.flags.DEFINE_integer('prediction_cache_mb', 1024,
+                            """Size limit of --prediction_cache_dir.""")
+
+# Eviction trims the disk tier to this fraction of its limit, so that it
+# does not run again on the next insert.
+EVICT_TO_FRACTION = 0.8
+
+
+class PredictionCache(object):
+  """Two tier cache of prediction rows keyed by image content."""
+
+  def __init__(self, cache_dir=None, max_entries=100000,
+               max_disk_bytes=1 << 30, model_tag=''):
+    """Open the cache.
+
+    Args:
+      cache_dir: directory of the disk tier, None for memory only.
+      max_entries: size of the in-memory LRU, 0 disables it.
+      max_disk_bytes: size limit of the disk tier.
+      model_tag: string identifying everything besides the checkpoint that
+        changes the predictions, e.g. the stem and the TTA views.
+    """
+    self._cache_dir = cache_dir
+    self._max_entries = max_entries
+    self._max_disk_bytes = max_disk_bytes
+    self._model_tag = model_tag
+    self._memory = collections.OrderedDict()
+    self._disk_bytes = 0
+    self.memory_hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+    if cache_dir:
+      tf.gfile.MakeDirs(cache_dir)
+      self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+  def key(self, jpeg, global_step):
+    """Cache key of an encoded image scored at a checkpoint step."""
+    digest = hashlib.sha1(jpeg).hexdigest()
+    if self._model_tag:
+      digest = hashlib.sha1(
+          (self._model_tag + digest).encode('utf-8')).hexdigest()
+    return '%s-%d' % (digest, global_step)
+
+  def _path(self, key):
+    return os.path.join(self._cache_dir, key[:2], key + '.npy')
+
+  def _disk_files(self):
+    """List (path, size, mtime) of every file of the disk tier."""
+    files = []
+    for root, _, names in os.walk(self._cache_dir):
+      for name in names:
+        path = os.path.join(root, name)
+        try:
+          stat = os.stat(path)
+        except OSError:  # Evicted by another process.
+          continue
+        files.append((path, stat.st_size, stat.st_mtime))
+    return files
+
+  def _remember(self, key, value):
+    if self._max_entries <= 0:
+      return
+    self._memory.pop(key, None)
+    self._memory[key] = value
+    while len(self._memory) > self._max_entries:
+      self._memory.popitem(last=False)
+
+  def get(self, jpeg, global_step):
+    """Look up the prediction of an image.
+
+    Args:
+      jpeg: str, the encoded image.
+      global_step: step of the checkpoint the prediction must come from.
+
+    Returns:
+      The cached numpy row, or None.
+    """
+    key = self.key(jpeg, global_step)
+    value = self._memory.pop(key, None)
+    if value is not None:
+      self._memory[key] = value
+      self.memory_hits += 1
+      return value
+    if self._cache_dir:
+      path = self._path(key)
+      try:
+        value = np.load(path)
+        os.utime(path, None)  # Mark as recently used for the eviction.
+      except (IOError, OSError, ValueError):
+        value = None
+      if value is not None:
+        self._remember(key, value)
+        self.disk_hits += 1
+        return value
+    self.misses += 1
+    return None
+
+  def put(self, jpeg, global_step, value):
+    """Store the prediction of an image in both tiers.
+
+    Args:
+      jpeg: str, the encoded image.
+      global_step: step of the checkpoint that computed value.
+      value: numpy array, the prediction.
+    """
+    key = self.key(jpeg, global_step)
+    self._remember(key, value)
+    if not self._cache_dir:
+      return
+    path = self._path(key)
+    tf.gfile.MakeDirs(os.path.dirname(path))
+    # Write then rename, so concurrent readers never load a partial file.
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as tmp_file:
+      np.save(tmp_file, value)
+    try:
+      # Overwriting an entry replaces its bytes rather than adding to them.
+      self._disk_bytes -= os.path.getsize(path)
+    except OSError:
+      pass
+    os.rename(tmp_path, path)
+    self._disk_bytes += os.path.getsize(path)
+    if self._disk_bytes > self._max_disk_bytes:
+      self._evict()
+
+  def _evict(self):
+    """Delete least recently used files down to EVICT_TO_FRACTION."""
+    files = sorted(self._disk_files(), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in files)
+    target = self._max_disk_bytes * EVICT_TO_FRACTION
+    for path, size, _ in files:
+      if total <= target:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+      total -= size
+    self._disk_bytes = total
+
+  def hit_rate(self):
+    """Fraction of lookups served by either tier."""
+    lookups = self.memory_hits + self.disk_hits + self.misses
+    return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+  def report(self):
+    """One line summary of the hit counters."""
+    return ('prediction cache: %.1f%% hits (memory %d, disk %d, miss %d), '
+            'disk %.1f MB' % (100.0 * self.hit_rate(), self.memory_hits,
+                              self.disk_hits, self.misses,
+                              self._disk_bytes / (1024.0 * 1024.0)))
+
+
+def default_cache():
+  """Build the PredictionCache configured by the command line flags.
+
+  The model tag covers the checkpoint directory and the flags that change
+  the predictions of a checkpoint, so that models sharing a cache directory
+  do not collide.
+  """
+  model_tag = ','.join('%s=%s' % (name, getattr(FLAGS, name)) for name in (
+      'checkpoint_dir', 'stem', 'norm', 'global_pool', 'image_size',
+      'jpeg_decode_ratio', 'raw_mode', 'tta_views', 'dataset_normalization',
+      'model_widths', 'xla', 'use_fp16'))
+  return PredictionCache(cache_dir=FLAGS.prediction_cache_dir or None,
+                         max_entries=FLAGS.prediction_cache_entries,
+                         max_disk_bytes=FLAGS.prediction_cache_mb << 20,
+                         model_tag=model_tag)
@@ -0,0 +1,80 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for the carc19 prediction cache."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import carc19_cache
+
+
+def _cache_files(cache_dir):
+  return [os.path.join(root, name)
+          for root, _, names in os.walk(cache_dir) for name in names]
+
+
+class CARC19CacheTest(tf.test.TestCase):
+
+  def testTiers(self):
+    cache_dir = self.get_temp_dir() + '/tiers'
+    cache = carc19_cache.PredictionCache(cache_dir, max_entries=1)
+    row = np.array([0.25, 0.75], dtype=np.float32)
+    self.assertIsNone(cache.get(b'a', 1))
+    cache.put(b'a', 1, row)
+    cache.put(b'b', 1, row)  # Pushes 'a' out of the memory tier.
+    self.assertAllEqual(row, cache.get(b'a', 1))
+    self.assertIsNone(cache.get(b'a', 2))  # New checkpoint, no hit.
+    self.assertEqual((0, 1, 2), (cache.memory_hits, cache.disk_hits,
+                                 cache.misses))
+    # A second process sharing the directory sees the disk tier.
+    other = carc19_cache.PredictionCache(cache_dir, max_entries=0)
+    self.assertAllEqual(row, other.get(b'b', 1))
+
+  def testEviction(self):
+    cache_dir = self.get_temp_dir() + '/evict'
+    cache = carc19_cache.PredictionCache(cache_dir, max_entries=0,
+                                         max_disk_bytes=1000)
+    dated = set()
+    for i in range(20):
+      cache.put(str(i).encode('utf-8'), 1, np.zeros(16, dtype=np.float32))
+      # Give every file its own mtime, coarse file system clocks would tie
+      # the back-to-back puts and make the eviction order arbitrary.
+      for path in _cache_files(cache_dir):
+        if path not in dated:
+          os.utime(path, (1e9 + i, 1e9 + i))
+          dated.add(path)
+    self.assertLessEqual(sum(os.path.getsize(path)
+                             for path in _cache_files(cache_dir)), 1000)
+    self.assertIsNotNone(cache.get(b'19', 1))
+    self.assertIsNone(cache.get(b'0', 1))
+    self.assertEqual(0.5, cache.hit_rate())
+
+  def testOverwriteKeepsSize(self):
+    cache_dir = self.get_temp_dir() + '/overwrite'
+    cache = carc19_cache.PredictionCache(cache_dir, max_entries=0)
+    for _ in range(3):
+      cache.put(b'a', 1, np.zeros(16, dtype=np.float32))
+    [path] = _cache_files(cache_dir)
+    self.assertEqual(os.path.getsize(path), cache._disk_bytes)
+
+if __name__ == '__main__':
+  tf.test.main()
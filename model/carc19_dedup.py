@@ -0,0 +1,238 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Finds near-duplicate images in the embeddings of carc19_embed.py.
+
+Comparing every image with every other one is quadratic, so the embeddings
+are indexed with random hyperplane LSH: each table hashes an embedding to the
+sign pattern of num_bits random projections of the mean-centered
+embedding, and only pairs that share a
+bucket in at least one table are compared exactly by cosine similarity.
+
+Writes --embed_dir/duplicates.tsv with one line per pair above
+--dedup_threshold:
+
+  similarity  split_a  path_a  split_b  path_b
+
+and prints the pair counts per split combination. 'train/test' pairs are
+leakage between the splits and inflate the test precision.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import carc19_embed
+
+FLAGS = tf.app.flags.FLAGS
+
+tf.app.flags.DEFINE_float('dedup_threshold', 0.95,
+                          """Cosine similarity above which two images """
+                          """are reported as duplicates.""")
+tf.app.flags.DEFINE_integer('lsh_tables', 8,
+                            """Number of LSH hash tables.""")
+tf.app.flags.DEFINE_integer('lsh_bits', 16,
+                            """Random hyperplanes per LSH table.""")
+
+DUPLICATES_FILE = 'duplicates.tsv'
+# Rows (or pairs) handled at a time, bounds the float32 working set.
+CHUNK_ROWS = 4096
+# Buckets larger than this are not compared, a bucket of n rows holds
+# n * (n - 1) / 2 pairs. They are counted and reported, raise --lsh_bits to
+# split them.
+MAX_BUCKET_SIZE = 2000
+
+
+def _unit(rows):
+  """Unit-length float32 copy of an array of embedding rows."""
+  rows = np.asarray(rows, dtype=np.float32)
+  norms = np.linalg.norm(rows, axis=1, keepdims=True)
+  return rows / np.maximum(norms, 1e-12)
+
+
+def _mean(embeddings):
+  """float32 mean row of an array or memmap, chunk by chunk."""
+  total = np.zeros([embeddings.shape[1]], np.float64)
+  for start in range(0, len(embeddings), CHUNK_ROWS):
+    total += np.sum(embeddings[start:start + CHUNK_ROWS], axis=0,
+                    dtype=np.float64)
+  return (total / max(len(embeddings), 1)).astype(np.float32)
+
+
+class LSHIndex(object):
+  """Random hyperplane LSH over the rows of an embedding matrix."""
+
+  def __init__(self, dim, num_tables=8, num_bits=16, seed=0, center=None):
+    """Draw the hyperplanes.
+
+    Args:
+      dim: embedding dimension.
+      num_tables: number of independent hash tables.
+      num_bits: hyperplanes per table, at most 63.
+      seed: seed of the hyperplanes.
+      center: optional [dim] row subtracted before hashing. The embeddings
+        are post-ReLU, all in the positive orthant, and hyperplanes through
+        the origin split them badly unless they are centered on their mean.
+
+    Raises:
+      ValueError: if num_bits does not fit an int64 hash.
+    """
+    if not 0 < num_bits < 64:
+      raise ValueError('num_bits must be in [1, 63], got %d' % num_bits)
+    rng = np.random.RandomState(seed)
+    self._planes = rng.randn(dim, num_tables * num_bits).astype(np.float32)
+    self._num_tables = num_tables
+    self._num_bits = num_bits
+    self._center = (np.zeros([dim], np.float32) if center is None
+                    else np.asarray(center, dtype=np.float32))
+    self._hashes = np.zeros([0, num_tables], np.int64)
+    self.skipped_buckets = 0
+    self.skipped_rows = 0
+
+  def _hash(self, rows):
+    """[len(rows), num_tables] int64 bucket ids of embedding rows."""
+    rows = _unit(np.asarray(rows, dtype=np.float32) - self._center)
+    bits = (rows.dot(self._planes) > 0).reshape(
+        len(rows), self._num_tables, self._num_bits)
+    weights = np.left_shift(np.int64(1), np.arange(self._num_bits,
+                                                   dtype=np.int64))
+    return bits.astype(np.int64).dot(weights)
+
+  def add(self, embeddings):
+    """Index all rows of embeddings, chunk by chunk.
+
+    Args:
+      embeddings: [N, dim] array or memmap.
+    """
+    chunks = [self._hashes]
+    for start in range(0, len(embeddings), CHUNK_ROWS):
+      chunks.append(self._hash(embeddings[start:start + CHUNK_ROWS]))
+    self._hashes = np.concatenate(chunks)
+
+  def candidate_pairs(self):
+    """Yield the row pairs sharing a bucket, one bucket at a time.
+
+    A pair is yielded once, by the first table in which it shares a bucket
+    of at most MAX_BUCKET_SIZE rows. Larger buckets are skipped; their
+    number and the number of rows in any of them are left in
+    skipped_buckets and skipped_rows.
+
+    Yields:
+      [M, 2] int64 arrays of (i, j) row pairs with i < j.
+    """
+    hashes = self._hashes
+    tables = []
+    compared = np.zeros(hashes.shape, np.bool_)
+    skipped = np.zeros([len(hashes)], np.bool_)
+    self.skipped_buckets = 0
+    for t in range(self._num_tables):
+      _, inverse, counts = np.unique(hashes[:, t], return_inverse=True,
+                                     return_counts=True)
+      inverse = inverse.reshape(-1)
+      compared[:, t] = counts[inverse] <= MAX_BUCKET_SIZE
+      skipped |= ~compared[:, t]
+      self.skipped_buckets += int(np.sum(counts > MAX_BUCKET_SIZE))
+      tables.append((inverse, counts))
+    self.skipped_rows = int(np.sum(skipped))
+
+    for t, (inverse, counts) in enumerate(tables):
+      order = np.argsort(inverse, kind='mergesort')  # Stable, rows ascend.
+      starts = np.cumsum(counts) - counts
+      for bucket in np.flatnonzero((counts > 1) &
+                                   (counts <= MAX_BUCKET_SIZE)):
+        rows = order[starts[bucket]:starts[bucket] + counts[bucket]]
+        a, b = np.triu_indices(len(rows), 1)
+        i, j = rows[a], rows[b]
+        seen = np.zeros([len(i)], np.bool_)
+        for s in range(t):
+          seen |= (hashes[i, s] == hashes[j, s]) & compared[i, s]
+        if not seen.all():
+          yield np.stack([i[~seen], j[~seen]], axis=1).astype(np.int64)
+
+
+def find_duplicates(embeddings, threshold, num_tables=8, num_bits=16):
+  """Near-duplicate row pairs of an embedding matrix.
+
+  Args:
+    embeddings: [N, dim] array or memmap.
+    threshold: minimum cosine similarity of a reported pair.
+    num_tables: LSH tables, more tables find more pairs.
+    num_bits: LSH bits per table, more bits mean smaller buckets.
+
+  Returns:
+    duplicates: a list of (similarity, i, j) tuples with i < j, most
+      similar first.
+    skipped: (buckets, rows) not compared because their bucket held more
+      than MAX_BUCKET_SIZE rows, see LSHIndex.candidate_pairs().
+  """
+  index = LSHIndex(embeddings.shape[1], num_tables, num_bits,
+                   center=_mean(embeddings))
+  index.add(embeddings)
+  duplicates = []
+  for pairs in index.candidate_pairs():
+    for start in range(0, len(pairs), CHUNK_ROWS):
+      chunk = pairs[start:start + CHUNK_ROWS]
+      left = _unit(embeddings[chunk[:, 0]])
+      right = _unit(embeddings[chunk[:, 1]])
+      similarity = np.sum(left * right, axis=1)
+      for k in np.nonzero(similarity >= threshold)[0]:
+        duplicates.append((float(similarity[k]), int(chunk[k, 0]),
+                           int(chunk[k, 1])))
+  duplicates.sort(reverse=True)
+  return duplicates, (index.skipped_buckets, index.skipped_rows)
+
+
+def read_keys(filename):
+  """List of (split, path) tuples, one per embedding row."""
+  keys = []
+  with open(filename, 'r') as keys_file:
+    for line in keys_file:
+      split, path = line.rstrip('\n').split('\t')
+      keys.append((split, path))
+  return keys
+
+
+def main(argv=None):  # pylint: disable=unused-argument
+  embeddings = np.load(
+      os.path.join(FLAGS.embed_dir, carc19_embed.EMBEDDINGS_FILE),
+      mmap_mode='r')
+  keys = read_keys(os.path.join(FLAGS.embed_dir, carc19_embed.KEYS_FILE))
+  duplicates, (skipped_buckets, skipped_rows) = find_duplicates(
+      embeddings, FLAGS.dedup_threshold, FLAGS.lsh_tables, FLAGS.lsh_bits)
+
+  counts = collections.Counter()
+  with open(os.path.join(FLAGS.embed_dir, DUPLICATES_FILE), 'w') as out:
+    for similarity, i, j in duplicates:
+      (split_a, path_a), (split_b, path_b) = keys[i], keys[j]
+      counts['/'.join(sorted((split_a, split_b)))] += 1
+      out.write('%.4f\t%s\t%s\t%s\t%s\n' % (similarity, split_a, path_a,
+                                            split_b, path_b))
+  print('%d images, %d pairs with cosine >= %.2f' % (
+      len(keys), len(duplicates), FLAGS.dedup_threshold))
+  for splits in sorted(counts):
+    print('  %-12s %d' % (splits, counts[splits]))
+  if skipped_buckets:
+    print('%d LSH buckets of more than %d rows were not compared, %d images '
+          'are in one of them; raise --lsh_bits to split them' % (
+              skipped_buckets, MAX_BUCKET_SIZE, skipped_rows))
+
+
+if __name__ == '__main__':
+  tf.app.run()
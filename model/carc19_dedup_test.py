@@ -0,0 +1,64 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for carc19 near-duplicate search."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+import carc19_dedup
+
+
+class CARC19DedupTest(tf.test.TestCase):
+
+  def testFindDuplicates(self):
+    rng = np.random.RandomState(1)
+    embeddings = rng.randn(500, 64).astype(np.float16)
+    embeddings[10] = embeddings[3] * np.float16(2)
+    embeddings[400] = embeddings[7]
+    duplicates, skipped = carc19_dedup.find_duplicates(embeddings, 0.95)
+    self.assertEqual([(3, 10), (7, 400)],
+                     sorted((i, j) for _, i, j in duplicates))
+    self.assertEqual((0, 0), skipped)
+
+  def testUncenteredEmbeddings(self):
+    # Post-ReLU embeddings share a large positive component. Without
+    # centering, most rows fall into a few buckets too large to compare.
+    rng = np.random.RandomState(2)
+    embeddings = np.maximum(rng.randn(3000, 64) + 8.0, 0).astype(np.float16)
+    embeddings[2500] = embeddings[11]
+    duplicates, skipped = carc19_dedup.find_duplicates(embeddings, 0.9999)
+    self.assertIn((11, 2500), [(i, j) for _, i, j in duplicates])
+    self.assertEqual((0, 0), skipped)
+
+  def testPairsYieldedOnce(self):
+    embeddings = np.ones([5, 8], np.float32)
+    index = carc19_dedup.LSHIndex(8, num_tables=4, num_bits=4)
+    index.add(embeddings)
+    pairs = np.concatenate(list(index.candidate_pairs()))
+    self.assertEqual(10, len(pairs))
+    self.assertEqual(10, len(set(map(tuple, pairs))))
+
+  def testBadBits(self):
+    with self.assertRaises(ValueError):
+      carc19_dedup.LSHIndex(64, num_bits=64)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,282 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Distills a trained CARC-19 model into a smaller student.
+
+The teacher, built with --model_widths, is restored from the moving
+averages of --checkpoint_dir and runs frozen next to the student on the same training batches. The student,
+built with --student_widths and --student_stem, minimizes
+
+  cross_entropy(labels) + distill_weight * T^2 * cross_entropy(teacher / T)
+
+where T is --distill_temperature. Its checkpoints in --distill_dir use the
+plain variable names, so they can be evaluated or served with
+
+  python carc19_eval.py --checkpoint_dir=<distill_dir> \\
+      --model_widths=<student_widths> --stem=<student_stem>
+
+Usage:
+  python carc19_distill.py                 # train the student
+  python carc19_distill.py --distill_compare
+                                           # precision and images/sec of both
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from datetime import datetime
+import math
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import carc19
+import carc19_input
+# carc19_train defines --max_steps.
+import carc19_train  # pylint: disable=unused-import
+
+FLAGS = tf.app.flags.FLAGS
+
+tf.app.flags.DEFINE_string('distill_dir',
+                           '%s/tmp/carc19_distill' % FLAGS.tf_home,
+                           """Directory of the student checkpoints.""")
+tf.app.flags.DEFINE_string('student_widths', '16,48,96,64,256',
+                           """Widths of conv1, conv2, conv3, conv5 and """
+                           """local6 of the student.""")
+tf.app.flags.DEFINE_string('student_stem', 'strided',
+                           """Stem of the student, see --stem.""")
+tf.app.flags.DEFINE_float('distill_temperature', 4.0,
+                          """Softmax temperature of the soft targets.""")
+tf.app.flags.DEFINE_float('distill_weight', 1.0,
+                          """Weight of the soft target loss against the """
+                          """label loss.""")
+tf.app.flags.DEFINE_boolean('distill_compare', False,
+                            """Instead of training, report precision and """
+                            """images/sec of the teacher and the student on """
+                            """the test set.""")
+
+TEACHER_SCOPE = 'teacher'
+
+
+def _frozen_getter(getter, name, *args, **kwargs):
+  """Create teacher variables outside of training and checkpointing."""
+  kwargs['trainable'] = False
+  kwargs['collections'] = [tf.GraphKeys.LOCAL_VARIABLES]
+  return getter(name, *args, **kwargs)
+
+
+def teacher_inference(images):
+  """Build the frozen teacher under TEACHER_SCOPE.
+
+  Its variables are local and not trainable, so neither the optimizer, the
+  moving averages nor the student Saver see them. Its summaries and weight
+  decay losses are dropped.
+
+  Args:
+    images: Images returned from train_inputs() or evaluate_inputs().
+
+  Returns:
+    Logits of the teacher.
+  """
+  graph = tf.get_default_graph()
+  saved = dict((key, list(graph.get_collection(key)))
+               for key in (tf.GraphKeys.SUMMARIES, 'losses'))
+  with tf.variable_scope(TEACHER_SCOPE, custom_getter=_frozen_getter):
+    logits = carc19.inference(
+        images, widths=carc19.parse_widths(FLAGS.model_widths))
+  for key, values in saved.items():
+    graph.clear_collection(key)
+    for value in values:
+      graph.add_to_collection(key, value)
+  return logits
+
+
+def student_inference(images, is_training=False):
+  """Build the student with the plain variable names."""
+  return carc19.inference(images, is_training=is_training,
+                          widths=carc19.parse_widths(FLAGS.student_widths),
+                          stem=FLAGS.student_stem)
+
+
+def teacher_saver():
+  """Saver restoring the teacher variables from the moving averages.
+
+  Returns:
+    (saver, checkpoint_path).
+
+  Raises:
+    IOError: if there is no teacher checkpoint.
+  """
+  ckpt = tf.train.get_checkpoint_state(FLAGS.checkpoint_dir)
+  if not (ckpt and ckpt.model_checkpoint_path):
+    raise IOError('No teacher checkpoint found in %s' % FLAGS.checkpoint_dir)
+  reader = tf.train.NewCheckpointReader(ckpt.model_checkpoint_path)
+  var_list = {}
+  for var in tf.get_collection(tf.GraphKeys.LOCAL_VARIABLES,
+                               scope=TEACHER_SCOPE + '/'):
+    name = var.op.name[len(TEACHER_SCOPE) + 1:]
+    average_name = name + '/ExponentialMovingAverage'
+    # Batch norm moving statistics are not averaged.
+    var_list[average_name if reader.has_tensor(average_name) else name] = var
+  return tf.train.Saver(var_list), ckpt.model_checkpoint_path
+
+
+def distillation_loss(logits, teacher_logits, labels):
+  """Label loss plus soft target loss of the student.
+
+  The soft target gradients scale as 1/T^2, so the soft loss is multiplied
+  by T^2 to keep its weight independent of the temperature.
+
+  Args:
+    logits: student logits.
+    teacher_logits: teacher logits.
+    labels: int labels.
+
+  Returns:
+    Total loss tensor, including the student weight decay.
+  """
+  temperature = FLAGS.distill_temperature
+  soft_targets = tf.stop_gradient(tf.nn.softmax(teacher_logits / temperature))
+  soft_loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(
+      labels=soft_targets, logits=logits / temperature), name='soft_loss')
+  tf.add_to_collection('losses', tf.multiply(
+      FLAGS.distill_weight * temperature * temperature, soft_loss,
+      name='weighted_soft_loss'))
+  return carc19.loss(logits, labels)
+
+
+class _RestoreTeacherHook(tf.train.SessionRunHook):
+  """Loads the teacher weights once the session is created."""
+
+  def __init__(self, saver, path):
+    self._saver = saver
+    self._path = path
+
+  def after_create_session(self, session, coord):
+    self._saver.restore(session, self._path)
+
+
+def train():
+  """Train the student against the teacher for FLAGS.max_steps."""
+  with tf.Graph().as_default():
+    global_step = tf.contrib.framework.get_or_create_global_step()
+    images, labels = carc19.train_inputs()
+
+    teacher_logits = teacher_inference(images)
+    logits = student_inference(images, is_training=True)
+    loss = distillation_loss(logits, teacher_logits, labels)
+    train_op = carc19.train(loss, global_step)
+    saver, teacher_path = teacher_saver()
+
+    agreement = tf.reduce_mean(tf.cast(tf.equal(
+        tf.argmax(logits, 1), tf.argmax(teacher_logits, 1)), tf.float32))
+
+    class _LoggerHook(tf.train.SessionRunHook):
+      """Logs loss, agreement with the teacher and runtime."""
+
+      def begin(self):
+        self._step = -1
+        self._start_time = time.time()
+
+      def before_run(self, run_context):
+        self._step += 1
+        return tf.train.SessionRunArgs([loss, agreement])
+
+      def after_run(self, run_context, run_values):
+        if self._step % FLAGS.log_frequency == 0:
+          current_time = time.time()
+          duration = current_time - self._start_time
+          self._start_time = current_time
+          loss_value, agreement_value = run_values.results
+          print ('%s: step %d, loss = %.2f, teacher agreement = %.3f '
+                 '(%.1f examples/sec)' % (
+                     datetime.now(), self._step, loss_value, agreement_value,
+                     FLAGS.log_frequency * FLAGS.batch_size / duration))
+
+    config = tf.ConfigProto(log_device_placement=False)
+    config.gpu_options.allow_growth = True
+    with tf.train.MonitoredTrainingSession(
+        checkpoint_dir=FLAGS.distill_dir,
+        hooks=[tf.train.StopAtStepHook(last_step=FLAGS.max_steps),
+               tf.train.NanTensorHook(loss),
+               _RestoreTeacherHook(saver, teacher_path),
+               _LoggerHook()],
+        config=config) as mon_sess:
+      while not mon_sess.should_stop():
+        mon_sess.run(train_op)
+
+
+def compare():
+  """Print precision and images/sec of the teacher and the student.
+
+  Both models score the same test batches; each batch is fed to one model
+  at a time so that the timings do not include the input pipeline.
+  """
+  with tf.Graph().as_default():
+    images, labels, _ = carc19.evaluate_inputs(eval_data=True)
+    models = [('teacher', teacher_inference(images)),
+              ('student', student_inference(images))]
+    top_k_ops = [tf.nn.in_top_k(logits, labels, 1) for _, logits in models]
+
+    teacher_restorer, teacher_path = teacher_saver()
+    variable_averages = tf.train.ExponentialMovingAverage(
+        carc19.MOVING_AVERAGE_DECAY)
+    student_restorer = tf.train.Saver(variable_averages.variables_to_restore())
+    ckpt = tf.train.get_checkpoint_state(FLAGS.distill_dir)
+    if not (ckpt and ckpt.model_checkpoint_path):
+      print('No student checkpoint found in %s' % FLAGS.distill_dir)
+      return
+
+    with tf.Session() as sess:
+      teacher_restorer.restore(sess, teacher_path)
+      student_restorer.restore(sess, ckpt.model_checkpoint_path)
+      coord = tf.train.Coordinator()
+      threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+
+      num_examples = carc19_input.count_examples(FLAGS.data_dir,
+                                                 'label_for_test.dat')
+      num_iter = int(math.ceil(num_examples / FLAGS.batch_size))
+      true_counts = [0] * len(models)
+      durations = [0.0] * len(models)
+      for _ in range(num_iter):
+        batch = sess.run([images, labels])
+        feed = {images: batch[0], labels: batch[1]}
+        for i, top_k_op in enumerate(top_k_ops):
+          start_time = time.time()
+          true_counts[i] += np.sum(sess.run(top_k_op, feed))
+          durations[i] += time.time() - start_time
+
+      coord.request_stop()
+      coord.join(threads, stop_grace_period_secs=10)
+
+    total = num_iter * FLAGS.batch_size
+    print('%-8s | %8s | %10s' % ('model', 'prec@1', 'images/sec'))
+    for (name, _), true_count, duration in zip(models, true_counts,
+                                               durations):
+      print('%-8s | %8.3f | %10.1f' % (name, true_count / total,
+                                       total / duration))
+
+
+def main(argv=None):  # pylint: disable=unused-argument
+  if FLAGS.distill_compare:
+    compare()
+  else:
+    tf.gfile.MakeDirs(FLAGS.distill_dir)
+    train()
+
+
+if __name__ == '__main__':
+  tf.app.run()
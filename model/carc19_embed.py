@@ -0,0 +1,139 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Extracts the local6 embedding of every CARC-19 image.
+
+Streams label_for_train.dat and label_for_test.dat through the model in
+batches and writes, into --embed_dir:
+
+  embeddings.f16.npy  a [num_images, local6 width] float16 matrix, written
+                      and read as a memory map (np.load(..., mmap_mode='r')).
+  embeddings.keys     one 'split<TAB>path' line per matrix row.
+
+carc19_dedup.py then searches the matrix for near duplicates.
+
+Usage:
+  python carc19_embed.py --checkpoint_dir=... --embed_dir=...
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from datetime import datetime
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import carc19
+import carc19_input
+
+FLAGS = tf.app.flags.FLAGS
+
+tf.app.flags.DEFINE_string('embed_dir', '%s/tmp/carc19_embed' % FLAGS.tf_home,
+                           """Directory where to write the embeddings.""")
+
+SPLITS = (('train', 'label_for_train.dat'), ('test', 'label_for_test.dat'))
+EMBEDDINGS_FILE = 'embeddings.f16.npy'
+KEYS_FILE = 'embeddings.keys'
+
+
+def _split_batch(filenames):
+  """Read every file of a split once, in batches of preprocessed images.
+
+  Args:
+    filenames: list of image paths.
+
+  Returns:
+    images: 4-D float32 Tensor of [<= batch_size, size, size, 3].
+    keys: 1-D string Tensor of the image paths.
+  """
+  filename_queue = tf.train.string_input_producer(filenames, num_epochs=1,
+                                                  shuffle=False)
+  reader = tf.WholeFileReader()
+  key, value = reader.read(filename_queue)
+  image = carc19_input.preprocess_jpeg(
+      value, decode_ratio=FLAGS.jpeg_decode_ratio,
+      raw_mode=FLAGS.raw_mode or None, image_size=FLAGS.image_size,
+      dataset_stats=carc19.dataset_stats())
+  return tf.train.batch([image, key], batch_size=FLAGS.batch_size,
+                        num_threads=16, capacity=4 * FLAGS.batch_size,
+                        allow_smaller_final_batch=True)
+
+
+def extract():
+  """Write the embeddings and keys of all splits to FLAGS.embed_dir."""
+  splits = [(name, carc19_input.label_filenames(FLAGS.data_dir, label_file))
+            for name, label_file in SPLITS]
+  num_images = sum(len(filenames) for _, filenames in splits)
+
+  with tf.Graph().as_default():
+    batches = []
+    for name, filenames in splits:
+      with tf.name_scope(name):
+        batches.append(_split_batch(filenames))
+
+    embeddings = []
+    for i, (images, _) in enumerate(batches):
+      with tf.variable_scope(tf.get_variable_scope(), reuse=i > 0):
+        carc19.inference(images)
+      embeddings.append(tf.cast(tf.get_collection('embeddings')[-1],
+                                tf.float16))
+
+    variable_averages = tf.train.ExponentialMovingAverage(
+        carc19.MOVING_AVERAGE_DECAY)
+    saver = tf.train.Saver(variable_averages.variables_to_restore())
+
+    matrix = np.lib.format.open_memmap(
+        os.path.join(FLAGS.embed_dir, EMBEDDINGS_FILE), mode='w+',
+        dtype=np.float16,
+        shape=(num_images, carc19.parse_widths(FLAGS.model_widths)[-1]))
+    row = 0
+    with tf.Session() as sess, open(
+        os.path.join(FLAGS.embed_dir, KEYS_FILE), 'w') as keys_file:
+      ckpt = tf.train.get_checkpoint_state(FLAGS.checkpoint_dir)
+      if not (ckpt and ckpt.model_checkpoint_path):
+        print('No checkpoint file found')
+        return
+      saver.restore(sess, ckpt.model_checkpoint_path)
+      sess.run(tf.local_variables_initializer())
+      coord = tf.train.Coordinator()
+      threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+
+      # The splits are read one after the other; a split is done when its
+      # producer raises OutOfRangeError.
+      for (name, _), (_, keys), embedding in zip(splits, batches, embeddings):
+        try:
+          while True:
+            values, paths = sess.run([embedding, keys])
+            matrix[row:row + len(values)] = values
+            for path in paths:
+              keys_file.write('%s\t%s\n' % (name, tf.compat.as_text(path)))
+            row += len(values)
+        except tf.errors.OutOfRangeError:
+          print('%s: %s done, %d images' % (datetime.now(), name, row))
+
+      coord.request_stop()
+      coord.join(threads)
+    matrix.flush()
+
+
+def main(argv=None):  # pylint: disable=unused-argument
+  tf.gfile.MakeDirs(FLAGS.embed_dir)
+  extract()
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -36,13 +36,21 @@ from __future__ import division
 from __future__ import print_function
 
 from datetime import datetime
+import functools
 import math
+import os
+import subprocess
+import sys
 import time
 
 import numpy as np
 import tensorflow as tf
 
 import carc19
+import carc19_cache
+import carc19_input
+import carc19_metrics
+import carc19_predict
 from carc19_class import CARC19_CLASS
 
 FLAGS = tf.app.flags.FLAGS
@@ -51,41 +59,97 @@ tf.app.flags.DEFINE_string('eval_dir', '%s/tmp/carc19_eval' % FLAGS.tf_home,
                            """Directory where to write event logs.""")
 tf.app.flags.DEFINE_string('eval_data', 'test',
                            """Either 'test' or 'train_eval'.""")
-tf.app.flags.DEFINE_string('checkpoint_dir', '%s/tmp/carc19_train' % FLAGS.tf_home,
-                           """Directory where to read model checkpoints.""")
 tf.app.flags.DEFINE_integer('eval_interval_secs', 60 * 1,
                             """How often to run the eval.""")
 tf.app.flags.DEFINE_integer('num_examples', 40000,
                             """Number of examples to run.""")
 tf.app.flags.DEFINE_boolean('run_once', True,
                          """Whether to run eval only once.""")
+tf.app.flags.DEFINE_integer('train_eval_examples', 0,
+                            """If set with eval_data='test', also score a """
+                            """fixed random subset of this many training """
+                            """examples in the same session and report the """
+                            """train/test gap.""")
+tf.app.flags.DEFINE_boolean('analyze', False,
+                            """Instead of precision, write the misclassified """
+                            """and low-margin examples to a manifest that """
+                            """carc19_train.py can oversample.""")
+tf.app.flags.DEFINE_string('analyze_data', 'train',
+                           """Split mined by --analyze: 'train', whose """
+                           """hard examples training can oversample, or """
+                           """'test' for error analysis only; training """
+                           """ignores test keys.""")
+tf.app.flags.DEFINE_float('hard_example_margin', 0.2,
+                          """Examples whose target probability exceeds """
+                          """every other class by less than this are """
+                          """hard. Errors have a negative margin.""")
+tf.app.flags.DEFINE_string('eval_image_sizes', '',
+                           """Comma separated input sizes, e.g. """
+                           """'128,160,256'. If set, evaluate once at each """
+                           """size and print precision against throughput. """
+                           """A '{size}' in checkpoint_dir is replaced by """
+                           """the size, for models trained per """
+                           """resolution.""")
+tf.app.flags.DEFINE_integer('eval_shards', 0,
+                            """If set, split the eval label file into this """
+                            """many shards, score them in parallel worker """
+                            """processes and merge the results.""")
+tf.app.flags.DEFINE_integer('eval_shard_index', -1,
+                            """Shard scored by this process, set by """
+                            """evaluate_sharded() for its workers.""")
+tf.app.flags.DEFINE_string('eval_shard_gpus', '',
+                           """Comma separated GPU ids handed to the shard """
+                           """workers in turn. Empty runs the workers on """
+                           """the CPU only.""")
+
+
+def _find_hard_examples(targets, logits, max_margin):
+  """Find misclassified and low-margin examples of a batch with NumPy.
 
+  Args:
+    targets: int array of [batch_size] labels.
+    logits: float array of [batch_size, NUM_CLASSES].
+    max_margin: examples whose margin is below this value are hard.
+
+  Returns:
+    predictions: int array of [batch_size] predicted classes.
+    margins: float array of [batch_size], the softmax probability of the
+      target minus the highest probability of any other class. It is
+      negative exactly for the misclassified examples.
+    hard: bool array of [batch_size].
+  """
+  exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+  probabilities = exp / exp.sum(axis=1, keepdims=True)
+  rows = np.arange(len(targets))
+  target_probabilities = probabilities[rows, targets]
+  probabilities[rows, targets] = -1.0
+  margins = target_probabilities - probabilities.max(axis=1)
+  predictions = np.where(margins < 0, probabilities.argmax(axis=1), targets)
+  return predictions, margins, margins < max_margin
 
-def analyze_once(saver, summary_writer, top_k_op, summary_op, keys, labels, logits):
-  """Evaluate and analyze.
+
+def analyze_once(saver, keys, labels, logits):
+  """Find the hard examples of the data set and write them to a manifest.
 
   Args:
     saver: Saver.
-    summary_writer: Summary writer.
-    top_k_op: Top K op.
-    summary_op: Summary op.
+    keys: Keys op.
+    labels: Labels op.
+    logits: Logits op.
   """
-  import sys
-  reload(sys)
-  sys.setdefaultencoding('utf-8')
   with tf.Session() as sess:
     ckpt = tf.train.get_checkpoint_state(FLAGS.checkpoint_dir)
     if ckpt and ckpt.model_checkpoint_path:
       # Restores from checkpoint
       saver.restore(sess, ckpt.model_checkpoint_path)
-      # Assuming model_checkpoint_path looks something like:
-      #   /my-favorite-path/carc19_train/model.ckpt-0,
-      # extract global_step from it.
-      global_step = ckpt.model_checkpoint_path.split('/')[-1].split('-')[-1]
     else:
       print('No checkpoint file found')
       return
 
+    # The input makes one pass over the split, its epoch counter is a
+    # local variable.
+    sess.run(tf.local_variables_initializer())
+
     # Start the queue runners.
     coord = tf.train.Coordinator()
     try:
@@ -94,26 +158,35 @@ def analyze_once(saver, summary_writer, top_k_op, summary_op, keys, labels, logi
         threads.extend(qr.create_threads(sess, coord=coord, daemon=True,
                                          start=True))
 
-      num_iter = int(math.ceil(FLAGS.num_examples / FLAGS.batch_size))
-      step = 0
+      num_examples = 0
       error_count = 0
-      while step < num_iter and not coord.should_stop():
-        (values,indexs), targets, inputs, probabilities = sess.run([top_k_op,
-							  labels, keys, logits])
-        for idx in range(FLAGS.batch_size):
-          if targets[idx] != indexs[idx]:
-            error_count = error_count + 1
-            print ("====== %d ======" % idx)
-            pre_class = int(indexs[idx])
-            tar_class = int(targets[idx])
-            print (u"prediction: %d(%.3lf:%s)  target: %d(%.3lf:%s) file: %s" % (
-                   pre_class, probabilities[idx][pre_class], CARC19_CLASS[pre_class],
-                   tar_class, probabilities[idx][tar_class], CARC19_CLASS[tar_class],
-                   inputs[idx]))
-            print ("probabilities: %s" % (probabilities[idx]))
-        step += 1
-      print ("total error case: %d - total case: %d" % (error_count, 
-      							FLAGS.num_examples))
+      manifest = []
+      confusion = np.zeros([carc19.NUM_CLASSES, carc19.NUM_CLASSES], np.int64)
+      while not coord.should_stop():
+        try:
+          inputs, targets, batch_logits = sess.run([keys, labels, logits])
+        except tf.errors.OutOfRangeError:
+          break
+        predictions, margins, hard = _find_hard_examples(
+            targets, batch_logits, FLAGS.hard_example_margin)
+        num_examples += len(targets)
+        error_count += np.sum(margins < 0)
+        np.add.at(confusion, (targets, predictions), 1)
+        for idx in np.flatnonzero(hard):
+          manifest.append((tf.compat.as_text(inputs[idx]), int(targets[idx]),
+                           int(predictions[idx]), float(margins[idx])))
+
+      manifest_path = (FLAGS.hard_examples_file or
+                       os.path.join(FLAGS.eval_dir, 'hard_examples.tsv'))
+      carc19_input.write_hard_examples(manifest_path, manifest)
+      print ("total error case: %d - hard case: %d - total case: %d" % (
+          error_count, len(manifest), num_examples))
+      print ("hard examples written to %s" % manifest_path)
+      for target, prediction in zip(*np.nonzero(confusion)):
+        if target != prediction:
+          print (u"%6d  target: %d(%s)  prediction: %d(%s)" % (
+              confusion[target, prediction], target, CARC19_CLASS[target],
+              prediction, CARC19_CLASS[prediction]))
 
     except Exception as e:  # pylint: disable=broad-except
       coord.request_stop(e)
@@ -122,7 +195,8 @@ def analyze_once(saver, summary_writer, top_k_op, summary_op, keys, labels, logi
     coord.join(threads, stop_grace_period_secs=10)
 
 
-def eval_once(saver, summary_writer, top_k_op, summary_op):
+def eval_once(saver, summary_writer, top_k_op, summary_op,
+              checkpoint_dir=None, train_top_k_op=None, metrics=None):
   """Run Eval once.
 
   Args:
@@ -130,9 +204,19 @@ def eval_once(saver, summary_writer, top_k_op, summary_op):
     summary_writer: Summary writer.
     top_k_op: Top K op.
     summary_op: Summary op.
+    checkpoint_dir: Directory to restore from, defaults to
+      FLAGS.checkpoint_dir.
+    train_top_k_op: optional Top K op over the training subset, run for
+      FLAGS.train_eval_examples after the test set.
+    metrics: optional carc19_metrics.Metrics recording the results.
+
+  Returns:
+    (precision, examples_per_sec), or None if there is no checkpoint or
+    the evaluation failed.
   """
   with tf.Session() as sess:
-    ckpt = tf.train.get_checkpoint_state(FLAGS.checkpoint_dir)
+    ckpt = tf.train.get_checkpoint_state(checkpoint_dir or
+                                         FLAGS.checkpoint_dir)
     if ckpt and ckpt.model_checkpoint_path:
       # Restores from checkpoint
       saver.restore(sess, ckpt.model_checkpoint_path)
@@ -144,53 +228,120 @@ def eval_once(saver, summary_writer, top_k_op, summary_op):
       print('No checkpoint file found')
       return
 
+    # The test input makes one pass, its epoch counter is a local variable.
+    sess.run(tf.local_variables_initializer())
+
     # Start the queue runners.
     coord = tf.train.Coordinator()
+    result = None
     try:
       threads = []
       for qr in tf.get_collection(tf.GraphKeys.QUEUE_RUNNERS):
         threads.extend(qr.create_threads(sess, coord=coord, daemon=True,
                                          start=True))
 
-      num_iter = int(math.ceil(FLAGS.num_examples / FLAGS.batch_size))
       true_count = 0  # Counts the number of correct predictions.
-      total_sample_count = num_iter * FLAGS.batch_size
-      step = 0
-      while step < num_iter and not coord.should_stop():
-        predictions = sess.run([top_k_op])
+      total_sample_count = 0
+      summary_str = None
+      start_time = time.time()
+      while not coord.should_stop():
+        try:
+          # The summaries read the input too, fetch them with the first
+          # batch rather than after the input has ended.
+          if summary_str is None:
+            predictions, summary_str = sess.run([top_k_op, summary_op])
+          else:
+            predictions = sess.run(top_k_op)
+        except tf.errors.OutOfRangeError:
+          break
         true_count += np.sum(predictions)
-        step += 1
+        total_sample_count += len(predictions)
+      examples_per_sec = total_sample_count / (time.time() - start_time)
 
       # Compute precision @ 1.
-      precision = true_count / total_sample_count
+      precision = true_count / max(total_sample_count, 1)
       print('%s: precision @ 1 = %.3f' % (datetime.now(), precision))
+      if FLAGS.tta_views > 1:
+        print('%s: %d views, %.1f examples/sec, %.1f views/sec' % (
+            datetime.now(), FLAGS.tta_views, examples_per_sec,
+            examples_per_sec * FLAGS.tta_views))
 
       summary = tf.Summary()
-      summary.ParseFromString(sess.run(summary_op))
+      summary.ParseFromString(summary_str)
       summary.value.add(tag='Precision @ 1', simple_value=precision)
+      if metrics:
+        metrics.record(int(global_step), {
+            'eval_precision': precision,
+            'eval_examples_per_sec': examples_per_sec})
+
+      if train_top_k_op is not None:
+        num_iter = int(math.ceil(FLAGS.train_eval_examples / FLAGS.batch_size))
+        train_true_count = 0
+        for _ in range(num_iter):
+          train_true_count += np.sum(sess.run(train_top_k_op))
+        train_precision = train_true_count / (num_iter * FLAGS.batch_size)
+        print('%s: train precision @ 1 = %.3f, train/test gap = %.3f' % (
+            datetime.now(), train_precision, train_precision - precision))
+        summary.value.add(tag='Train precision @ 1',
+                          simple_value=train_precision)
+        summary.value.add(tag='Train-test gap',
+                          simple_value=train_precision - precision)
+        if metrics:
+          metrics.record(int(global_step),
+                         {'eval_train_precision': train_precision})
       summary_writer.add_summary(summary, global_step)
+      result = precision, examples_per_sec
     except Exception as e:  # pylint: disable=broad-except
       coord.request_stop(e)
 
     coord.request_stop()
     coord.join(threads, stop_grace_period_secs=10)
+    return result
+
 
+def evaluate(image_size=None, checkpoint_dir=None):
+  """Eval CARC-19 for a number of steps.
 
-def evaluate():
-  """Eval CARC-19 for a number of steps."""
+  Args:
+    image_size: side of the input images, defaults to FLAGS.image_size.
+    checkpoint_dir: Directory to restore from, defaults to
+      FLAGS.checkpoint_dir.
+
+  Returns:
+    (precision, examples_per_sec) of the last evaluation, None if it
+    failed.
+  """
   with tf.Graph().as_default() as g:
     # Get images and labels for CARC-19.
     eval_data = FLAGS.eval_data == 'test'
-    images, labels, keys = carc19.evaluate_inputs(eval_data=eval_data)
+    # One ordered pass over the first num_examples examples, the same ones
+    # evaluate_sharded() and evaluate_cached() score.
+    images, labels, keys = carc19.evaluate_inputs(
+        eval_data=eval_data, image_size=image_size,
+        max_examples=FLAGS.num_examples, num_epochs=1)
 
     # Build a Graph that computes the logits predictions from the
     # inference model.
-    logits = carc19.inference(images)
+    logits = carc19.inference_tta(images, FLAGS.tta_views)
 
     # Calculate predictions.
     top_k_op = tf.nn.in_top_k(logits, labels, 1)
 
+    # Score a fixed sample of the training set with the same weights, to
+    # measure overfitting without a second 'train_eval' run.
+    train_top_k_op = None
+    if eval_data and FLAGS.train_eval_examples > 0:
+      with tf.name_scope('train_eval'), carc19.no_summaries():
+        train_images, train_labels, _ = carc19.evaluate_inputs(
+            eval_data=False, image_size=image_size,
+            max_examples=FLAGS.train_eval_examples, sample_seed=0)
+        with tf.variable_scope(tf.get_variable_scope(), reuse=True):
+          train_logits = carc19.inference(train_images)
+        train_top_k_op = tf.nn.in_top_k(train_logits, train_labels, 1)
+
     # Restore the moving average version of the learned variables for eval.
+    # Non-trainable variables, like the batch norm moving statistics, are
+    # restored as they were saved.
     variable_averages = tf.train.ExponentialMovingAverage(
         carc19.MOVING_AVERAGE_DECAY)
     variables_to_restore = variable_averages.variables_to_restore()
@@ -201,26 +352,53 @@ def evaluate():
 
     summary_writer = tf.summary.FileWriter(FLAGS.eval_dir, g)
 
+    metrics = carc19_metrics.from_flags('eval')
     while True:
-      eval_once(saver, summary_writer, top_k_op, summary_op)
+      result = eval_once(saver, summary_writer, top_k_op, summary_op,
+                         checkpoint_dir=checkpoint_dir,
+                         train_top_k_op=train_top_k_op, metrics=metrics)
       if FLAGS.run_once:
         break
       time.sleep(FLAGS.eval_interval_secs)
+    metrics.close()
+    return result
+
+
+def resolution_report():
+  """Evaluate at every size of FLAGS.eval_image_sizes and print a table.
+
+  A single checkpoint can only be evaluated at several sizes if it was
+  trained with --global_pool. Otherwise put a '{size}' in --checkpoint_dir
+  to evaluate one model trained per size.
+  """
+  sizes = [int(size) for size in FLAGS.eval_image_sizes.split(',')]
+  rows = []
+  for size in sizes:
+    checkpoint_dir = FLAGS.checkpoint_dir.replace('{size}', str(size))
+    result = evaluate(image_size=size, checkpoint_dir=checkpoint_dir)
+    if result is not None:
+      rows.append((size, result[0], result[1]))
+
+  print('%6s | %8s | %14s | %12s' % ('size', 'prec@1', 'examples/sec',
+                                      'rel. pixels'))
+  for size, precision, examples_per_sec in rows:
+    print('%6d | %8.3f | %14.1f | %12.2f' % (
+        size, precision, examples_per_sec,
+        float(size * size) / (carc19.IMAGE_SIZE * carc19.IMAGE_SIZE)))
 
 def analyze():
-  """Eval CARC-19 for a number of steps."""
-  with tf.Graph().as_default() as g:
-    # Get images and labels for CARC-19.
-    eval_data = FLAGS.eval_data == 'test'
-    images, labels, keys = carc19.evaluate_inputs(eval_data=eval_data)
+  """Write the hard examples of CARC-19 to a manifest."""
+  with tf.Graph().as_default():
+    # Get images and labels for CARC-19. The training split by default: the
+    # manifest feeds --hard_examples_file, which only replays training keys.
+    # Every example is scored exactly once.
+    eval_data = FLAGS.analyze_data == 'test'
+    images, labels, keys = carc19.evaluate_inputs(eval_data=eval_data,
+                                                  num_epochs=1)
 
     # Build a Graph that computes the logits predictions from the
     # inference model.
-    logits = carc19.inference(images)
-
-    # Calculate predictions.
-    # top_k_op = tf.nn.in_top_k(logits, labels, 1)
-    top_k_op = tf.nn.top_k(logits, k=1)
+    logits = carc19.inference_tta(images, FLAGS.tta_views)
 
     # Restore the moving average version of the learned variables for eval.
     variable_averages = tf.train.ExponentialMovingAverage(
@@ -228,20 +406,259 @@ def analyze():
     variables_to_restore = variable_averages.variables_to_restore()
     saver = tf.train.Saver(variables_to_restore)
 
-    # Build the summary operation based on the TF collection of Summaries.
-    summary_op = tf.summary.merge_all()
+    analyze_once(saver, keys, labels, logits)
 
-    summary_writer = tf.summary.FileWriter(FLAGS.eval_dir, g)
+def _eval_filenames():
+  """The image paths evaluated by --eval_data and --num_examples."""
+  label_file = ('label_for_test.dat' if FLAGS.eval_data == 'test'
+                else 'label_for_train.dat')
+  return carc19_input.label_filenames(
+      FLAGS.data_dir, label_file)[:FLAGS.num_examples]
+
+
+def _targets(filenames):
+  # Paths are .../image/${label}/xx/o_xxx.jpg, as in class_index().
+  return np.array([int(filename.split('/')[-3]) for filename in filenames],
+                  dtype=np.int64)
+
+
+def evaluate_cached():
+  """Eval CARC-19 once through the prediction cache.
+
+  The images are read in Python and scored by carc19_predict.Predictor, so
+  test images already scored by this checkpoint, e.g. re-uploaded
+  duplicates or a previous run, skip the forward pass.
+
+  Returns:
+    (precision, examples_per_sec) or None if there is no checkpoint.
+  """
+  filenames = _eval_filenames()
+  cache = carc19_cache.default_cache()
+  try:
+    predictor = carc19_predict.Predictor(cache=cache)
+  except IOError as e:
+    print(e)
+    return
+
+  true_count = 0
+  start_time = time.time()
+  for start in range(0, len(filenames), FLAGS.batch_size):
+    batch = filenames[start:start + FLAGS.batch_size]
+    jpegs = [tf.gfile.GFile(filename, 'rb').read() for filename in batch]
+    predictions = predictor.predict(jpegs).argmax(axis=1)
+    true_count += np.sum(predictions == _targets(batch))
+  examples_per_sec = len(filenames) / (time.time() - start_time)
+
+  precision = true_count / len(filenames)
+  print('%s: precision @ 1 = %.3f' % (datetime.now(), precision))
+  print('%s: %.1f examples/sec, %s' % (datetime.now(), examples_per_sec,
+                                       cache.report()))
+  metrics = carc19_metrics.from_flags('eval')
+  metrics.record(predictor.global_step, {
+      'eval_precision': precision,
+      'eval_examples_per_sec': examples_per_sec})
+  metrics.close()
+  return precision, examples_per_sec
+
+
+def shard_path(eval_dir, shard_index, num_shards):
+  """Path of the scores written by one shard worker."""
+  return os.path.join(eval_dir, 'shard-%05d-of-%05d.npz' % (shard_index,
+                                                          num_shards))
+
+
+def eval_shard(shard_index, num_shards):
+  """Score one shard of the eval examples and save the probabilities.
+
+  The shard holds every num_shards-th example starting at shard_index, as
+  in carc19_input.train_inputs(). Its indices into the eval examples, class
+  probabilities and checkpoint step are saved to shard_path().
+
+  Args:
+    shard_index: shard scored by this process.
+    num_shards: number of shards.
+
+  Raises:
+    IOError: if there is no checkpoint.
+  """
+  filenames = _eval_filenames()
+  indices = np.arange(shard_index, len(filenames), num_shards)
+  predictor = carc19_predict.Predictor()
+  probabilities = np.zeros([len(indices), carc19.NUM_CLASSES], np.float32)
+  for start in range(0, len(indices), FLAGS.batch_size):
+    batch = indices[start:start + FLAGS.batch_size]
+    jpegs = [tf.gfile.GFile(filenames[i], 'rb').read() for i in batch]
+    probabilities[start:start + len(batch)] = predictor.predict(jpegs)
+  np.savez(shard_path(FLAGS.eval_dir, shard_index, num_shards),
+           indices=indices, probabilities=probabilities,
+           global_step=predictor.global_step)
+
+
+def merge_shards(eval_dir, num_examples, num_shards):
+  """Gather the shard outputs in eval example order.
+
+  Args:
+    eval_dir: directory holding the shard_path() files.
+    num_examples: number of eval examples split across the shards.
+    num_shards: number of shards.
+
+  Returns:
+    global_step: int, step of the checkpoint that scored the shards.
+    probabilities: float32 array of [num_examples, NUM_CLASSES].
+
+  Raises:
+    ValueError: if an example is missing or the shards were scored by
+      different checkpoints, e.g. because training saved one meanwhile.
+  """
+  probabilities = np.zeros([num_examples, carc19.NUM_CLASSES], np.float32)
+  scored = np.zeros([num_examples], np.bool_)
+  steps = set()
+  for shard_index in range(num_shards):
+    with np.load(shard_path(eval_dir, shard_index, num_shards)) as shard:
+      probabilities[shard['indices']] = shard['probabilities']
+      scored[shard['indices']] = True
+      steps.add(int(shard['global_step']))
+  if not scored.all():
+    raise ValueError('%d examples missing from the shards' %
+                     np.sum(~scored))
+  if len(steps) > 1:
+    raise ValueError('Shards scored by different checkpoints, steps %s' %
+                     sorted(steps))
+  return steps.pop(), probabilities
+
+
+def write_results(eval_dir, filenames, probabilities):
+  """Write the per-example predictions and the confusion matrix.
+
+  eval_dir/predictions.tsv holds one line per example: path, target,
+  prediction and the probability of the prediction. eval_dir/confusion.tsv
+  holds the non-zero cells of the confusion matrix: count, target and
+  prediction.
+
+  Args:
+    eval_dir: output directory.
+    filenames: list of the image paths, in label file order.
+    probabilities: float array of [len(filenames), NUM_CLASSES].
+
+  Returns:
+    precision: float, precision @ 1.
+    confusion: int64 array of [NUM_CLASSES, NUM_CLASSES] counts, indexed by
+      target and prediction.
+  """
+  targets = _targets(filenames)
+  predictions = probabilities.argmax(axis=1)
+  confusion = np.zeros([carc19.NUM_CLASSES, carc19.NUM_CLASSES], np.int64)
+  np.add.at(confusion, (targets, predictions), 1)
+
+  rows = np.arange(len(filenames))
+  with open(os.path.join(eval_dir, 'predictions.tsv'), 'w') as f:
+    for filename, target, prediction, probability in zip(
+        filenames, targets, predictions, probabilities[rows, predictions]):
+      f.write('%s\t%d\t%d\t%.6f\n' % (filename, target, prediction,
+                                       probability))
+  with open(os.path.join(eval_dir, 'confusion.tsv'), 'w') as f:
+    for target, prediction in zip(*np.nonzero(confusion)):
+      f.write('%d\t%d\t%d\n' % (confusion[target, prediction], target,
+                                 prediction))
+  return np.trace(confusion) / max(len(filenames), 1), confusion
+
+
+def _cpu_set(shard_index, num_shards):
+  """Contiguous CPU cores of a shard worker, None if they cannot be pinned."""
+  if not hasattr(os, 'sched_getaffinity'):  # Python 2 or not Linux.
+    return None
+  cpus = sorted(os.sched_getaffinity(0))
+  if len(cpus) < num_shards:
+    return None
+  return cpus[shard_index * len(cpus) // num_shards:
+              (shard_index + 1) * len(cpus) // num_shards]
+
+
+def evaluate_sharded(num_shards):
+  """Eval CARC-19 once with num_shards parallel worker processes.
+
+  Every worker runs this binary with the same flags plus
+  --eval_shard_index, see eval_shard(). Workers are pinned to disjoint sets
+  of CPU cores, which also sizes the TensorFlow thread pools, and get the
+  GPUs of --eval_shard_gpus in turn. The merged predictions, confusion
+  matrix and precision do not depend on num_shards. They cover the same
+  examples as evaluate(), which also makes one pass over the first
+  --num_examples examples, so the precisions match up to float rounding
+  of the batched --uint8_queue standardization.
+
+  Args:
+    num_shards: number of worker processes.
+
+  Returns:
+    (precision, examples_per_sec) or None if a worker failed.
+  """
+  filenames = _eval_filenames()
+  argv = [sys.executable, sys.argv[0]] + carc19.strip_flag(
+      sys.argv[1:], 'eval_shard_index')
+  gpus = FLAGS.eval_shard_gpus.split(',') if FLAGS.eval_shard_gpus else ['']
+
+  start_time = time.time()
+  workers = []
+  for shard_index in range(num_shards):
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES=gpus[shard_index % len(gpus)])
+    cpus = _cpu_set(shard_index, num_shards)
+    preexec_fn = None
+    if cpus:
+      preexec_fn = functools.partial(os.sched_setaffinity, 0, cpus)
+    workers.append(subprocess.Popen(
+        argv + ['--eval_shard_index=%d' % shard_index], env=env,
+        preexec_fn=preexec_fn))
+  try:
+    exit_codes = [worker.wait() for worker in workers]
+  finally:
+    for worker in workers:
+      if worker.poll() is None:
+        worker.terminate()
+  # A worker killed by a signal has a negative exit code.
+  if any(exit_codes):
+    print('Shard workers failed, exit codes %s' % exit_codes)
+    return
+  missing = [shard_index for shard_index in range(num_shards)
+             if not os.path.exists(shard_path(FLAGS.eval_dir, shard_index,
+                                              num_shards))]
+  if missing:
+    print('No output from shards %s in %s' % (missing, FLAGS.eval_dir))
+    return
+  examples_per_sec = len(filenames) / (time.time() - start_time)
+
+  global_step, probabilities = merge_shards(FLAGS.eval_dir, len(filenames),
+                                            num_shards)
+  precision, _ = write_results(FLAGS.eval_dir, filenames, probabilities)
+  print('%s: precision @ 1 = %.3f' % (datetime.now(), precision))
+  print('%s: %d shards, %.1f examples/sec, results in %s' % (
+      datetime.now(), num_shards, examples_per_sec, FLAGS.eval_dir))
+  metrics = carc19_metrics.from_flags('eval')
+  metrics.record(global_step, {
+      'eval_precision': precision,
+      'eval_examples_per_sec': examples_per_sec})
+  metrics.close()
+  return precision, examples_per_sec
 
-    analyze_once(saver, summary_writer, top_k_op, summary_op, keys, labels, logits)
 
 def main(argv=None):  # pylint: disable=unused-argument
   carc19.maybe_download_and_extract()
+  if FLAGS.eval_shards > 0 and FLAGS.eval_shard_index >= 0:
+    # A worker of evaluate_sharded(), which owns eval_dir.
+    eval_shard(FLAGS.eval_shard_index, FLAGS.eval_shards)
+    return
   if tf.gfile.Exists(FLAGS.eval_dir):
     tf.gfile.DeleteRecursively(FLAGS.eval_dir)
   tf.gfile.MakeDirs(FLAGS.eval_dir)
-  evaluate()
-  #analyze()
+  if FLAGS.analyze:
+    analyze()
+  elif FLAGS.eval_image_sizes:
+    resolution_report()
+  elif FLAGS.eval_shards > 0:
+    evaluate_sharded(FLAGS.eval_shards)
+  elif FLAGS.prediction_cache_dir:
+    evaluate_cached()
+  else:
+    evaluate()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,80 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for the sharded carc19 evaluation."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import carc19
+import carc19_eval
+
+
+class CARC19ShardedEvalTest(tf.test.TestCase):
+
+  def _write_shards(self, eval_dir, probabilities, num_shards, steps=None):
+    for shard_index in range(num_shards):
+      indices = np.arange(shard_index, len(probabilities), num_shards)
+      np.savez(carc19_eval.shard_path(eval_dir, shard_index, num_shards),
+               indices=indices, probabilities=probabilities[indices],
+               global_step=steps[shard_index] if steps else 100)
+
+  def testMergeMatchesSingleShard(self):
+    rng = np.random.RandomState(0)
+    num_examples = 23
+    probabilities = rng.rand(num_examples,
+                             carc19.NUM_CLASSES).astype(np.float32)
+    filenames = ['/data/image/%d/ab/o_%d.jpg' % (i % carc19.NUM_CLASSES, i)
+                 for i in range(num_examples)]
+
+    results = []
+    for num_shards in (1, 4):
+      eval_dir = os.path.join(self.get_temp_dir(), str(num_shards))
+      os.makedirs(eval_dir)
+      self._write_shards(eval_dir, probabilities, num_shards)
+      step, merged = carc19_eval.merge_shards(eval_dir, num_examples,
+                                              num_shards)
+      self.assertEqual(100, step)
+      self.assertAllEqual(probabilities, merged)
+      precision, confusion = carc19_eval.write_results(eval_dir, filenames,
+                                                       merged)
+      with open(os.path.join(eval_dir, 'predictions.tsv')) as f:
+        results.append((precision, confusion.tolist(), f.read()))
+    self.assertEqual(results[0], results[1])
+    self.assertEqual(num_examples, np.sum(results[0][1]))
+
+  def testMergeRejectsMixedCheckpoints(self):
+    eval_dir = self.get_temp_dir()
+    probabilities = np.ones([4, carc19.NUM_CLASSES], np.float32)
+    self._write_shards(eval_dir, probabilities, 2, steps=[100, 200])
+    with self.assertRaises(ValueError):
+      carc19_eval.merge_shards(eval_dir, 4, 2)
+
+  def testStripFlag(self):
+    args = ['--eval_shards=4', '--eval_shard_index', '3', '--batch_size=8',
+            '--eval_shard_index=1', '--eval_shard_indexes=x']
+    self.assertEqual(['--eval_shards=4', '--batch_size=8',
+                      '--eval_shard_indexes=x'],
+                     carc19.strip_flag(args, 'eval_shard_index'))
+
+
+if __name__ == '__main__':
+  tf.test.main()
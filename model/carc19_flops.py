@@ -0,0 +1,112 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Prints the FLOPs and parameters of every layer of the CARC-19 model.
+
+The model is built with the same flags as carc19_train.py, so the stems and
+resolutions can be compared without any data or checkpoint:
+
+  python carc19_flops.py --stem=conv11
+  python carc19_flops.py --stem=strided --image_size=160
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+import carc19
+
+FLAGS = tf.app.flags.FLAGS
+
+
+def _op_flops(op):
+  """Floating point operations of a conv or matmul op for one example.
+
+  A multiply-add counts as two operations.
+
+  Args:
+    op: a Conv2D, DepthwiseConv2dNative or MatMul Operation.
+
+  Returns:
+    int, FLOPs per example.
+  """
+  if op.type == 'MatMul':
+    inner, outer = op.inputs[1].get_shape().as_list()
+    return 2 * inner * outer
+  _, height, width, _ = op.outputs[0].get_shape().as_list()
+  kernel_h, kernel_w, in_channels, out_channels = (
+      op.inputs[1].get_shape().as_list())
+  return 2 * height * width * kernel_h * kernel_w * in_channels * out_channels
+
+
+def layer_report(graph):
+  """Collect per-layer FLOPs, parameters and output shapes.
+
+  Args:
+    graph: Graph holding a model built by carc19.inference().
+
+  Returns:
+    A list of (layer, output_shape, flops, params) tuples in graph order.
+  """
+  layers = []
+  stats = {}
+  for op in graph.get_operations():
+    if op.type not in ('Conv2D', 'DepthwiseConv2dNative', 'MatMul'):
+      continue
+    layer = op.name.split('/')[0]
+    if layer not in stats:
+      layers.append(layer)
+      stats[layer] = {'flops': 0, 'params': 0, 'shape': None}
+    stats[layer]['flops'] += _op_flops(op)
+    stats[layer]['shape'] = op.outputs[0].get_shape().as_list()[1:]
+
+  for var in graph.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES):
+    layer = var.op.name.split('/')[0]
+    if layer in stats:
+      stats[layer]['params'] += var.get_shape().num_elements()
+
+  return [(layer, stats[layer]['shape'], stats[layer]['flops'],
+           stats[layer]['params']) for layer in layers]
+
+
+def report():
+  """Build the model for FLAGS.image_size inputs and print the layer table."""
+  with tf.Graph().as_default() as g:
+    images = tf.zeros([FLAGS.batch_size, FLAGS.image_size, FLAGS.image_size,
+                       3])
+    carc19.inference(images)
+    rows = layer_report(g)
+
+  total_flops = sum(row[2] for row in rows)
+  total_params = sum(row[3] for row in rows)
+  print('stem=%s image_size=%d global_pool=%s' % (
+      FLAGS.stem, FLAGS.image_size, FLAGS.global_pool))
+  print('%-16s | %-16s | %12s | %7s | %10s' % (
+      'layer', 'output', 'MFLOPs/img', 'share', 'params'))
+  for layer, shape, flops, params in rows:
+    print('%-16s | %-16s | %12.1f | %6.1f%% | %10d' % (
+        layer, 'x'.join(str(dim) for dim in shape), flops / 1e6,
+        100.0 * flops / total_flops, params))
+  print('%-16s | %-16s | %12.1f | %6.1f%% | %10d' % (
+      'total', '', total_flops / 1e6, 100.0, total_params))
+
+
+def main(argv=None):  # pylint: disable=unused-argument
+  report()
+
+
+if __name__ == '__main__':
+  tf.app.run()
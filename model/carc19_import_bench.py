@@ -0,0 +1,79 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Measures the import time of the CARC-19 modules.
+
+Every module is imported in a fresh interpreter, --repeat times, and the
+median wall time is printed with whether the import loaded TensorFlow.
+This script itself imports neither TensorFlow nor the flags, so it is run
+with plain arguments:
+
+  python carc19_import_bench.py --repeat=5 carc19_labels carc19_predict
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+
+DEFAULT_MODULES = ('carc19_labels', 'carc19_class', 'carc19_input',
+                   'carc19_model', 'carc19', 'carc19_cache', 'carc19_predict',
+                   'carc19_train')
+
+_TIMER = '''
+import sys, time
+start = time.time()
+import %s
+print('%%f %%d' %% (time.time() - start, 'tensorflow' in sys.modules))
+'''
+
+
+def time_import(module):
+  """Import module in a new interpreter.
+
+  Returns:
+    (seconds, loaded_tensorflow).
+  """
+  output = subprocess.check_output(
+      [sys.executable, '-c', _TIMER % module],
+      cwd=os.path.dirname(os.path.abspath(__file__)))
+  seconds, loaded_tensorflow = output.split()
+  return float(seconds), bool(int(loaded_tensorflow))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+  parser.add_argument('--repeat', type=int, default=3,
+                      help='imports per module, the median is reported')
+  args = parser.parse_args()
+
+  print('%-16s | %10s | %10s' % ('module', 'import ms', 'tensorflow'))
+  for module in args.modules:
+    try:
+      runs = sorted(time_import(module) for _ in range(args.repeat))
+    except subprocess.CalledProcessError:
+      print('%-16s | %10s |' % (module, 'failed'))
+      continue
+    seconds, loaded_tensorflow = runs[len(runs) // 2]
+    print('%-16s | %10.1f | %10s' % (module, 1000 * seconds,
+                                     'yes' if loaded_tensorflow else 'no'))
+
+
+if __name__ == '__main__':
+  main()
@@ -20,11 +20,30 @@ from __future__ import division
 from __future__ import print_function
 
 import os
+import random
 
 from six.moves import xrange  # pylint: disable=redefined-builtin
 import tensorflow as tf
 
+# The label file helpers do not need TensorFlow and live in carc19_labels,
+# they are re-exported here for the input pipeline and its callers.
+# pylint: disable=unused-import
+from carc19_labels import CLASS_SAMPLINGS
+from carc19_labels import STATS_SUFFIX
+from carc19_labels import class_index
+from carc19_labels import class_weights
+from carc19_labels import count_examples
+from carc19_labels import label_filenames
+from carc19_labels import read_dataset_stats
+from carc19_labels import read_hard_examples
+from carc19_labels import split_holdout
+from carc19_labels import write_dataset_stats
+from carc19_labels import write_hard_examples
+# pylint: enable=unused-import
+
 # Process images of this size. square image: width = height = IMAGE_SIZE
+# This is the size the images are stored at on disk; the pipeline can feed
+# the network a smaller square through the image_size arguments below.
 IMAGE_SIZE = 256
 #IMAGE_WIDTH = 600
 #IMAGE_HEIGHT = 400
@@ -35,17 +54,97 @@ NUM_CLASSES = 19
 NUM_EXAMPLES_PER_EPOCH_FOR_TRAIN = 300000
 NUM_EXAMPLES_PER_EPOCH_FOR_EVAL = 40000
 
+# Upper bound, in bytes, of the decoded examples held by the training shuffle
+# queue. The filename list is reshuffled every epoch, so a small example
+# buffer on top of it is enough to decorrelate consecutive batches.
+SHUFFLE_BUFFER_BYTES = 256 * 1024 * 1024
+
+# How read_carc19 turns a raw-size upstream jpeg (600x400) into a square
+# IMAGE_SIZE image. 'letterbox' pads to a square with black borders like
+# preprocess/image_cutter.py does offline, 'crop' keeps the central square.
+RAW_MODES = ('letterbox', 'crop')
+
+# Scale denominators supported by the jpeg decoder's DCT-domain downscaling.
+DECODE_RATIOS = (1, 2, 4, 8)
+
+
+def _decode_image(value, decode_ratio=1, raw_mode=None,
+                  image_size=IMAGE_SIZE):
+  """Decode a jpeg, optionally downscaling and cropping while decoding.
 
-def read_carc19(filename_queue):
+  Args:
+    value: scalar string Tensor with the jpeg-encoded image.
+    decode_ratio: one of DECODE_RATIOS. The decoder skips DCT coefficients
+      and directly produces an image 1/decode_ratio of the full size.
+    raw_mode: None for images already preprocessed to IMAGE_SIZE, else one
+      of RAW_MODES.
+    image_size: side of the square image fed to the network.
+
+  Returns:
+    A [height, width, 3] uint8 Tensor. If raw_mode is set, or if the image
+    has to be scaled to a non default image_size, height and width are
+    image_size.
+
+  Raises:
+    ValueError: on an unsupported decode_ratio or raw_mode.
+  """
+  if decode_ratio not in DECODE_RATIOS:
+    raise ValueError('Unsupported decode_ratio %s, expected one of %s' %
+                     (decode_ratio, DECODE_RATIOS))
+  if raw_mode is not None and raw_mode not in RAW_MODES:
+    raise ValueError('Unsupported raw_mode %s, expected one of %s' %
+                     (raw_mode, RAW_MODES))
+
+  if raw_mode == 'crop' and decode_ratio == 1:
+    # Only decode the MCU blocks overlapping the central square.
+    shape = tf.image.extract_jpeg_shape(value)
+    side = tf.minimum(shape[0], shape[1])
+    crop_window = tf.stack([(shape[0] - side) // 2, (shape[1] - side) // 2,
+                            side, side])
+    image = tf.image.decode_and_crop_jpeg(value, crop_window,
+                                          channels=IMAGE_CHANNEL)
+  else:
+    image = tf.image.decode_jpeg(value, channels=IMAGE_CHANNEL,
+                                 ratio=decode_ratio)
+  if raw_mode is None:
+    if image_size == IMAGE_SIZE and decode_ratio == 1:
+      return image
+  elif raw_mode == 'crop':
+    height = tf.shape(image)[0]
+    width = tf.shape(image)[1]
+    side = tf.minimum(height, width)
+    image = tf.image.crop_to_bounding_box(image, (height - side) // 2,
+                                          (width - side) // 2, side, side)
+  else:
+    height = tf.shape(image)[0]
+    width = tf.shape(image)[1]
+    side = tf.maximum(height, width)
+    image = tf.image.pad_to_bounding_box(image, (side - height) // 2,
+                                         (side - width) // 2, side, side)
+
+  image = tf.image.resize_images(image, [image_size, image_size],
+                                 method=tf.image.ResizeMethod.AREA)
+  image = tf.cast(tf.round(image), tf.uint8)
+  image.set_shape([image_size, image_size, IMAGE_CHANNEL])
+  return image
+
+
+def read_carc19(filename_queue, decode_ratio=1, raw_mode=None,
+                image_size=IMAGE_SIZE):
   """Reads and parses examples from CARC-19 data files.
 
   Args:
     filename_queue: A queue of strings with the filenames to read from.
+    decode_ratio: downscale factor applied by the jpeg decoder, see
+      _decode_image.
+    raw_mode: None if the files are already IMAGE_SIZE squares, else how to
+      bring raw-size images to IMAGE_SIZE, one of RAW_MODES.
+    image_size: side of the square image fed to the network.
 
   Returns:
     An object representing a single example, with the following fields:
-      height: number of rows in the result (IMAGE_SIZE)
-      width: number of columns in the result (IMAGE_SIZE)
+      height: number of rows in the result (image_size)
+      width: number of columns in the result (image_size)
       depth: number of color channels in the result (3)
       key: a scalar string Tensor describing the filename & record number
         for this example.
@@ -61,8 +160,8 @@ def read_carc19(filename_queue):
   # See http://www.cs.toronto.edu/~kriz/cifar.html for a description of the
   # input format.
   label_bytes = 1
-  result.height = IMAGE_SIZE
-  result.width = IMAGE_SIZE
+  result.height = image_size
+  result.width = image_size
   result.depth = 3
   image_bytes = result.height * result.width * result.depth
 
@@ -94,7 +193,9 @@ def read_carc19(filename_queue):
   # Decode jpg-formated images
   # https://www.tensorflow.org/api_docs/python/tf/image/decode_jpeg
   # A Tensor of type uint8. 3-D with shape [height, width, channels]
-  result.uint8image = tf.image.decode_jpeg(value, channels=IMAGE_CHANNEL)
+  result.uint8image = _decode_image(value, decode_ratio=decode_ratio,
+                                    raw_mode=raw_mode,
+                                    image_size=image_size)
 
   #### Convert from [depth, height, width] to [height, width, depth].
   ###result.uint8image = tf.transpose(depth_major, [1, 2, 0])
@@ -102,8 +203,104 @@ def read_carc19(filename_queue):
   return result
 
 
+def _normalize_with_stats(images, dataset_stats):
+  """Normalize with dataset constants as one multiply-add per pixel.
+
+  Args:
+    images: float32 Tensor whose last dimension holds the channels.
+    dataset_stats: (mean, std) pair from read_dataset_stats().
+
+  Returns:
+    (images - mean) / std, computed as images * scale + offset.
+  """
+  mean, std = dataset_stats
+  scale = tf.constant([1.0 / s for s in std], tf.float32)
+  offset = tf.constant([-m / s for m, s in zip(mean, std)], tf.float32)
+  return images * scale + offset
+
+
+def preprocess_jpeg(value, decode_ratio=1, raw_mode=None,
+                    image_size=IMAGE_SIZE, dataset_stats=None):
+  """Decode and standardize one jpeg the way evaluate_inputs() does.
+
+  Args:
+    value: scalar string Tensor with the jpeg-encoded image.
+    decode_ratio: downscale factor applied by the jpeg decoder.
+    raw_mode: None for preprocessed images, else one of RAW_MODES.
+    image_size: side of the square image fed to the network.
+    dataset_stats: optional (mean, std) pair replacing the per image
+      standardization.
+
+  Returns:
+    A [image_size, image_size, 3] float32 Tensor.
+  """
+  image = _decode_image(value, decode_ratio=decode_ratio, raw_mode=raw_mode,
+                        image_size=image_size)
+  image = tf.image.resize_image_with_crop_or_pad(image, image_size,
+                                                 image_size)
+  image = tf.cast(image, tf.float32)
+  if dataset_stats is not None:
+    image = _normalize_with_stats(image, dataset_stats)
+  else:
+    image = tf.image.per_image_standardization(image)
+  image.set_shape([image_size, image_size, IMAGE_CHANNEL])
+  return image
+
+
+def _class_balanced_filename_queue(filenames, class_sampling):
+  """A filename queue that draws the class of every read at random.
+
+  Each class gets its own shuffled filename producer. The reader dequeues
+  from one of them, picked per read with the class_weights() probabilities.
+
+  Args:
+    filenames: list of image paths.
+    class_sampling: one of CLASS_SAMPLINGS.
+
+  Returns:
+    A queue of filenames usable by read_carc19.
+  """
+  index = class_index(filenames)
+  labels = sorted(index)
+  weights = class_weights([len(index[label]) for label in labels],
+                          class_sampling)
+  for label, weight in zip(labels, weights):
+    print ('Class %d: %d examples, sampled with p = %.3f' % (
+        label, len(index[label]), weight))
+
+  queues = [tf.train.string_input_producer(index[label], shuffle=True,
+                                           name='class_%d_producer' % label)
+            for label in labels]
+  which = tf.multinomial(tf.log([weights]), 1)[0][0]
+  return tf.QueueBase.from_list(tf.cast(which, tf.int32), queues)
+
+
+def _shuffle_queue_size(buffer_bytes, example_bytes, batch_size):
+  """Size the shuffle queue so that it holds at most buffer_bytes of examples.
+
+  Args:
+    buffer_bytes: memory budget of the queue in bytes.
+    example_bytes: size of a single queued example in bytes.
+    batch_size: Number of images per batch.
+
+  Returns:
+    capacity: int, examples the queue holds at most. Never less than
+      batch_size, the queue must hold one batch; only then does it exceed
+      buffer_bytes, which is reported.
+    min_queue_examples: int, examples left in the queue after a dequeue,
+      3 batches below capacity to let the reader threads refill it.
+  """
+  capacity = int(buffer_bytes // example_bytes)
+  if capacity < batch_size:
+    print ('Shuffle buffer of %.1f MB is smaller than one batch, the queue '
+           'holds %.1f MB.' % (buffer_bytes / 1024.0 / 1024.0,
+                               batch_size * example_bytes / 1024.0 / 1024.0))
+    capacity = batch_size
+  return capacity, max(capacity - 3 * batch_size, 0)
+
+
 def _generate_image_and_label_batch(image, label, min_queue_examples,
-                                    batch_size, shuffle):
+                                    batch_size, shuffle, capacity=None):
   """Construct a queued batch of images and labels.
 
   Args:
@@ -113,6 +310,8 @@ def _generate_image_and_label_batch(image, label, min_queue_examples,
       in the queue that provides of batches of examples.
     batch_size: Number of images per batch.
     shuffle: boolean indicating whether to use a shuffling queue.
+    capacity: maximum number of queued examples, defaults to
+      min_queue_examples + 3 * batch_size.
 
   Returns:
     images: Images. 4D tensor of [batch_size, height, width, 3] size.
@@ -121,19 +320,21 @@ def _generate_image_and_label_batch(image, label, min_queue_examples,
   # Create a queue that shuffles the examples, and then
   # read 'batch_size' images + labels from the example queue.
   num_preprocess_threads = 16
+  if capacity is None:
+    capacity = min_queue_examples + 3 * batch_size
   if shuffle:
     images, label_batch = tf.train.shuffle_batch(
         [image, label],
         batch_size=batch_size,
         num_threads=num_preprocess_threads,
-        capacity=min_queue_examples + 3 * batch_size,
+        capacity=capacity,
         min_after_dequeue=min_queue_examples)
   else:
     images, label_batch = tf.train.batch(
         [image, label],
         batch_size=batch_size,
         num_threads=num_preprocess_threads,
-        capacity=min_queue_examples + 3 * batch_size)
+        capacity=capacity)
 
   # Display the training images in the visualizer.
   tf.summary.image('images', images)
@@ -142,7 +343,8 @@ def _generate_image_and_label_batch(image, label, min_queue_examples,
 
 def _generate_image_and_label_and_key_batch(image, label, key,
                                             min_queue_examples,
-                                            batch_size, shuffle):
+                                            batch_size, shuffle,
+                                            one_pass=False):
   """Construct a queued batch of images and labels.
 
   Args:
@@ -152,6 +354,8 @@ def _generate_image_and_label_and_key_batch(image, label, key,
       in the queue that provides of batches of examples.
     batch_size: Number of images per batch.
     shuffle: boolean indicating whether to use a shuffling queue.
+    one_pass: if True, the input ends after one pass: batch with a single
+      thread to keep the input order and let the last batch be smaller.
 
   Returns:
     images: Images. 4D tensor of [batch_size, height, width, 3] size.
@@ -171,90 +375,208 @@ def _generate_image_and_label_and_key_batch(image, label, key,
     images, label_batch, keys = tf.train.batch(
         [image, label, key],
         batch_size=batch_size,
-        num_threads=num_preprocess_threads,
-        capacity=min_queue_examples + 3 * batch_size)
+        num_threads=1 if one_pass else num_preprocess_threads,
+        capacity=min_queue_examples + 3 * batch_size,
+        allow_smaller_final_batch=one_pass)
 
   # Display the training images in the visualizer.
   tf.summary.image('images', images)
 
-  return images, tf.reshape(label_batch, [batch_size]), tf.reshape(keys, [batch_size])
+  return images, tf.reshape(label_batch, [-1]), tf.reshape(keys, [-1])
+
+
+def _distort_batch(images):
+  """Apply the training distortions independently to every image of a batch.
+
+  Vectorized equivalent of random_brightness + random_contrast applied per
+  image, so that the distortions can run on the batched tensor.
+
+  Args:
+    images: 4-D float32 Tensor of [batch_size, height, width, 3].
+
+  Returns:
+    4-D float32 Tensor of the same shape.
+  """
+  batch_size = images.get_shape()[0].value
+  delta = tf.random_uniform([batch_size, 1, 1, 1], -63.0, 63.0)
+  images = images + delta
+  factor = tf.random_uniform([batch_size, 1, 1, 1], 0.2, 1.8)
+  mean = tf.reduce_mean(images, axis=[1, 2], keep_dims=True)
+  return (images - mean) * factor + mean
 
 
+def _standardize_batch(images, dataset_stats=None):
+  """Batched tf.image.per_image_standardization.
 
+  Args:
+    images: 4-D float32 Tensor of [batch_size, height, width, 3].
+    dataset_stats: optional (mean, std) pair from read_dataset_stats(). If
+      set, the batch is normalized with these constants instead.
 
-def train_inputs(data_dir, batch_size):
+  Returns:
+    4-D float32 Tensor, each image with zero mean and unit variance.
+  """
+  if dataset_stats is not None:
+    return _normalize_with_stats(images, dataset_stats)
+  num_pixels = images.get_shape()[1:].num_elements()
+  mean, variance = tf.nn.moments(images, axes=[1, 2, 3], keep_dims=True)
+  stddev = tf.maximum(tf.sqrt(variance), 1.0 / (num_pixels ** 0.5))
+  return (images - mean) / stddev
+
+
+def train_inputs(data_dir, batch_size,
+                 shuffle_buffer_bytes=SHUFFLE_BUFFER_BYTES,
+                 uint8_queue=False, decode_ratio=1, raw_mode=None,
+                 image_size=IMAGE_SIZE, hard_examples_file=None,
+                 hard_example_repeat=1, class_sampling=None,
+                 dataset_stats=None, num_shards=1, shard_index=0,
+                 num_holdout=0):
   """Construct input for CARC training using the Reader ops.
 
+  Examples are shuffled on two levels: the filename list is reshuffled at
+  the start of every epoch, and a small example queue capped at
+  shuffle_buffer_bytes mixes neighbouring reads. The queue fills in seconds,
+  so training starts without a long warm-up.
+
   Args:
     data_dir: Path to the CARC-19 data directory.
     batch_size: Number of images per batch.
+    shuffle_buffer_bytes: memory budget of the example shuffle queue.
+    uint8_queue: if True, queue the decoded uint8 images and run the float
+      cast, distortions and standardization on the batch instead of on each
+      example. The queue then holds 4x more examples in the same memory.
+    decode_ratio: downscale factor applied by the jpeg decoder.
+    raw_mode: None for preprocessed images, else one of RAW_MODES.
+    image_size: side of the square images fed to the network.
+    hard_examples_file: optional manifest written by carc19_eval.py
+      --analyze. Its training examples are read hard_example_repeat times
+      per epoch instead of once; other keys are ignored, so a manifest of
+      test examples cannot leak into training.
+    hard_example_repeat: int, epoch multiplicity of the hard examples.
+    class_sampling: None to read the label file uniformly, else one of
+      CLASS_SAMPLINGS to read per-class streams with class_weights().
+    dataset_stats: optional (mean, std) pair from read_dataset_stats(),
+      replacing the per image standardization by a constant affine op.
+    num_shards: number of distributed workers splitting the label file.
+    shard_index: this worker's shard, every num_shards-th line of the label
+      file starting at shard_index. Shards are disjoint.
+    num_holdout: size of the validation subset of split_holdout() left out
+      of training, see evaluate_inputs().
 
   Returns:
-    images: Images. 4D tensor of [batch_size, IMAGE_SIZE, IMAGE_SIZE, 3] size.
+    images: Images. 4D tensor of [batch_size, image_size, image_size, 3] size.
     labels: Labels. 1D tensor of [batch_size] size.
   """
-  with open(os.path.join(data_dir, 'label_for_train.dat'), 'r') as label_items:
-    filenames = [ ]
-    for line in label_items:
-      parts = line.strip().split(' ')
-      filenames.append(os.path.join(data_dir, parts[0]+parts[1]))
-
-  # Create a queue that produces the filenames to read.
-  filename_queue = tf.train.string_input_producer(filenames)
+  all_filenames, _ = split_holdout(
+      label_filenames(data_dir, 'label_for_train.dat'), num_holdout)
+  filenames = all_filenames[shard_index::num_shards]
+
+  if hard_examples_file and hard_example_repeat > 1:
+    keys = read_hard_examples(hard_examples_file)
+    unknown = len(set(keys) - set(all_filenames))
+    if unknown:
+      print ('Warning: %d of %d keys of %s are not training examples and '
+             'are ignored; was it written with --analyze_data=test, or do '
+             'they fall in the validation holdout?' % (
+                 unknown, len(keys), hard_examples_file))
+    known = set(filenames)
+    hard = [key for key in keys if key in known]
+    filenames.extend(hard * (hard_example_repeat - 1))
+    print ('Oversampling %d hard examples %d times.' % (len(hard),
+                                                        hard_example_repeat))
+
+  # Create a queue that produces the filenames to read, in a new random
+  # order every epoch.
+  if class_sampling:
+    filename_queue = _class_balanced_filename_queue(filenames, class_sampling)
+  else:
+    filename_queue = tf.train.string_input_producer(filenames, shuffle=True)
 
   # Read examples from files in the filename queue.
-  read_input = read_carc19(filename_queue)
-  reshaped_image = tf.cast(read_input.uint8image, tf.float32)
-
-  height = IMAGE_SIZE
-  width = IMAGE_SIZE
-  reshaped_image.set_shape([height, width, 3])
-
-  # Image processing for training the network. Note the many random
-  # distortions applied to the image.
-  distorted_image = reshaped_image
-  # Because these operations are not commutative, consider randomizing
-  # the order their operation.
-  distorted_image = tf.image.random_brightness(distorted_image,
-                                               max_delta=63)
-  distorted_image = tf.image.random_contrast(distorted_image,
-                                             lower=0.2, upper=1.8)
-
-  # Subtract off the mean and divide by the variance of the pixels.
-  float_image = tf.image.per_image_standardization(distorted_image)
+  read_input = read_carc19(filename_queue, decode_ratio=decode_ratio,
+                           raw_mode=raw_mode, image_size=image_size)
+
+  height = image_size
+  width = image_size
+
+  if uint8_queue:
+    # Preprocessing happens after batching, see below.
+    queued_image = read_input.uint8image
+  else:
+    reshaped_image = tf.cast(read_input.uint8image, tf.float32)
+    reshaped_image.set_shape([height, width, 3])
+
+    # Image processing for training the network. Note the many random
+    # distortions applied to the image.
+    distorted_image = reshaped_image
+    # Because these operations are not commutative, consider randomizing
+    # the order their operation.
+    distorted_image = tf.image.random_brightness(distorted_image,
+                                                 max_delta=63)
+    distorted_image = tf.image.random_contrast(distorted_image,
+                                               lower=0.2, upper=1.8)
+
+    # Subtract off the mean and divide by the variance of the pixels.
+    if dataset_stats is not None:
+      queued_image = _normalize_with_stats(distorted_image, dataset_stats)
+    else:
+      queued_image = tf.image.per_image_standardization(distorted_image)
 
   # Set the shapes of tensors.
-  float_image.set_shape([height, width, 3])
+  queued_image.set_shape([height, width, 3])
   read_input.label.set_shape([1])
 
-  ###print (read_input.key.shape)
-  ###print (float_image.shape)
-  ###print (read_input.label.shape)
-  ###import sys; sys.exit(0)
-
-  # Ensure that the random shuffling has good mixing properties.
-  min_fraction_of_examples_in_queue = 0.01
-  min_queue_examples = int(NUM_EXAMPLES_PER_EPOCH_FOR_TRAIN *
-                           min_fraction_of_examples_in_queue)
-  print ('Filling queue with %d CARC images before starting to train. '
-         'This will take a few minutes.' % min_queue_examples)
+  # Bound the shuffle queue by memory rather than by a fraction of the epoch.
+  example_bytes = height * width * 3 * queued_image.dtype.size
+  capacity, min_queue_examples = _shuffle_queue_size(shuffle_buffer_bytes,
+                                                     example_bytes,
+                                                     batch_size)
+  print ('Filling queue with %d CARC images (%.1f MB) before starting to '
+         'train.' % (min_queue_examples,
+                     min_queue_examples * example_bytes / 1024.0 / 1024.0))
 
   # Generate a batch of images and labels by building up a queue of examples.
-  return _generate_image_and_label_batch(float_image, read_input.label,
-                                         min_queue_examples, batch_size,
-                                         shuffle=True)
-
-
-def evaluate_inputs(eval_data, data_dir, batch_size):
+  images, labels = _generate_image_and_label_batch(queued_image,
+                                                   read_input.label,
+                                                   min_queue_examples,
+                                                   batch_size,
+                                                   shuffle=True,
+                                                   capacity=capacity)
+  if uint8_queue:
+    images = _standardize_batch(_distort_batch(tf.cast(images, tf.float32)),
+                                dataset_stats)
+  return images, labels
+
+
+def evaluate_inputs(eval_data, data_dir, batch_size, uint8_queue=False,
+                    decode_ratio=1, raw_mode=None, image_size=IMAGE_SIZE,
+                    max_examples=None, sample_seed=None, dataset_stats=None,
+                    num_epochs=None, num_holdout=0):
   """Construct input for CARC evaluation using the Reader ops.
 
   Args:
     eval_data: bool, indicating if one should use the train or eval data set.
     data_dir: Path to the CARC-19 data directory.
     batch_size: Number of images per batch.
+    uint8_queue: if True, queue uint8 images and standardize the batch.
+    decode_ratio: downscale factor applied by the jpeg decoder.
+    raw_mode: None for preprocessed images, else one of RAW_MODES.
+    image_size: side of the square images fed to the network.
+    max_examples: if set, only read the first max_examples entries of the
+      label file, e.g. as a fixed validation subset.
+    sample_seed: if set, draw the max_examples entries at random with this
+      seed instead, so that the subset covers the whole label file but is
+      the same on every run.
+    dataset_stats: optional (mean, std) pair from read_dataset_stats().
+    num_epochs: if set, read the examples this many times in label file
+      order, then raise OutOfRangeError; the last batch may be smaller.
+      Run tf.local_variables_initializer() before. By default the examples
+      are read in random order forever.
+    num_holdout: with eval_data False, read only the validation subset of
+      this size that train_inputs() leaves out, see split_holdout().
 
   Returns:
-    images: Images. 4D tensor of [batch_size, IMAGE_SIZE, IMAGE_SIZE, 3] size.
+    images: Images. 4D tensor of [batch_size, image_size, image_size, 3] size.
     labels: Labels. 1D tensor of [batch_size] size.
     keys: Keys. 1D tensor of [batch_size] size.
   """
@@ -266,29 +588,40 @@ def evaluate_inputs(eval_data, data_dir, batch_size):
     num_examples_per_epoch = NUM_EXAMPLES_PER_EPOCH_FOR_EVAL
 
   # Enumerate filenames into List filenames
-  filenames = [ ]
-  with open(os.path.join(data_dir, label_file), 'r') as label_items:
-    for line in label_items:
-      parts = line.strip().split(' ')
-      filenames.append(os.path.join(data_dir, parts[0]+parts[1]))
+  filenames = label_filenames(data_dir, label_file)
+  if num_holdout and not eval_data:
+    _, filenames = split_holdout(filenames, num_holdout)
+  if max_examples and sample_seed is not None:
+    filenames = random.Random(sample_seed).sample(
+        filenames, min(max_examples, len(filenames)))
+  elif max_examples:
+    filenames = filenames[:max_examples]
 
   # Create a queue that produces the filenames to read.
-  filename_queue = tf.train.string_input_producer(filenames)
+  filename_queue = tf.train.string_input_producer(
+      filenames, num_epochs=num_epochs, shuffle=num_epochs is None)
 
   # Read examples from files in the filename queue.
-  read_input = read_carc19(filename_queue)
-  reshaped_image = tf.cast(read_input.uint8image, tf.float32)
+  read_input = read_carc19(filename_queue, decode_ratio=decode_ratio,
+                           raw_mode=raw_mode, image_size=image_size)
 
-  height = IMAGE_SIZE
-  width = IMAGE_SIZE
+  height = image_size
+  width = image_size
 
   # Image processing for evaluation.
   # Crop the central [height, width] of the image.
-  resized_image = tf.image.resize_image_with_crop_or_pad(reshaped_image,
-                                                         height, width)
+  resized_image = tf.image.resize_image_with_crop_or_pad(
+      read_input.uint8image, height, width)
 
-  # Subtract off the mean and divide by the variance of the pixels.
-  float_image = tf.image.per_image_standardization(resized_image)
+  if uint8_queue:
+    float_image = resized_image
+  else:
+    # Subtract off the mean and divide by the variance of the pixels.
+    float_image = tf.cast(resized_image, tf.float32)
+    if dataset_stats is not None:
+      float_image = _normalize_with_stats(float_image, dataset_stats)
+    else:
+      float_image = tf.image.per_image_standardization(float_image)
 
   # Set the shapes of tensors.
   float_image.set_shape([height, width, 3])
@@ -300,7 +633,10 @@ def evaluate_inputs(eval_data, data_dir, batch_size):
                            min_fraction_of_examples_in_queue)
 
   # Generate a batch of images and labels by building up a queue of examples.
-  return _generate_image_and_label_and_key_batch(float_image, read_input.label,
-                                         read_input.key,
-                                         min_queue_examples, batch_size,
-                                         shuffle=False)
+  images, labels, keys = _generate_image_and_label_and_key_batch(
+      float_image, read_input.label, read_input.key,
+      min_queue_examples, batch_size, shuffle=False,
+      one_pass=num_epochs is not None)
+  if uint8_queue:
+    images = _standardize_batch(tf.cast(images, tf.float32), dataset_stats)
+  return images, labels, keys
@@ -56,6 +56,56 @@ class CARC19InputTest(tf.test.TestCase):
       with self.assertRaises(tf.errors.OutOfRangeError):
         sess.run([result.key, result.uint8image])
 
+  def testShuffleQueueSize(self):
+    example_bytes = 256 * 256 * 3 * 4
+    for budget in (1, 31, 32, 64, 96, 97, 1000):
+      capacity, min_queue_examples = carc19_input._shuffle_queue_size(
+          budget * example_bytes, example_bytes, 32)
+      self.assertLess(min_queue_examples, capacity)
+      # Within the budget, unless the budget is below one batch.
+      self.assertEqual(max(budget, 32), capacity)
+    self.assertEqual((1000, 1000 - 3 * 32), carc19_input._shuffle_queue_size(
+        1000 * example_bytes, example_bytes, 32))
+
+  def testHardExamplesOncePerKey(self):
+    path = os.path.join(self.get_temp_dir(), 'hard_examples.tsv')
+    carc19_input.write_hard_examples(path, [('/data/image/0/bj/a.jpg', 0, 1,
+                                             -0.5),
+                                            ('/data/image/1/bj/b.jpg', 1, 1,
+                                             0.1),
+                                            ('/data/image/0/bj/a.jpg', 0, 1,
+                                             -0.5)])
+    with open(path) as manifest:
+      self.assertEqual(2, len(manifest.readlines()))
+    with open(path, 'a') as manifest:
+      manifest.write('/data/image/1/bj/b.jpg\t1\t1\t0.1000\n')
+    self.assertEqual(['/data/image/0/bj/a.jpg', '/data/image/1/bj/b.jpg'],
+                     carc19_input.read_hard_examples(path))
+
+  def testSplitHoldout(self):
+    filenames = ['/data/image/%d/bj/%d.jpg' % (i % 3, i) for i in range(50)]
+    train, holdout = carc19_input.split_holdout(filenames, 10)
+    self.assertEqual(10, len(holdout))
+    self.assertEqual(sorted(filenames), sorted(train + holdout))
+    self.assertEqual((train, holdout),
+                     carc19_input.split_holdout(filenames, 10))
+    self.assertEqual((filenames, []), carc19_input.split_holdout(filenames, 0))
+
+  def testClassIndex(self):
+    filenames = ['/data/image/0/bj/a.jpg', '/data/image/16/sh/b.jpg',
+                 '/data/image/0/sh/c.jpg']
+    self.assertEqual({0: ['/data/image/0/bj/a.jpg', '/data/image/0/sh/c.jpg'],
+                      16: ['/data/image/16/sh/b.jpg']},
+                     carc19_input.class_index(filenames))
+
+  def testClassWeights(self):
+    self.assertAllClose([0.5, 0.5],
+                        carc19_input.class_weights([400, 100], 'uniform'))
+    self.assertAllClose([2.0 / 3, 1.0 / 3],
+                        carc19_input.class_weights([400, 100], 'sqrt'))
+    with self.assertRaises(ValueError):
+      carc19_input.class_weights([400, 100], 'linear')
+
 
 if __name__ == "__main__":
   tf.test.main()
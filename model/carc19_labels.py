@@ -0,0 +1,189 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Label file, class and manifest helpers of the CARC-19 data set.
+
+Nothing here imports TensorFlow, so label indexing and dataset tooling start
+in milliseconds. carc19_input re-exports all of it.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import random
+
+# Suffix of the per-channel statistics file written by carc19_stats.py next
+# to a label file, e.g. label_for_train.dat.stats.
+STATS_SUFFIX = '.stats'
+
+# Class weightings of the class-balanced training input, see class_weights.
+CLASS_SAMPLINGS = ('uniform', 'sqrt')
+
+
+def label_filenames(data_dir, label_file='label_for_train.dat'):
+  """List the image paths of a label file.
+
+  Args:
+    data_dir: Path to the CARC-19 data directory.
+    label_file: name of the label file inside data_dir.
+
+  Returns:
+    A list of image paths, in label file order.
+  """
+  filenames = [ ]
+  with open(os.path.join(data_dir, label_file), 'r') as label_items:
+    for line in label_items:
+      parts = line.strip().split(' ')
+      filenames.append(os.path.join(data_dir, parts[0]+parts[1]))
+  return filenames
+
+
+def split_holdout(filenames, num_holdout, seed=0):
+  """Split a fixed random holdout subset off a list of training examples.
+
+  Args:
+    filenames: list of image paths, e.g. from label_filenames().
+    num_holdout: size of the holdout subset, 0 for none.
+    seed: seed of the draw, the same seed always gives the same subset.
+
+  Returns:
+    train: the other paths, in input order.
+    holdout: the holdout paths, in input order.
+  """
+  if num_holdout <= 0:
+    return list(filenames), []
+  chosen = set(random.Random(seed).sample(range(len(filenames)),
+                                          min(num_holdout, len(filenames))))
+  train = [name for i, name in enumerate(filenames) if i not in chosen]
+  holdout = [name for i, name in enumerate(filenames) if i in chosen]
+  return train, holdout
+
+
+def count_examples(data_dir, label_file='label_for_train.dat'):
+  """Count the examples listed in a label file.
+
+  Args:
+    data_dir: Path to the CARC-19 data directory.
+    label_file: name of the label file inside data_dir.
+
+  Returns:
+    int, number of non empty lines of the label file.
+  """
+  with open(os.path.join(data_dir, label_file), 'r') as label_items:
+    return sum(1 for line in label_items if line.strip())
+
+
+def read_dataset_stats(data_dir, label_file='label_for_train.dat'):
+  """Read the per-channel statistics cached next to a label file.
+
+  Args:
+    data_dir: Path to the CARC-19 data directory.
+    label_file: name of the label file the statistics were computed on.
+
+  Returns:
+    (mean, std), two lists of IMAGE_CHANNEL floats in pixel units.
+
+  Raises:
+    IOError: if carc19_stats.py has not been run on this label file.
+  """
+  with open(os.path.join(data_dir, label_file + STATS_SUFFIX), 'r') as f:
+    stats = json.load(f)
+  return stats['mean'], stats['std']
+
+
+def write_dataset_stats(data_dir, mean, std, count,
+                        label_file='label_for_train.dat'):
+  """Cache per-channel statistics next to a label file."""
+  with open(os.path.join(data_dir, label_file + STATS_SUFFIX), 'w') as f:
+    json.dump({'mean': list(mean), 'std': list(std), 'count': count}, f)
+
+
+def write_hard_examples(path, rows):
+  """Write a hard example manifest.
+
+  Args:
+    path: file to write.
+    rows: list of (key, target, prediction, margin), key being the image
+      path as read by read_carc19. Only the first row of a key is written.
+  """
+  written = set()
+  with open(path, 'w') as manifest:
+    for key, target, prediction, margin in rows:
+      if key in written:
+        continue
+      written.add(key)
+      manifest.write('%s\t%d\t%d\t%.4f\n' % (key, target, prediction,
+                                              margin))
+
+
+def read_hard_examples(path):
+  """Read the distinct keys of a manifest, in file order.
+
+  A key listed more than once, e.g. by a manifest of an older version, is
+  returned once, so that it is not oversampled more than the others.
+  """
+  keys = []
+  seen = set()
+  with open(path, 'r') as manifest:
+    for line in manifest:
+      key = line.split('\t')[0]
+      if line.strip() and key not in seen:
+        seen.add(key)
+        keys.append(key)
+  return keys
+
+
+def class_index(filenames):
+  """Group image paths by class.
+
+  Args:
+    filenames: list of image paths laid out as .../image/${label}/xx/o_xxx.jpg,
+      the label being parsed the same way as in read_carc19.
+
+  Returns:
+    A dict mapping each int label to the list of its paths, in input order.
+  """
+  index = {}
+  for filename in filenames:
+    label = int(filename.split('/')[-3])
+    index.setdefault(label, []).append(filename)
+  return index
+
+
+def class_weights(counts, class_sampling):
+  """Sampling probability of each class.
+
+  Args:
+    counts: list of the number of examples per class.
+    class_sampling: 'uniform' for equal weights, 'sqrt' for weights
+      proportional to the square root of the class frequency.
+
+  Returns:
+    A list of probabilities summing to 1.
+
+  Raises:
+    ValueError: on an unknown class_sampling.
+  """
+  if class_sampling == 'uniform':
+    weights = [1.0 for _ in counts]
+  elif class_sampling == 'sqrt':
+    weights = [count ** 0.5 for count in counts]
+  else:
+    raise ValueError('Unknown class_sampling %s, expected one of %s' %
+                     (class_sampling, CLASS_SAMPLINGS))
+  total = sum(weights)
+  return [weight / total for weight in weights]
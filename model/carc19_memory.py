@@ -0,0 +1,200 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Memory accounting of the CARC-19 pipeline.
+
+The helpers measure three stages:
+
+  input queues  bytes held by every queue of the input pipeline, from the
+                queue sizes and the static shapes of their elements.
+  device        high-water mark of the bytes allocated on the device running
+                the model since the process started, when TensorFlow
+                exposes the allocator statistics. It never drops, a rise
+                between two logged steps shows a new peak.
+  host          resident and peak resident memory of this process.
+
+carc19_train.py --log_memory prints them with the training log. Run alone,
+this binary prints the activation bytes of every layer of inference() and
+the capacity of the training queues, to size --batch_size and
+--shuffle_buffer_mb before a run:
+
+  python carc19_memory.py --batch_size=128 --image_size=160
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import resource
+
+import tensorflow as tf
+
+import carc19
+
+FLAGS = tf.app.flags.FLAGS
+
+MB = 1024.0 * 1024.0
+
+
+def _element_bytes(queue):
+  """Bytes of one element of a queue, None if its shapes are not static."""
+  total = 0
+  for shape, dtype in zip(queue.shapes, queue.dtypes):
+    if not shape.is_fully_defined() or dtype == tf.string:
+      return None
+    total += shape.num_elements() * dtype.size
+  return total
+
+
+def queue_bytes(graph=None):
+  """Build an op summing the bytes held by the input queues.
+
+  Queues of strings, like the filename queues, are left out.
+
+  Args:
+    graph: Graph holding the queue runners, defaults to the default graph.
+
+  Returns:
+    A float32 scalar Tensor of bytes, or None if no queue qualifies.
+  """
+  graph = graph or tf.get_default_graph()
+  terms = []
+  for qr in graph.get_collection(tf.GraphKeys.QUEUE_RUNNERS):
+    element_bytes = _element_bytes(qr.queue)
+    if element_bytes:
+      terms.append(tf.cast(qr.queue.size(), tf.float32) * element_bytes)
+  if not terms:
+    return None
+  return tf.add_n(terms, name='input_queue_bytes')
+
+
+def queue_capacities(graph=None):
+  """List (queue name, capacity in bytes) of the input queues."""
+  graph = graph or tf.get_default_graph()
+  capacities = []
+  for qr in graph.get_collection(tf.GraphKeys.QUEUE_RUNNERS):
+    element_bytes = _element_bytes(qr.queue)
+    if element_bytes:
+      capacity = qr.queue.queue_ref.op.get_attr('capacity')
+      capacities.append((qr.queue.name, capacity * element_bytes))
+  return capacities
+
+
+def device_high_water_bytes():
+  """Build an op reading the device allocator's high-water mark.
+
+  MaxBytesInUse is the peak over the lifetime of the process, not over the
+  step that runs the op.
+
+  Returns:
+    An int64 scalar Tensor, or None if this TensorFlow build has no
+    allocator statistics op.
+  """
+  try:
+    # pylint: disable=g-import-not-at-top
+    from tensorflow.contrib import memory_stats
+  except ImportError:
+    return None
+  return memory_stats.MaxBytesInUse()
+
+
+def host_memory():
+  """Return (resident bytes, peak resident bytes) of this process."""
+  # ru_maxrss is in KB on Linux.
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+  try:
+    with open('/proc/self/statm') as statm:
+      resident = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except IOError:  # No procfs, e.g. on macOS.
+    resident = peak
+  return resident, peak
+
+
+def activation_report(graph):
+  """Bytes of the activations of every layer for one example.
+
+  Activations are the outputs of ops whose batch dimension is unknown, the
+  model being built on a [None, size, size, 3] placeholder; variables and
+  constants have static shapes and are left out.
+
+  Args:
+    graph: Graph holding a model built by carc19.inference().
+
+  Returns:
+    A list of (layer, bytes per example) tuples in graph order.
+  """
+  layers = []
+  sizes = {}
+  for op in graph.get_operations():
+    for output in op.outputs:
+      shape = output.get_shape()
+      if (shape.ndims is None or shape.ndims < 2 or
+          shape[0].value is not None or
+          not shape[1:].is_fully_defined()):
+        continue
+      layer = op.name.split('/')[0]
+      if layer not in sizes:
+        layers.append(layer)
+        sizes[layer] = 0
+      sizes[layer] += shape[1:].num_elements() * output.dtype.size
+  return [(layer, sizes[layer]) for layer in layers]
+
+
+def report():
+  """Print per-layer activation memory, parameters and queue capacities."""
+  with tf.Graph().as_default() as g:
+    dtype = tf.float16 if FLAGS.use_fp16 else tf.float32
+    images = tf.placeholder(dtype, [None, FLAGS.image_size, FLAGS.image_size,
+                                    3])
+    carc19.inference(images)
+    rows = activation_report(g)
+    param_bytes = sum(
+        var.get_shape().num_elements() * var.dtype.base_dtype.size
+        for var in tf.trainable_variables())
+
+  print('batch_size=%d image_size=%d model_widths=%s' % (
+      FLAGS.batch_size, FLAGS.image_size, FLAGS.model_widths or 'full'))
+  print('%-16s | %12s | %12s' % ('layer', 'KB/example', 'MB/batch'))
+  for layer, size in rows:
+    print('%-16s | %12.1f | %12.1f' % (layer, size / 1024.0,
+                                       size * FLAGS.batch_size / MB))
+  forward = sum(size for _, size in rows) * FLAGS.batch_size
+  print('%-16s | %12.1f | %12.1f' % (
+      'total', forward / FLAGS.batch_size / 1024.0, forward / MB))
+  # Training keeps the forward activations for the backward pass and about
+  # as much again in gradients; the weights have an EMA copy, a gradient
+  # and one optimizer slot.
+  print('parameters: %.1f MB, training estimate: %.1f MB on the device' % (
+      param_bytes / MB, (2 * forward + 4 * param_bytes) / MB))
+
+  try:
+    with tf.Graph().as_default() as g:
+      carc19.train_inputs()
+      capacities = queue_capacities(g)
+  except (IOError, OSError) as e:
+    print('No training queues, %s' % e)
+    return
+  for name, capacity in capacities:
+    print('queue %-40s capacity %8.1f MB' % (name, capacity / MB))
+  print('queues total: %.1f MB on the host' % (
+      sum(capacity for _, capacity in capacities) / MB))
+
+
+def main(argv=None):  # pylint: disable=unused-argument
+  report()
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -0,0 +1,59 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for the carc19 memory accounting."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+import carc19_memory
+
+
+class CARC19MemoryTest(tf.test.TestCase):
+
+  def testActivationReport(self):
+    with tf.Graph().as_default() as g:
+      images = tf.placeholder(tf.float32, [None, 4, 4, 3], name='images')
+      with tf.name_scope('conv1'):
+        kernel = tf.zeros([3, 3, 3, 2])  # Static shape, not an activation.
+        conv = tf.nn.relu(
+            tf.nn.conv2d(images, kernel, [1, 1, 1, 1], padding='SAME'))
+      with tf.name_scope('local3'):
+        tf.reshape(conv, [-1, 32])
+    # conv1 counts the conv2d and the relu outputs, 4 * 4 * 2 floats each.
+    self.assertEqual([('images', 192), ('conv1', 256), ('local3', 128)],
+                     carc19_memory.activation_report(g))
+
+  def testQueueBytes(self):
+    with self.test_session() as sess:
+      self.assertIsNone(carc19_memory.queue_bytes())
+      queue = tf.FIFOQueue(10, [tf.float32], shapes=[[2, 3]])
+      enqueue = queue.enqueue([tf.zeros([2, 3])])
+      tf.train.add_queue_runner(tf.train.QueueRunner(queue, [enqueue]))
+      # Strings have no static size and are left out.
+      names = tf.FIFOQueue(10, [tf.string], shapes=[[]])
+      tf.train.add_queue_runner(tf.train.QueueRunner(
+          names, [names.enqueue([tf.constant('a')])]))
+      total = carc19_memory.queue_bytes()
+      for _ in range(3):
+        sess.run(enqueue)
+      self.assertEqual(3 * 2 * 3 * 4, sess.run(total))
+
+
+if __name__ == '__main__':
+  tf.test.main()
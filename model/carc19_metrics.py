@@ -0,0 +1,216 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Machine-readable metrics of CARC-19 training and evaluation.
+
+carc19_train.py and carc19_eval.py record the metrics of METRICS, one
+schema for both, in two ways:
+
+  --metrics_file  one JSON object per line and record() call:
+                    {"time": 1500000000.0, "source": "train", "step": 100,
+                     "metrics": {"loss": 1.25, "examples_per_sec": 410.0}}
+  --metrics_port  a local HTTP endpoint serving the current values in the
+                  Prometheus text format at /metrics: gauges hold the last
+                  value, counters a running total and histograms cumulative
+                  bucket counts.
+
+The workers of a distributed run share the flags: worker n serves on
+--metrics_port + n, and its events and samples carry task n.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import threading
+import time
+
+from six.moves import BaseHTTPServer
+import tensorflow as tf
+
+FLAGS = tf.app.flags.FLAGS
+
+tf.app.flags.DEFINE_string('metrics_file', '',
+                           """Append metric events as JSON lines to this """
+                           """file. Empty disables.""")
+tf.app.flags.DEFINE_integer('metrics_port', 0,
+                            """Serve the metrics at """
+                            """http://localhost:<port>/metrics. 0 """
+                            """disables.""")
+
+# Upper bounds, in seconds, of the histogram buckets.
+SECONDS_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0,
+                   60.0)
+
+# The metric schema: name -> (kind, help). Metric names are exported with
+# the 'carc19_' prefix.
+METRICS = {
+    'step_time_seconds': ('gauge', 'Mean wall time of a training step over '
+                          'the last log interval.'),
+    'examples_per_sec': ('gauge', 'Training throughput.'),
+    'input_queue_size': ('gauge', 'Examples waiting in the input queues.'),
+    'loss': ('gauge', 'Total training loss.'),
+    'steps_total': ('counter', 'Training steps run by this process.'),
+    'checkpoint_save_seconds': ('histogram', 'Wall time of a checkpoint '
+                                'save.'),
+    'validation_precision': ('gauge', 'Precision @ 1 of the in-training '
+                             'validation subset.'),
+    'input_queue_bytes': ('gauge', 'Bytes held by the input queues.'),
+    'device_high_water_bytes': ('gauge', 'Peak bytes allocated on the '
+                                'device since the process started.'),
+    'host_rss_bytes': ('gauge', 'Resident memory of the process.'),
+    'host_peak_rss_bytes': ('gauge', 'Peak resident memory of the process.'),
+    'eval_precision': ('gauge', 'Precision @ 1 of carc19_eval.py.'),
+    'eval_train_precision': ('gauge', 'Precision @ 1 of the training subset '
+                             'scored by carc19_eval.py.'),
+    'eval_examples_per_sec': ('gauge', 'Evaluation throughput.'),
+}
+
+
+class Metrics(object):
+  """Records metric values to a JSON lines file and a scrape endpoint."""
+
+  def __init__(self, source, metrics_file=None, port=0, task=None):
+    """Open the outputs.
+
+    Args:
+      source: 'train' or 'eval', written with every event.
+      metrics_file: path of the JSON lines file, None to not write one.
+      port: port of the scrape endpoint, 0 to not serve one.
+      task: optional int, index of the worker writing to a file or scraped
+        along with other workers, written with every event.
+    """
+    self._source = source
+    self._task = task
+    self._labels = 'source="%s"' % source
+    if task is not None:
+      self._labels += ',task="%d"' % task
+    self._lock = threading.Lock()
+    self._values = {}
+    self._file = open(metrics_file, 'a') if metrics_file else None
+    self._server = None
+    if port:
+      self._server = BaseHTTPServer.HTTPServer(('localhost', port),
+                                               self._handler())
+      thread = threading.Thread(target=self._server.serve_forever)
+      thread.daemon = True
+      thread.start()
+
+  def record(self, step, values):
+    """Record metric values observed at a global step.
+
+    Args:
+      step: int, global step the values belong to.
+      values: dict from METRICS names to numbers. Histograms take one
+        observation, counters are incremented by the value.
+
+    Raises:
+      ValueError: on a name missing from METRICS.
+    """
+    for name in values:
+      if name not in METRICS:
+        raise ValueError('Unknown metric %s, expected one of %s' %
+                         (name, sorted(METRICS)))
+    with self._lock:
+      for name, value in values.items():
+        value = float(value)
+        kind = METRICS[name][0]
+        if kind == 'gauge':
+          self._values[name] = value
+        elif kind == 'counter':
+          self._values[name] = self._values.get(name, 0.0) + value
+        else:
+          counts, total, count = self._values.get(
+              name, ([0] * len(SECONDS_BUCKETS), 0.0, 0))
+          counts = [bucket_count + (value <= bound) for bucket_count, bound
+                    in zip(counts, SECONDS_BUCKETS)]
+          self._values[name] = (counts, total + value, count + 1)
+      if self._file:
+        event = {'time': time.time(), 'source': self._source,
+                 'step': int(step),
+                 'metrics': dict((name, float(value))
+                                 for name, value in values.items())}
+        if self._task is not None:
+          event['task'] = self._task
+        self._file.write(json.dumps(event) + '\n')
+        self._file.flush()
+
+  def exposition(self):
+    """The current values in the Prometheus text format."""
+    lines = []
+    with self._lock:
+      for name in sorted(self._values):
+        kind, help_text = METRICS[name]
+        metric = 'carc19_' + name
+        lines.append('# HELP %s %s' % (metric, help_text))
+        lines.append('# TYPE %s %s' % (metric, kind))
+        if kind != 'histogram':
+          lines.append('%s{%s} %r' % (metric, self._labels,
+                                      self._values[name]))
+          continue
+        counts, total, count = self._values[name]
+        for bound, bucket_count in zip(SECONDS_BUCKETS, counts):
+          lines.append('%s_bucket{%s,le="%r"} %d' % (
+              metric, self._labels, bound, bucket_count))
+        lines.append('%s_bucket{%s,le="+Inf"} %d' % (metric, self._labels,
+                                                      count))
+        lines.append('%s_sum{%s} %r' % (metric, self._labels, total))
+        lines.append('%s_count{%s} %d' % (metric, self._labels, count))
+    return '\n'.join(lines) + '\n'
+
+  def _handler(self):
+    metrics = self
+
+    class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+      """Serves GET /metrics."""
+
+      def do_GET(self):  # pylint: disable=invalid-name
+        if self.path != '/metrics':
+          self.send_error(404)
+          return
+        body = metrics.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):  # Keep scrapes out of the training log.
+        pass
+
+    return _Handler
+
+  def close(self):
+    """Stop serving and close the file."""
+    if self._server:
+      self._server.shutdown()
+      self._server.server_close()
+    if self._file:
+      self._file.close()
+
+
+def from_flags(source, task=None):
+  """Build the Metrics configured by --metrics_file and --metrics_port.
+
+  Args:
+    source: 'train' or 'eval'.
+    task: index of this worker in a distributed run, None otherwise. The
+      endpoint is then served on --metrics_port + task.
+  """
+  port = FLAGS.metrics_port
+  if port and task is not None:
+    port += task
+  return Metrics(source, metrics_file=FLAGS.metrics_file or None, port=port,
+                 task=task)
@@ -0,0 +1,72 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for the carc19 metrics stream."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+import tensorflow as tf
+
+import carc19_metrics
+
+
+class CARC19MetricsTest(tf.test.TestCase):
+
+  def testRecord(self):
+    path = os.path.join(self.get_temp_dir(), 'metrics.jsonl')
+    metrics = carc19_metrics.Metrics('train', metrics_file=path)
+    metrics.record(10, {'loss': 2.0, 'steps_total': 10,
+                        'checkpoint_save_seconds': 0.15})
+    metrics.record(20, {'loss': 1.5, 'steps_total': 10,
+                        'checkpoint_save_seconds': 0.3})
+    metrics.close()
+
+    with open(path) as f:
+      events = [json.loads(line) for line in f]
+    self.assertEqual([10, 20], [event['step'] for event in events])
+    self.assertEqual(1.5, events[1]['metrics']['loss'])
+    self.assertNotIn('task', events[0])
+
+    text = metrics.exposition()
+    self.assertIn('carc19_loss{source="train"} 1.5', text)
+    self.assertIn('carc19_steps_total{source="train"} 20.0', text)
+    self.assertIn(
+        'carc19_checkpoint_save_seconds_bucket{source="train",le="0.2"} 1',
+        text)
+    self.assertIn('carc19_checkpoint_save_seconds_count{source="train"} 2',
+                  text)
+
+  def testTask(self):
+    path = os.path.join(self.get_temp_dir(), 'task.jsonl')
+    metrics = carc19_metrics.Metrics('train', metrics_file=path, task=1)
+    metrics.record(5, {'step_time_seconds': 0.25})
+    metrics.close()
+    with open(path) as f:
+      self.assertEqual(1, json.loads(f.readline())['task'])
+    self.assertIn('carc19_step_time_seconds{source="train",task="1"} 0.25',
+                  metrics.exposition())
+
+  def testUnknownMetric(self):
+    with self.assertRaises(ValueError):
+      carc19_metrics.Metrics('eval').record(0, {'precision': 1.0})
+
+
+if __name__ == '__main__':
+  tf.test.main()
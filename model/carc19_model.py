@@ -0,0 +1,608 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""The CARC-19 network and the flags that shape it.
+
+Everything needed to build and restore the model for inference lives here,
+so that carc19_predict.py does not define the input pipeline and training
+flags of carc19.py. carc19.py re-exports these names.
+"""
+# pylint: disable=missing-docstring
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import contextlib
+import re
+
+import tensorflow as tf
+
+import carc19_input
+
+FLAGS = tf.app.flags.FLAGS
+
+# Basic model parameters.
+# TODO tf_home must be changed to be your tensorflow working dir. Structure like:
+# ex. ${tf_home}/tmp/carc19/{label_for_test.dat,label_for_train.dat,image/...}
+# tf_home = /home/work/tensorflow
+# mkdir -p /home/work/tensorflow/tmp
+# mv small4w /home/work/tensorflow/tmp/carc19   
+# OR mv big34w /home/work/tensorflow/tmp/carc19
+# cd ???/carc19/model
+# python carc19_train.py
+tf.app.flags.DEFINE_string('tf_home', '/home/xiusir/WorkShop/TensorFlow/MyFirstModel',
+                           """Basic path containing working directories, """
+                           """as data_dir, eval_dir, checkpoint_dir, train_dir""")
+tf.app.flags.DEFINE_integer('batch_size', 32,
+                            """Number of images to process in a batch.""")
+tf.app.flags.DEFINE_string('data_dir', '%s/tmp/carc19/' % FLAGS.tf_home,
+                           """Path to the CARC-19 data directory.""")
+tf.app.flags.DEFINE_boolean('use_fp16', False,
+                            """Train the model using fp16.""")
+tf.app.flags.DEFINE_string('raw_mode', '',
+                           """Read raw-size jpegs and bring them to """
+                           """IMAGE_SIZE while decoding: 'letterbox' or """
+                           """'crop'. Empty for preprocessed images.""")
+tf.app.flags.DEFINE_integer('jpeg_decode_ratio', 1,
+                            """Downscale jpegs by 1, 2, 4 or 8 during """
+                            """decoding.""")
+tf.app.flags.DEFINE_integer('image_size', carc19_input.IMAGE_SIZE,
+                            """Side of the square images fed to the """
+                            """network, e.g. 128, 160 or 256.""")
+tf.app.flags.DEFINE_boolean('global_pool', False,
+                            """Average pool the last conv layer over space """
+                            """before local6, so that the weights do not """
+                            """depend on image_size.""")
+tf.app.flags.DEFINE_string('stem', 'conv11',
+                           """First layer of the network: 'conv11' (11x11 """
+                           """conv at stride 1 then a stride 4 pool), """
+                           """'strided' (11x11 conv at stride 4) or """
+                           """'separable' (depthwise-separable 11x11 conv """
+                           """at stride 4).""")
+tf.app.flags.DEFINE_boolean('dataset_normalization', False,
+                            """Normalize with the per-channel mean and std """
+                            """cached by carc19_stats.py instead of per """
+                            """image standardization.""")
+tf.app.flags.DEFINE_integer('tta_views', 1,
+                            """Test-time augmentation for eval and predict: """
+                            """average the logits of this many views of """
+                            """each image, see TTA_VIEWS.""")
+tf.app.flags.DEFINE_string('checkpoint_dir',
+                           '%s/tmp/carc19_train' % FLAGS.tf_home,
+                           """Directory where to read model checkpoints.""")
+tf.app.flags.DEFINE_string('norm', 'lrn',
+                           """Normalization after pool1, conv2 and conv5: """
+                           """'lrn', 'batch_norm' or 'none'.""")
+tf.app.flags.DEFINE_string('model_widths', '',
+                           """Comma separated output widths of conv1, """
+                           """conv2, conv3, conv5 and local6, for the """
+                           """smaller models of carc19_distill.py and """
+                           """carc19_prune.py. Empty for the full model.""")
+tf.app.flags.DEFINE_string('xla', '',
+                           """XLA JIT compilation: 'model' compiles """
+                           """inference(), 'train' also the gradients and """
+                           """loss averages of the train step. Empty """
+                           """disables.""")
+
+
+# Global constants describing the CARC-19 data set.
+IMAGE_SIZE = carc19_input.IMAGE_SIZE
+NUM_CLASSES = carc19_input.NUM_CLASSES
+
+MOVING_AVERAGE_DECAY = 0.9999     # The decay to use for the moving average.
+BATCH_NORM_DECAY = 0.997           # Decay of the batch norm moving statistics.
+BATCH_NORM_EPSILON = 1e-3          # Added to the variance in batch norm.
+
+
+# If a model is trained with multiple GPUs, prefix all Op names with tower_name
+# to differentiate the operations. Note that this prefix is removed from the
+# names of the summaries when visualizing a model.
+TOWER_NAME = 'tower'
+
+
+
+def _activation_summary(x):
+  """Helper to create summaries for activations.
+
+  Creates a summary that provides a histogram of activations.
+  Creates a summary that measures the sparsity of activations.
+
+  Args:
+    x: Tensor
+  Returns:
+    nothing
+  """
+  # Remove 'tower_[0-9]/' from the name in case this is a multi-GPU training
+  # session. This helps the clarity of presentation on tensorboard.
+  tensor_name = re.sub('%s_[0-9]*/' % TOWER_NAME, '', x.op.name)
+  tf.summary.histogram(tensor_name + '/activations', x)
+  tf.summary.scalar(tensor_name + '/sparsity',
+                                       tf.nn.zero_fraction(x))
+
+
+def _variable_on_cpu(name, shape, initializer, use_cpu=True, trainable=True):
+  """Helper to create a Variable stored on CPU memory.
+
+  Args:
+    name: name of the variable
+    shape: list of ints
+    initializer: initializer for Variable
+    trainable: whether the optimizer updates the Variable
+
+  Returns:
+    Variable Tensor
+  """
+  # tf.get_variable() lets a second tower, like the in-process validation of
+  # carc19_train.py, share the weights under a reusing variable scope.
+  dtype = tf.float16 if FLAGS.use_fp16 else tf.float32
+  if use_cpu:
+    with tf.device('/cpu:0'):
+      var = tf.get_variable(name, shape, initializer=initializer, dtype=dtype,
+                            trainable=trainable)
+  else:
+    var = tf.get_variable(name, shape, initializer=initializer, dtype=dtype,
+                          trainable=trainable)
+
+  return var
+
+
+def _variable_with_weight_decay(name, shape, stddev, wd):
+  """Helper to create an initialized Variable with weight decay.
+
+  Note that the Variable is initialized with a truncated normal distribution.
+  A weight decay is added only if one is specified.
+
+  Args:
+    name: name of the variable
+    shape: list of ints
+    stddev: standard deviation of a truncated Gaussian
+    wd: add L2Loss weight decay multiplied by this float. If None, weight
+        decay is not added for this Variable.
+
+  Returns:
+    Variable Tensor
+  """
+  dtype = tf.float16 if FLAGS.use_fp16 else tf.float32
+  var = _variable_on_cpu(
+      name,
+      shape,
+      tf.truncated_normal_initializer(stddev=stddev, dtype=dtype))
+  if wd is not None:
+    weight_decay = tf.multiply(tf.nn.l2_loss(var), wd, name='weight_loss')
+    tf.add_to_collection('losses', weight_decay)
+  return var
+
+
+def dataset_stats():
+  """Per-channel (mean, std) if --dataset_normalization is set, else None.
+
+  Raises:
+    IOError: if the statistics have not been computed by carc19_stats.py.
+  """
+  if not FLAGS.dataset_normalization:
+    return None
+  return carc19_input.read_dataset_stats(FLAGS.data_dir)
+
+
+STEMS = ('conv11', 'strided', 'separable')
+NORMS = ('lrn', 'batch_norm', 'none')
+# Output widths of conv1, conv2, conv3, conv5 and local6 of the full model.
+MODEL_WIDTHS = (32, 96, 192, 128, 1024)
+XLA_MODES = ('model', 'train')
+
+
+@contextlib.contextmanager
+def _no_scope():
+  yield
+
+
+@contextlib.contextmanager
+def no_summaries():
+  """Keep the summaries built in this scope out of tf.summary.merge_all().
+
+  For the extra towers of a graph, e.g. test-time views or a train-eval
+  subset, whose activation summaries would be mixed with the main tower's.
+  """
+  summaries = tf.get_collection_ref(tf.GraphKeys.SUMMARIES)
+  num_summaries = len(summaries)
+  try:
+    yield
+  finally:
+    del summaries[num_summaries:]
+
+
+def _jit_scope(enabled):
+  """Scope marking the ops built in it for XLA JIT compilation.
+
+  Unlike the session-wide global_jit_level, the scope also compiles on CPU.
+  Ops XLA cannot compile, like variable updates, are left out of the
+  compiled clusters.
+
+  Args:
+    enabled: Python bool, False returns a scope that does nothing.
+
+  Returns:
+    A context manager.
+
+  Raises:
+    ValueError: on an unknown FLAGS.xla.
+  """
+  if FLAGS.xla and FLAGS.xla not in XLA_MODES:
+    raise ValueError('Unknown xla %s, expected one of %s' % (FLAGS.xla,
+                                                             XLA_MODES))
+  if not enabled:
+    return _no_scope()
+  return tf.contrib.compiler.jit.experimental_jit_scope()
+
+
+def parse_widths(widths):
+  """Parse a comma separated list of layer widths.
+
+  Args:
+    widths: string like '16,48,96,64,256', empty for MODEL_WIDTHS.
+
+  Returns:
+    A tuple of len(MODEL_WIDTHS) ints.
+
+  Raises:
+    ValueError: if the number of widths is wrong.
+  """
+  if not widths:
+    return MODEL_WIDTHS
+  result = tuple(int(width) for width in widths.split(','))
+  if len(result) != len(MODEL_WIDTHS):
+    raise ValueError('Expected %d widths for conv1, conv2, conv3, conv5 and '
+                     'local6, got %s' % (len(MODEL_WIDTHS), widths))
+  return result
+
+
+def _batch_norm(x, is_training):
+  """Batch normalization over the batch and spatial dimensions.
+
+  While training, normalizes with the batch statistics and registers the
+  update of the moving mean and variance in tf.GraphKeys.UPDATE_OPS. In
+  evaluation, normalizes with the moving statistics. These are not
+  trainable, so an ExponentialMovingAverage restore loads them by their own
+  name.
+
+  Args:
+    x: 4-D Tensor.
+    is_training: Python bool.
+
+  Returns:
+    Normalized Tensor of the shape of x.
+  """
+  channels = x.get_shape()[-1].value
+  beta = _variable_on_cpu('beta', [channels], tf.constant_initializer(0.0))
+  gamma = _variable_on_cpu('gamma', [channels], tf.constant_initializer(1.0))
+  moving_mean = _variable_on_cpu('moving_mean', [channels],
+                                 tf.constant_initializer(0.0),
+                                 trainable=False)
+  moving_variance = _variable_on_cpu('moving_variance', [channels],
+                                     tf.constant_initializer(1.0),
+                                     trainable=False)
+  if is_training:
+    mean, variance = tf.nn.moments(x, [0, 1, 2])
+    update_mean = tf.assign_sub(
+        moving_mean, (moving_mean - mean) * (1.0 - BATCH_NORM_DECAY))
+    update_variance = tf.assign_sub(
+        moving_variance,
+        (moving_variance - variance) * (1.0 - BATCH_NORM_DECAY))
+    tf.add_to_collection(tf.GraphKeys.UPDATE_OPS, update_mean)
+    tf.add_to_collection(tf.GraphKeys.UPDATE_OPS, update_variance)
+  else:
+    mean, variance = moving_mean, moving_variance
+  return tf.nn.batch_normalization(x, mean, variance, beta, gamma,
+                                   BATCH_NORM_EPSILON)
+
+
+def _normalize(x, name, is_training):
+  """Apply the normalization selected by FLAGS.norm.
+
+  Args:
+    x: 4-D Tensor.
+    name: name of the layer, e.g. 'norm1'.
+    is_training: Python bool.
+
+  Returns:
+    Normalized Tensor of the shape of x.
+
+  Raises:
+    ValueError: on an unknown FLAGS.norm.
+  """
+  if FLAGS.norm == 'lrn':
+    return tf.nn.lrn(x, 4, bias=1.0, alpha=0.001 / 9.0, beta=0.75, name=name)
+  elif FLAGS.norm == 'batch_norm':
+    with tf.variable_scope(name):
+      return _batch_norm(x, is_training)
+  elif FLAGS.norm == 'none':
+    return tf.identity(x, name=name)
+  raise ValueError('Unknown norm %s, expected one of %s' % (FLAGS.norm, NORMS))
+
+
+def _stem(images, stem, width):
+  """Build the first layer, which reduces the input resolution by 4.
+
+  The original 'conv11' stem computes the 11x11 conv at every pixel and then
+  throws away 15 of 16 outputs in pool1. The other stems apply the stride in
+  the conv itself and produce the same [batch, size/4, size/4, width] shape.
+
+  Args:
+    images: Images returned from train_inputs() or evaluate_inputs().
+    stem: one of STEMS.
+    width: number of output channels.
+
+  Returns:
+    pool1: 4-D Tensor of [batch_size, size/4, size/4, width].
+
+  Raises:
+    ValueError: on an unknown stem.
+  """
+  if stem not in STEMS:
+    raise ValueError('Unknown stem %s, expected one of %s' % (stem, STEMS))
+
+  # conv1
+  with tf.variable_scope('conv1') as scope:
+    if stem == 'separable':
+      depthwise = _variable_with_weight_decay('depthwise_weights',
+                                              shape=[11, 11, 3, 8],
+                                              stddev=5e-2,
+                                              wd=0.0)
+      pointwise = _variable_with_weight_decay('pointwise_weights',
+                                              shape=[1, 1, 24, width],
+                                              stddev=5e-2,
+                                              wd=0.0)
+      conv = tf.nn.separable_conv2d(images, depthwise, pointwise,
+                                    [1, 4, 4, 1], padding='SAME')
+    else:
+      stride = 4 if stem == 'strided' else 1
+      kernel = _variable_with_weight_decay('weights',
+                                           shape=[11, 11, 3, width],
+                                           stddev=5e-2,
+                                           wd=0.0)
+      conv = tf.nn.conv2d(images, kernel, [1, stride, stride, 1],
+                          padding='SAME')
+    biases = _variable_on_cpu('biases', [width],
+                              tf.constant_initializer(0.0))
+    pre_activation = tf.nn.bias_add(conv, biases)
+    conv1 = tf.nn.relu(pre_activation, name=scope.name)
+    _activation_summary(conv1)
+
+  if stem != 'conv11':
+    return conv1
+
+  # pool1
+  return tf.nn.max_pool(conv1, ksize=[1, 3, 3, 1], strides=[1, 4, 4, 1],
+                        padding='SAME', name='pool1')
+
+
+def inference(images, is_training=False, widths=None, stem=None):
+  """Build the CARC-19 model.
+
+  Args:
+    images: Images returned from distorted_inputs() or inputs().
+    is_training: Python bool, whether batch norm uses the batch statistics
+      and updates its moving averages.
+    widths: output widths of conv1, conv2, conv3, conv5 and local6,
+      defaults to FLAGS.model_widths.
+    stem: one of STEMS, defaults to FLAGS.stem.
+
+  Returns:
+    Logits.
+  """
+  with _jit_scope(FLAGS.xla in XLA_MODES):
+    return _inference(images, is_training, widths, stem)
+
+
+def _inference(images, is_training, widths, stem):
+  """Build the layers of inference()."""
+  if widths is None:
+    widths = parse_widths(FLAGS.model_widths)
+  conv1_width, conv2_width, conv3_width, conv5_width, local6_width = widths
+  # We instantiate all variables using tf.get_variable() instead of
+  # tf.Variable() in order to share variables across multiple GPU training runs.
+  # If we only ran this model on a single GPU, we could simplify this function
+  # by replacing all instances of tf.get_variable() with tf.Variable().
+  #
+  # conv1 and pool1
+  pool1 = _stem(images, stem or FLAGS.stem, conv1_width)
+  # norm1
+  norm1 = _normalize(pool1, 'norm1', is_training)
+
+  # conv2
+  with tf.variable_scope('conv2') as scope:
+    kernel = _variable_with_weight_decay('weights',
+                                         shape=[5, 5, conv1_width,
+                                                conv2_width],
+                                         stddev=5e-2,
+                                         wd=0.0)
+    conv = tf.nn.conv2d(norm1, kernel, [1, 1, 1, 1], padding='SAME')
+    biases = _variable_on_cpu('biases', [conv2_width],
+                              tf.constant_initializer(0.1))
+    pre_activation = tf.nn.bias_add(conv, biases)
+    conv2 = tf.nn.relu(pre_activation, name=scope.name)
+    _activation_summary(conv2)
+
+  # norm2
+  norm2 = _normalize(conv2, 'norm2', is_training)
+  # pool2
+  pool2 = tf.nn.max_pool(norm2, ksize=[1, 3, 3, 1],
+                         strides=[1, 2, 2, 1], padding='SAME', name='pool2')
+
+  # conv3
+  with tf.variable_scope('conv3') as scope:
+    kernel = _variable_with_weight_decay('weights',
+                                         shape=[3, 3, conv2_width,
+                                                conv3_width],
+                                         stddev=5e-2,
+                                         wd=0.0)
+    conv = tf.nn.conv2d(pool2, kernel, [1, 1, 1, 1], padding='SAME')
+    biases = _variable_on_cpu('biases', [conv3_width],
+                              tf.constant_initializer(0.1))
+    pre_activation = tf.nn.bias_add(conv, biases)
+    conv3 = tf.nn.relu(pre_activation, name=scope.name)
+    _activation_summary(conv3)
+  #### norm3
+  ###norm3 = tf.nn.lrn(conv3, 4, bias=1.0, alpha=0.001 / 9.0, beta=0.75,
+  ###                  name='norm3')
+  #### pool3
+  ###pool3 = tf.nn.max_pool(norm3, ksize=[1, 3, 3, 1],
+  ###                       strides=[1, 2, 2, 1], padding='SAME', name='pool3')
+
+  #### conv4
+  ###with tf.variable_scope('conv4') as scope:
+  ###  kernel = _variable_with_weight_decay('weights',
+  ###                                       shape=[3, 3, 192, 256],
+  ###                                       stddev=5e-2,
+  ###                                       wd=0.0)
+  ###  conv = tf.nn.conv2d(layer3, kernel, [1, 1, 1, 1], padding='SAME')
+  ###  biases = _variable_on_cpu('biases', [256], tf.constant_initializer(0.1))
+  ###  pre_activation = tf.nn.bias_add(conv, biases)
+  ###  conv4 = tf.nn.relu(pre_activation, name=scope.name)
+  ###  _activation_summary(conv4)
+  #### norm4
+  ###norm4 = tf.nn.lrn(conv4, 4, bias=1.0, alpha=0.001 / 9.0, beta=0.75,
+  ###                  name='norm4')
+  #### pool4
+  ###pool4 = tf.nn.max_pool(norm4, ksize=[1, 3, 3, 1],
+  ###                       strides=[1, 2, 2, 1], padding='SAME', name='pool3')
+
+  # conv5
+  with tf.variable_scope('conv5') as scope:
+    kernel = _variable_with_weight_decay('weights',
+                                         shape=[3, 3, conv3_width,
+                                                conv5_width],
+                                         stddev=5e-2,
+                                         wd=0.0)
+    conv = tf.nn.conv2d(conv3, kernel, [1, 1, 1, 1], padding='SAME')
+    biases = _variable_on_cpu('biases', [conv5_width],
+                              tf.constant_initializer(0.1))
+    pre_activation = tf.nn.bias_add(conv, biases)
+    conv5 = tf.nn.relu(pre_activation, name=scope.name)
+    _activation_summary(conv5)
+  # norm5
+  norm5 = _normalize(conv5, 'norm5', is_training)
+  # pool5
+  if FLAGS.global_pool:
+    # Average over all spatial positions: local6 then sees conv5_width
+    # features at any input resolution.
+    pool5 = tf.reduce_mean(norm5, axis=[1, 2], name='global_pool')
+  else:
+    pool5 = tf.nn.max_pool(norm5, ksize=[1, 3, 3, 1],
+                           strides=[1, 2, 2, 1], padding='SAME', name='pool3')
+
+  # local6
+  with tf.variable_scope('local6') as scope:
+    # Move everything into depth so we can perform a single matrix multiply.
+    # The batch dimension is left free for stacked test-time views.
+    dim = pool5.get_shape()[1:].num_elements()
+    reshape = tf.reshape(pool5, [-1, dim])
+    weights = _variable_with_weight_decay('weights',
+                                          shape=[dim, local6_width],
+                                          stddev=0.04, wd=0.004)
+    biases = _variable_on_cpu('biases', [local6_width],
+                              tf.constant_initializer(0.1))
+    local6 = tf.nn.relu(tf.matmul(reshape, weights) + biases, name=scope.name)
+    _activation_summary(local6)
+    # local6 doubles as an image embedding, see carc19_embed.py.
+    tf.add_to_collection('embeddings', local6)
+
+  #### local7
+  ###with tf.variable_scope('local7') as scope:
+  ###  weights = _variable_with_weight_decay('weights', shape=[1024, 512],
+  ###                                        stddev=0.04, wd=0.004)
+  ###  biases = _variable_on_cpu('biases', [512], tf.constant_initializer(0.1))
+  ###  local7 = tf.nn.relu(tf.matmul(layer6, weights) + biases, name=scope.name)
+  ###  _activation_summary(local7)
+
+  # linear layer(WX + b),
+  # We don't apply softmax here because
+  # tf.nn.sparse_softmax_cross_entropy_with_logits accepts the unscaled logits
+  # and performs the softmax internally for efficiency.
+  with tf.variable_scope('softmax_linear') as scope:
+    weights = _variable_with_weight_decay('weights',
+                                          [local6_width, NUM_CLASSES],
+                                          stddev=1.0/local6_width, wd=0.0)
+    biases = _variable_on_cpu('biases', [NUM_CLASSES],
+                              tf.constant_initializer(0.0))
+    softmax_linear = tf.add(tf.matmul(local6, weights), biases, name=scope.name)
+    _activation_summary(softmax_linear)
+
+  return softmax_linear
+
+
+# Views of test-time augmentation, in the order they are taken. A crop covers
+# TTA_CROP_FRACTION of the image side and is resized back to the input size.
+TTA_VIEWS = ('center', 'flip', 'crop_tl', 'crop_tr', 'crop_bl', 'crop_br',
+             'crop_center')
+TTA_CROP_FRACTION = 0.875
+
+# Class of a horizontally mirrored image: the mirror of a left-front view
+# (0) is a right-front view (1) and vice versa, the other classes are kept.
+HFLIP_CLASS_MAP = [1, 0] + list(range(2, NUM_CLASSES))
+
+
+def _tta_view(images, view):
+  """Build one test-time view of a batch of images."""
+  if view == 'center':
+    return images
+  if view == 'flip':
+    return tf.reverse(images, [2])
+  margin = 1.0 - TTA_CROP_FRACTION
+  top, left = {'crop_tl': (0.0, 0.0),
+               'crop_tr': (0.0, margin),
+               'crop_bl': (margin, 0.0),
+               'crop_br': (margin, margin),
+               'crop_center': (margin / 2, margin / 2)}[view]
+  batch_size = tf.shape(images)[0]
+  boxes = tf.tile([[top, left, top + TTA_CROP_FRACTION,
+                    left + TTA_CROP_FRACTION]], [batch_size, 1])
+  size = images.get_shape().as_list()[1:3]
+  return tf.image.crop_and_resize(images, boxes, tf.range(batch_size), size)
+
+
+def inference_tta(images, num_views):
+  """Average the logits of num_views augmented views of every image.
+
+  The views are stacked into one batch of num_views * batch_size images and
+  go through a single inference() call, so the cost grows linearly with
+  num_views without a Python loop over forward passes. With more than one
+  view, the tower adds no summaries to tf.GraphKeys.SUMMARIES.
+
+  Args:
+    images: Images returned from evaluate_inputs().
+    num_views: int in [1, len(TTA_VIEWS)], the first views of TTA_VIEWS are
+      used.
+
+  Returns:
+    Logits averaged over the views, of shape [batch_size, NUM_CLASSES].
+
+  Raises:
+    ValueError: if num_views is out of range.
+  """
+  if not 1 <= num_views <= len(TTA_VIEWS):
+    raise ValueError('num_views must be in [1, %d], got %d' %
+                     (len(TTA_VIEWS), num_views))
+  if num_views == 1:
+    return inference(images)
+
+  views = TTA_VIEWS[:num_views]
+  stacked = tf.concat([_tta_view(images, view) for view in views], 0)
+  with no_summaries():
+    logits = tf.split(inference(stacked), num_views, 0)
+  for i, view in enumerate(views):
+    if view == 'flip':
+      logits[i] = tf.gather(logits[i], HFLIP_CLASS_MAP, axis=1)
+  return tf.reduce_mean(tf.stack(logits), 0, name='tta_logits')
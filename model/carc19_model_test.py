@@ -0,0 +1,64 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for the carc19 test-time augmentation."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+import carc19_model
+
+FLAGS = tf.app.flags.FLAGS
+
+
+class CARC19TTATest(tf.test.TestCase):
+
+  def testFlipClassMap(self):
+    size = FLAGS.image_size
+    rng = np.random.RandomState(0)
+    feed = rng.randn(2, size, size, 3).astype(np.float32)
+    with self.test_session() as sess:
+      images = tf.placeholder(tf.float32, [None, size, size, 3])
+      carc19_model.inference(images)
+      num_summaries = len(tf.get_collection(tf.GraphKeys.SUMMARIES))
+      with tf.variable_scope(tf.get_variable_scope(), reuse=True):
+        logits = carc19_model.inference_tta(images, 2)
+      self.assertEqual(num_summaries,
+                       len(tf.get_collection(tf.GraphKeys.SUMMARIES)))
+
+      sess.run(tf.global_variables_initializer())
+      original = sess.run(logits, {images: feed})
+      mirrored = sess.run(logits, {images: feed[:, :, ::-1]})
+    # Averaging a view with its mirror, the mirrored image scores the
+    # mirrored classes: left-front and right-front views swap.
+    self.assertAllClose(original,
+                        mirrored[:, carc19_model.HFLIP_CLASS_MAP],
+                        rtol=1e-4, atol=1e-4)
+
+  def testNoSummaries(self):
+    with tf.Graph().as_default():
+      tf.summary.scalar('kept', tf.constant(1.0))
+      with carc19_model.no_summaries():
+        tf.summary.scalar('dropped', tf.constant(2.0))
+      self.assertEqual(['kept:0'], [summary.name for summary in
+                                    tf.get_collection(tf.GraphKeys.SUMMARIES)])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Classify jpeg files with a trained CARC-19 model.
+
+Usage:
+  python carc19_predict.py [--tta_views=4] a.jpg b.jpg ...
+
+Prints one tab separated line per file: file, class id, class name and
+probability. The moving average version of the weights is restored from
+--checkpoint_dir, like carc19_eval.py does. With --prediction_cache_dir,
+images seen before by the same checkpoint are not run through the model
+again, see carc19_cache.py.
+
+Only carc19_model is imported, not carc19, so the input pipeline and
+training flags are not defined.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+import numpy as np
+import tensorflow as tf
+
+import carc19_cache
+import carc19_input
+import carc19_model
+from carc19_class import CARC19_CLASS
+
+FLAGS = tf.app.flags.FLAGS
+
+
+class Predictor(object):
+  """Holds a restored model and classifies batches of encoded jpegs."""
+
+  def __init__(self, checkpoint_dir=None, cache=None):
+    """Build the graph and restore the latest checkpoint.
+
+    Args:
+      checkpoint_dir: Directory to restore from, defaults to
+        FLAGS.checkpoint_dir.
+      cache: optional carc19_cache.PredictionCache. Images already scored
+        by this checkpoint are then answered without a forward pass.
+
+    Raises:
+      IOError: if there is no checkpoint.
+    """
+    stats = carc19_model.dataset_stats()
+    self.graph = tf.Graph()
+    with self.graph.as_default():
+      self._jpegs = tf.placeholder(tf.string, [None], name='jpegs')
+      images = tf.map_fn(
+          lambda value: carc19_input.preprocess_jpeg(
+              value, decode_ratio=FLAGS.jpeg_decode_ratio,
+              raw_mode=FLAGS.raw_mode or None, image_size=FLAGS.image_size,
+              dataset_stats=stats),
+          self._jpegs, dtype=tf.float32, back_prop=False)
+      logits = carc19_model.inference_tta(images, FLAGS.tta_views)
+      self._probabilities = tf.nn.softmax(logits)
+
+      variable_averages = tf.train.ExponentialMovingAverage(
+          carc19_model.MOVING_AVERAGE_DECAY)
+      saver = tf.train.Saver(variable_averages.variables_to_restore())
+
+    ckpt = tf.train.get_checkpoint_state(checkpoint_dir or
+                                         FLAGS.checkpoint_dir)
+    if not (ckpt and ckpt.model_checkpoint_path):
+      raise IOError('No checkpoint file found')
+    self.sess = tf.Session(graph=self.graph)
+    saver.restore(self.sess, ckpt.model_checkpoint_path)
+    # Assuming model_checkpoint_path looks something like:
+    #   /my-favorite-path/carc19_train/model.ckpt-0,
+    # extract global_step from it.
+    self.global_step = int(
+        ckpt.model_checkpoint_path.split('/')[-1].split('-')[-1])
+    self.cache = cache
+
+  def predict(self, jpegs):
+    """Classify a list of jpeg-encoded images.
+
+    Args:
+      jpegs: list of str, encoded jpeg files.
+
+    Returns:
+      A [len(jpegs), NUM_CLASSES] numpy array of class probabilities.
+    """
+    if self.cache is None:
+      return self.sess.run(self._probabilities, {self._jpegs: jpegs})
+
+    rows = [self.cache.get(jpeg, self.global_step) for jpeg in jpegs]
+    misses = [i for i, row in enumerate(rows) if row is None]
+    if misses:
+      # Duplicates within the batch are scored once.
+      unique = list(collections.OrderedDict.fromkeys(
+          jpegs[i] for i in misses))
+      probabilities = self.sess.run(self._probabilities,
+                                    {self._jpegs: unique})
+      scored = dict(zip(unique, probabilities))
+      for jpeg, row in zip(unique, probabilities):
+        self.cache.put(jpeg, self.global_step, row)
+      for i in misses:
+        rows[i] = scored[jpegs[i]]
+    return np.stack(rows)
+
+
+def main(argv=None):
+  filenames = argv[1:]
+  if not filenames:
+    print('Usage: carc19_predict.py [flags] image.jpg ...')
+    return
+  cache = None
+  if FLAGS.prediction_cache_dir:
+    cache = carc19_cache.default_cache()
+  predictor = Predictor(cache=cache)
+  for start in range(0, len(filenames), FLAGS.batch_size):
+    batch = filenames[start:start + FLAGS.batch_size]
+    jpegs = [tf.gfile.GFile(filename, 'rb').read() for filename in batch]
+    probabilities = predictor.predict(jpegs)
+    for filename, row in zip(batch, probabilities):
+      label = int(row.argmax())
+      print(u'%s\t%d\t%s\t%.3f' % (filename, label, CARC19_CLASS[label],
+                                   row[label]))
+  if cache is not None:
+    print(cache.report())
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -0,0 +1,325 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Structured pruning of the CARC-19 model.
+
+For every fraction of --prune_levels, the channels of conv2, conv3, conv5
+and the neurons of local6 are ranked, the weakest fraction of each layer is
+removed and the remaining slices of every variable of --checkpoint_dir are
+written to a physically smaller model in --prune_dir/level_<fraction>. That
+model is fine-tuned for --prune_finetune_steps with carc19_train.py and
+evaluated with carc19_eval.py. A table of size, throughput and precision
+per level is printed at the end.
+
+Channels are ranked by 'magnitude', the L1 norm of their weights, or by
+'activation', their mean output on --prune_batches training batches.
+
+A pruned model is used with --model_widths set to the widths printed in the
+table, e.g.
+
+  python carc19_eval.py --checkpoint_dir=<prune_dir>/level_0.50 \\
+      --model_widths=32,48,96,64,512
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import carc19
+import carc19_eval
+import carc19_train
+
+FLAGS = tf.app.flags.FLAGS
+
+tf.app.flags.DEFINE_string('prune_dir', '%s/tmp/carc19_prune' % FLAGS.tf_home,
+                           """Directory of the pruned models.""")
+tf.app.flags.DEFINE_string('prune_levels', '0.25,0.5,0.75',
+                           """Comma separated fractions of channels to """
+                           """remove from each pruned layer.""")
+tf.app.flags.DEFINE_string('prune_criterion', 'magnitude',
+                           """Channel ranking: 'magnitude' or """
+                           """'activation'.""")
+tf.app.flags.DEFINE_integer('prune_batches', 20,
+                            """Training batches of the activation """
+                            """statistics.""")
+tf.app.flags.DEFINE_integer('prune_finetune_steps', 2000,
+                            """Training steps after pruning, 0 to only """
+                            """evaluate.""")
+
+PRUNE_CRITERIA = ('magnitude', 'activation')
+# Layers whose outputs are pruned, in MODEL_WIDTHS order after conv1.
+PRUNED_LAYERS = ('conv2', 'conv3', 'conv5', 'local6')
+# Layers producing the input and output channels of the variables of each
+# variable scope. None is not pruned.
+SCOPE_CHANNELS = {
+    'conv1': (None, None),
+    'norm1': (None, None),
+    'conv2': (None, 'conv2'),
+    'norm2': ('conv2', 'conv2'),
+    'conv3': ('conv2', 'conv3'),
+    'conv5': ('conv3', 'conv5'),
+    'norm5': ('conv5', 'conv5'),
+    'local6': ('conv5', 'local6'),
+    'softmax_linear': ('local6', None),
+}
+
+
+def _weight_name(reader, name):
+  """Name of the moving average of a variable if saved, else its own."""
+  average_name = name + '/ExponentialMovingAverage'
+  return average_name if reader.has_tensor(average_name) else name
+
+
+def magnitude_scores(reader):
+  """L1 norm of the weights of each output channel of the pruned layers.
+
+  Args:
+    reader: CheckpointReader of the model to prune.
+
+  Returns:
+    A dict from layer name to a 1-D numpy array of channel scores.
+  """
+  scores = {}
+  for layer in PRUNED_LAYERS:
+    weights = reader.get_tensor(_weight_name(reader, layer + '/weights'))
+    scores[layer] = np.abs(weights.reshape(-1, weights.shape[-1])).sum(axis=0)
+  return scores
+
+
+def activation_scores(checkpoint_path):
+  """Mean activation of each output channel on training batches.
+
+  Args:
+    checkpoint_path: checkpoint of the model to prune.
+
+  Returns:
+    A dict from layer name to a 1-D numpy array of channel scores.
+  """
+  with tf.Graph().as_default() as g:
+    images, _ = carc19.train_inputs()
+    carc19.inference(images)
+    # The relu of each layer is named after its scope, e.g. conv2/conv2.
+    means = {}
+    for layer in PRUNED_LAYERS:
+      activations = g.get_tensor_by_name('%s/%s:0' % (layer, layer))
+      axes = list(range(activations.get_shape().ndims - 1))
+      means[layer] = tf.reduce_mean(activations, axis=axes)
+
+    variable_averages = tf.train.ExponentialMovingAverage(
+        carc19.MOVING_AVERAGE_DECAY)
+    saver = tf.train.Saver(variable_averages.variables_to_restore())
+    with tf.Session() as sess:
+      saver.restore(sess, checkpoint_path)
+      coord = tf.train.Coordinator()
+      threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+      totals = dict((layer, 0.0) for layer in PRUNED_LAYERS)
+      for _ in range(FLAGS.prune_batches):
+        for layer, value in sess.run(means).items():
+          totals[layer] += value
+      coord.request_stop()
+      coord.join(threads, stop_grace_period_secs=10)
+  return dict((layer, total / FLAGS.prune_batches)
+              for layer, total in totals.items())
+
+
+def keep_indices(scores, fraction):
+  """Channels surviving the removal of the lowest scoring fraction.
+
+  Args:
+    scores: dict from layer name to channel scores.
+    fraction: float in [0, 1), share of channels removed per layer.
+
+  Returns:
+    A dict from layer name to the sorted int array of kept channels.
+  """
+  keep = {}
+  for layer, layer_scores in scores.items():
+    num_kept = max(1, int(round(len(layer_scores) * (1.0 - fraction))))
+    ranked = np.argsort(-layer_scores, kind='mergesort')
+    keep[layer] = np.sort(ranked[:num_kept])
+  return keep
+
+
+def prune_array(name, value, keep, conv5_width):
+  """Slice a saved variable to the kept channels.
+
+  Weights are sliced on their last two axes, input and output channels,
+  vectors on their only axis. The rows of local6/weights are the flattened
+  [height, width, conv5] outputs of pool5, so they are sliced per conv5
+  channel at every position.
+
+  Args:
+    name: variable name, e.g. 'conv3/weights/ExponentialMovingAverage'.
+    value: numpy array saved under name.
+    keep: dict from layer name to kept channels, see keep_indices().
+    conv5_width: conv5 width of the unpruned model.
+
+  Returns:
+    The sliced numpy array, or value if the variable is not pruned.
+  """
+  scope = name.split('/')[0]
+  if scope not in SCOPE_CHANNELS or value.ndim == 0:
+    return value
+  in_layer, out_layer = SCOPE_CHANNELS[scope]
+  if value.ndim == 1:
+    return value[keep[out_layer]] if out_layer else value
+  if out_layer:
+    value = value[..., keep[out_layer]]
+  if in_layer == 'conv5' and value.ndim == 2:
+    rows, cols = value.shape
+    value = value.reshape(rows // conv5_width, conv5_width, cols)
+    value = value[:, keep[in_layer], :].reshape(-1, cols)
+  elif in_layer:
+    value = value[..., keep[in_layer], :]
+  return value
+
+
+def pruned_widths(keep):
+  """MODEL_WIDTHS of the pruned model, conv1 is never pruned."""
+  widths = carc19.parse_widths(FLAGS.model_widths)
+  return (widths[0],) + tuple(len(keep[layer]) for layer in PRUNED_LAYERS)
+
+
+def write_pruned(reader, keep, widths, train_dir):
+  """Write the pruned model as a fresh checkpoint of carc19_train.py.
+
+  The complete training graph of the smaller model is built, so that the
+  checkpoint also holds the moving averages and optimizer slots restored by
+  carc19_train.py. Every variable also saved in the source checkpoint is
+  loaded with its pruned slice; the others, including global_step, keep
+  their initial value.
+
+  Args:
+    reader: CheckpointReader of the model to prune.
+    keep: dict from layer name to kept channels.
+    widths: MODEL_WIDTHS of the pruned model.
+    train_dir: directory of the new checkpoint.
+  """
+  conv5_width = carc19.parse_widths(FLAGS.model_widths)[3]
+  with tf.Graph().as_default():
+    global_step = tf.contrib.framework.get_or_create_global_step()
+    images = tf.zeros([FLAGS.batch_size, FLAGS.image_size, FLAGS.image_size,
+                       3])
+    labels = tf.zeros([FLAGS.batch_size], dtype=tf.int32)
+    logits = carc19.inference(images, is_training=True, widths=widths)
+    carc19.train(carc19.loss(logits, labels), global_step)
+
+    saver = tf.train.Saver()
+    with tf.Session() as sess:
+      sess.run(tf.global_variables_initializer())
+      for var in tf.global_variables():
+        name = var.op.name
+        if name == global_step.op.name or not reader.has_tensor(name):
+          continue
+        var.load(prune_array(name, reader.get_tensor(name), keep,
+                             conv5_width), sess)
+      tf.gfile.MakeDirs(train_dir)
+      saver.save(sess, os.path.join(train_dir, 'model.ckpt'),
+                 global_step=global_step)
+
+
+def checkpoint_bytes(train_dir):
+  """Size on disk of the latest checkpoint of train_dir."""
+  ckpt = tf.train.get_checkpoint_state(train_dir)
+  return sum(os.path.getsize(path)
+             for path in glob.glob(ckpt.model_checkpoint_path + '.*'))
+
+
+def num_params(widths):
+  """Number of trainable parameters of the model with these widths."""
+  with tf.Graph().as_default():
+    images = tf.zeros([1, FLAGS.image_size, FLAGS.image_size, 3])
+    carc19.inference(images, widths=widths)
+    return sum(var.get_shape().num_elements()
+               for var in tf.trainable_variables())
+
+
+def prune():
+  """Prune, fine-tune and evaluate at every level, then print the table.
+
+  Raises:
+    ValueError: on an unknown FLAGS.prune_criterion.
+  """
+  if FLAGS.prune_criterion not in PRUNE_CRITERIA:
+    raise ValueError('Unknown prune_criterion %s, expected one of %s' %
+                     (FLAGS.prune_criterion, PRUNE_CRITERIA))
+  ckpt = tf.train.get_checkpoint_state(FLAGS.checkpoint_dir)
+  if not (ckpt and ckpt.model_checkpoint_path):
+    print('No checkpoint file found')
+    return
+  reader = tf.train.NewCheckpointReader(ckpt.model_checkpoint_path)
+  if FLAGS.prune_criterion == 'magnitude':
+    scores = magnitude_scores(reader)
+  else:
+    scores = activation_scores(ckpt.model_checkpoint_path)
+
+  widths = carc19.parse_widths(FLAGS.model_widths)
+  result = carc19_eval.evaluate()
+  if result is None:
+    print('Evaluation of the unpruned model failed')
+    return
+  precision, examples_per_sec = result
+  rows = [(0.0, widths, num_params(widths),
+           checkpoint_bytes(FLAGS.checkpoint_dir), examples_per_sec,
+           precision)]
+
+  # carc19_train and carc19_eval read their settings from the flags.
+  saved_flags = (FLAGS.model_widths, FLAGS.train_dir, FLAGS.checkpoint_dir,
+                 FLAGS.max_steps)
+  try:
+    for level in [float(level) for level in FLAGS.prune_levels.split(',')]:
+      keep = keep_indices(scores, level)
+      level_widths = pruned_widths(keep)
+      level_dir = os.path.join(FLAGS.prune_dir, 'level_%.2f' % level)
+      write_pruned(reader, keep, level_widths, level_dir)
+
+      FLAGS.model_widths = ','.join(str(width) for width in level_widths)
+      FLAGS.train_dir = level_dir
+      FLAGS.checkpoint_dir = level_dir
+      FLAGS.max_steps = FLAGS.prune_finetune_steps
+      if FLAGS.prune_finetune_steps > 0:
+        carc19_train.train()
+      result = carc19_eval.evaluate()
+      FLAGS.model_widths = saved_flags[0]
+      if result is None:
+        print('Evaluation of %s failed, level left out' % level_dir)
+        continue
+      precision, examples_per_sec = result
+      rows.append((level, level_widths, num_params(level_widths),
+                   checkpoint_bytes(level_dir), examples_per_sec, precision))
+  finally:
+    (FLAGS.model_widths, FLAGS.train_dir, FLAGS.checkpoint_dir,
+     FLAGS.max_steps) = saved_flags
+
+  print('%6s | %-22s | %10s | %8s | %12s | %7s' % (
+      'pruned', 'widths', 'params', 'ckpt MB', 'examples/sec', 'prec@1'))
+  for level, level_widths, params, size, examples_per_sec, precision in rows:
+    print('%5.0f%% | %-22s | %10d | %8.1f | %12.1f | %7.3f' % (
+        100 * level, ','.join(str(width) for width in level_widths), params,
+        size / (1024.0 * 1024.0), examples_per_sec, precision))
+
+
+def main(argv=None):  # pylint: disable=unused-argument
+  tf.gfile.MakeDirs(FLAGS.eval_dir)
+  prune()
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -0,0 +1,54 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for carc19 structured pruning."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+import carc19_prune
+
+
+class CARC19PruneTest(tf.test.TestCase):
+
+  def testKeepIndices(self):
+    keep = carc19_prune.keep_indices(
+        {'conv2': np.array([3.0, 1.0, 2.0, 0.5])}, 0.5)
+    self.assertAllEqual([0, 2], keep['conv2'])
+
+  def testPruneArray(self):
+    keep = {'conv3': np.array([1]), 'conv5': np.array([0, 2]),
+            'local6': np.array([1])}
+    kernel = np.arange(2 * 2 * 3 * 3).reshape(2, 2, 3, 3)
+    self.assertAllEqual(kernel[:, :, 1:2, :][..., [0, 2]],
+                        carc19_prune.prune_array('conv5/weights', kernel,
+                                                 keep, conv5_width=3))
+    # Two spatial positions of three conv5 channels feed two neurons.
+    local6 = np.arange(6 * 2).reshape(6, 2)
+    self.assertAllEqual([[1], [5], [7], [11]],
+                        carc19_prune.prune_array('local6/weights', local6,
+                                                 keep, conv5_width=3))
+    self.assertAllEqual([2.0, 3.0],
+                        carc19_prune.prune_array(
+                            'norm5/beta/ExponentialMovingAverage',
+                            np.array([2.0, 0.0, 3.0]), keep, conv5_width=3))
+
+
+if __name__ == '__main__':
+  tf.test.main()
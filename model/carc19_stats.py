@@ -0,0 +1,100 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Computes the per-channel pixel statistics of the CARC-19 training set.
+
+One pass over label_for_train.dat, decoding with 16 threads, writes
+label_for_train.dat.stats next to it. Train, eval and predict with
+--dataset_normalization then apply these constants instead of standardizing
+every image on its own.
+
+Usage:
+  python carc19_stats.py --data_dir=...
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from datetime import datetime
+
+import numpy as np
+import tensorflow as tf
+
+# carc19 defines --data_dir, --batch_size and the image flags.
+import carc19  # pylint: disable=unused-import
+import carc19_input
+
+FLAGS = tf.app.flags.FLAGS
+
+
+def compute_stats():
+  """Return the per-channel mean, std and number of images of the train set.
+  """
+  with tf.Graph().as_default():
+    filenames = carc19_input.label_filenames(FLAGS.data_dir)
+    filename_queue = tf.train.string_input_producer(filenames, num_epochs=1,
+                                                    shuffle=False)
+    read_input = carc19_input.read_carc19(
+        filename_queue, decode_ratio=FLAGS.jpeg_decode_ratio,
+        raw_mode=FLAGS.raw_mode or None, image_size=FLAGS.image_size)
+    image = tf.image.resize_image_with_crop_or_pad(
+        read_input.uint8image, FLAGS.image_size, FLAGS.image_size)
+    image.set_shape([FLAGS.image_size, FLAGS.image_size, 3])
+    images = tf.train.batch([image], batch_size=FLAGS.batch_size,
+                            num_threads=16,
+                            capacity=4 * FLAGS.batch_size,
+                            allow_smaller_final_batch=True)
+
+    # Sums in float64 so that 300k images do not lose precision.
+    pixels = tf.cast(images, tf.float64)
+    batch_sum = tf.reduce_sum(pixels, [0, 1, 2])
+    batch_sum_sq = tf.reduce_sum(tf.square(pixels), [0, 1, 2])
+    batch_count = tf.shape(images)[0]
+
+    total = np.zeros([3], np.float64)
+    total_sq = np.zeros([3], np.float64)
+    count = 0
+    with tf.Session() as sess:
+      sess.run(tf.local_variables_initializer())
+      coord = tf.train.Coordinator()
+      threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+      try:
+        while not coord.should_stop():
+          s, sq, n = sess.run([batch_sum, batch_sum_sq, batch_count])
+          total += s
+          total_sq += sq
+          count += n
+          if count % (100 * FLAGS.batch_size) == 0:
+            print('%s: %d images' % (datetime.now(), count))
+      except tf.errors.OutOfRangeError:
+        pass
+      finally:
+        coord.request_stop()
+      coord.join(threads)
+
+  num_pixels = count * FLAGS.image_size * FLAGS.image_size
+  mean = total / num_pixels
+  std = np.sqrt(np.maximum(total_sq / num_pixels - np.square(mean), 0.0))
+  return mean.tolist(), std.tolist(), count
+
+
+def main(argv=None):  # pylint: disable=unused-argument
+  mean, std, count = compute_stats()
+  carc19_input.write_dataset_stats(FLAGS.data_dir, mean, std, count)
+  print('%d images: mean = %s, std = %s' % (count, mean, std))
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -15,6 +15,19 @@
 
 """A binary to train CARC-19 using a single GPU.
 
+Distributed training uses between-graph replication with parameter servers:
+each worker reads a disjoint shard of label_for_train.dat and applies its
+updates asynchronously, the chief (worker 0) alone writes checkpoints and
+summaries.
+
+  python carc19_train.py --job_name=ps --task_index=0 \
+      --ps_hosts=h0:2222 --worker_hosts=h1:2222,h2:2222
+  python carc19_train.py --job_name=worker --task_index=0 ...
+  python carc19_train.py --job_name=worker --task_index=1 ...
+
+--local_workers=N starts one parameter server and N workers as local
+processes, to try the distributed setup on one machine.
+
 Accuracy:
 carc19_train.py achieves ~86% accuracy after 100K steps (256 epochs of
 data) as judged by carc19_eval.py.
@@ -36,12 +49,19 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import contextlib
 from datetime import datetime
+import math
+import socket
+import subprocess
+import sys
 import time
 
 import tensorflow as tf
 
 import carc19
+import carc19_memory
+import carc19_metrics
 
 FLAGS = tf.app.flags.FLAGS
 
@@ -54,11 +74,184 @@ tf.app.flags.DEFINE_boolean('log_device_placement', False,
                             """Whether to log device placement.""")
 tf.app.flags.DEFINE_integer('log_frequency', 10,
                             """How often to log results to the console.""")
+tf.app.flags.DEFINE_integer('validation_frequency', 0,
+                            """Score the held-out subset every this many """
+                            """steps. 0 disables in-process validation.""")
+tf.app.flags.DEFINE_integer('validation_examples', 1000,
+                            """Size of the held-out subset, a fixed random """
+                            """sample of label_for_train.dat left out of """
+                            """training while validation is enabled.""")
+tf.app.flags.DEFINE_float('target_precision', 0.0,
+                          """Stop once validation precision @ 1 reaches """
+                          """this value. 0 disables.""")
+tf.app.flags.DEFINE_integer('validation_patience', 0,
+                            """Stop after this many validations without """
+                            """an improvement of validation_min_delta. """
+                            """0 disables.""")
+tf.app.flags.DEFINE_float('validation_min_delta', 0.001,
+                          """Smallest precision gain counted as progress.""")
+tf.app.flags.DEFINE_boolean('log_memory', False,
+                            """Log the input queue, device and host memory """
+                            """with the loss.""")
+tf.app.flags.DEFINE_float('gpu_memory_fraction', 0.8,
+                          """Share of the GPU memory this process may """
+                          """allocate.""")
+tf.app.flags.DEFINE_string('ps_hosts', '',
+                           """Comma separated host:port of the parameter """
+                           """servers.""")
+tf.app.flags.DEFINE_string('worker_hosts', '',
+                           """Comma separated host:port of the workers.""")
+tf.app.flags.DEFINE_string('job_name', '',
+                           """'ps' or 'worker' for distributed training, """
+                           """empty to train in this process only.""")
+tf.app.flags.DEFINE_integer('task_index', 0,
+                            """Index of this task within its job. Worker 0 """
+                            """is the chief.""")
+tf.app.flags.DEFINE_integer('local_workers', 0,
+                            """If set, run a local cluster of one parameter """
+                            """server and this many worker processes.""")
+
+
+def _build_validation():
+  """Build a validation tower sharing the weights of the training tower.
+
+  The tower reads the moving average version of the weights, like
+  carc19_eval.py does. Its summaries and weight decay losses are dropped so
+  that the training summaries never dequeue validation batches.
+
+  Returns:
+    top_k_op: bool Tensor of [batch_size], whether each example is correct.
+  """
+  graph = tf.get_default_graph()
+  saved = dict((key, list(graph.get_collection(key)))
+               for key in (tf.GraphKeys.SUMMARIES, 'losses'))
+
+  variable_averages = tf.train.ExponentialMovingAverage(
+      carc19.MOVING_AVERAGE_DECAY)
+
+  def _moving_average_getter(getter, name, *args, **kwargs):
+    var = getter(name, *args, **kwargs)
+    try:
+      return graph.get_tensor_by_name(
+          variable_averages.average_name(var) + ':0')
+    except KeyError:
+      # Not averaged, e.g. batch norm moving statistics.
+      return var
+
+  with tf.name_scope('validation'):
+    # A holdout of the training split: the test split stays out of model
+    # selection, it only measures the final precision.
+    images, labels, _ = carc19.evaluate_inputs(
+        eval_data=False, num_holdout=FLAGS.validation_examples)
+    with tf.variable_scope(tf.get_variable_scope(), reuse=True,
+                           custom_getter=_moving_average_getter):
+      logits = carc19.inference(images)
+    top_k_op = tf.nn.in_top_k(logits, labels, 1)
+
+  for key, values in saved.items():
+    graph.clear_collection(key)
+    for value in values:
+      graph.add_to_collection(key, value)
+  return top_k_op
+
+
+class _ValidationHook(tf.train.SessionRunHook):
+  """Scores the held-out subset and stops when training has converged."""
+
+  def __init__(self, top_k_op, global_step, metrics):
+    self._top_k_op = top_k_op
+    self._global_step = global_step
+    self._metrics = metrics
+    self._num_iter = int(math.ceil(FLAGS.validation_examples /
+                                   FLAGS.batch_size))
+    self._best_precision = 0.0
+    self._num_stale = 0
+    self._last_validated_step = None
+
+  def before_run(self, run_context):
+    return tf.train.SessionRunArgs(self._global_step)
+
+  def after_run(self, run_context, run_values):
+    step = run_values.results
+    if step == 0 or step % FLAGS.validation_frequency != 0:
+      return
+    if step == self._last_validated_step:
+      # Gradient accumulation runs several micro-batches per step.
+      return
+    self._last_validated_step = step
+
+    true_count = 0
+    for _ in range(self._num_iter):
+      true_count += run_context.session.run(self._top_k_op).sum()
+    precision = true_count / (self._num_iter * FLAGS.batch_size)
+    print ('%s: step %d, validation precision @ 1 = %.3f' % (
+        datetime.now(), step, precision))
+    self._metrics.record(step, {'validation_precision': precision})
+
+    if precision >= self._best_precision + FLAGS.validation_min_delta:
+      self._num_stale = 0
+    else:
+      self._num_stale += 1
+    self._best_precision = max(self._best_precision, precision)
+
+    if FLAGS.target_precision and precision >= FLAGS.target_precision:
+      print ('Target precision %.3f reached, stopping.' %
+             FLAGS.target_precision)
+      run_context.request_stop()
+    elif (FLAGS.validation_patience and
+          self._num_stale >= FLAGS.validation_patience):
+      print ('No progress in %d validations, stopping at %.3f.' % (
+          self._num_stale, self._best_precision))
+      run_context.request_stop()
+
+
+class _CheckpointTimer(tf.train.CheckpointSaverListener):
+  """Records the latency of every checkpoint save."""
+
+  def __init__(self, metrics):
+    self._metrics = metrics
+    self._start_time = None
+
+  def before_save(self, session, global_step_value):
+    self._start_time = time.time()
+
+  def after_save(self, session, global_step_value):
+    self._metrics.record(global_step_value, {
+        'checkpoint_save_seconds': time.time() - self._start_time})
 
 
 def train():
   """Train CARC-19 for a number of steps."""
-  with tf.Graph().as_default():
+  num_workers = 1
+  device_fn = None
+  master = ''
+  config = tf.ConfigProto(log_device_placement=False)
+  if FLAGS.job_name:
+    cluster = tf.train.ClusterSpec({'ps': FLAGS.ps_hosts.split(','),
+                                    'worker': FLAGS.worker_hosts.split(',')})
+    server = tf.train.Server(cluster, job_name=FLAGS.job_name,
+                             task_index=FLAGS.task_index)
+    if FLAGS.job_name == 'ps':
+      server.join()
+      return
+    num_workers = cluster.num_tasks('worker')
+    worker_device = '/job:worker/task:%d' % FLAGS.task_index
+    # Variables live on the parameter servers, everything else on this
+    # worker.
+    device_fn = tf.train.replica_device_setter(worker_device=worker_device,
+                                               cluster=cluster)
+    master = server.target
+    # Do not wait for, or place anything on, the other workers.
+    config.device_filters.extend(['/job:ps', worker_device])
+  is_chief = FLAGS.task_index == 0
+  # The workers of a cluster share the flags, each gets its own port.
+  metrics = carc19_metrics.from_flags(
+      'train', task=FLAGS.task_index if FLAGS.job_name else None)
+
+  # closing() also closes the metrics when training raises, e.g. on a NaN
+  # loss.
+  with tf.Graph().as_default(), tf.device(device_fn), contextlib.closing(
+      metrics):
     global_step = tf.contrib.framework.get_or_create_global_step()
     ckpt = tf.train.get_checkpoint_state(FLAGS.train_dir)
     global_step = tf.contrib.framework.get_or_create_global_step()
@@ -69,69 +262,170 @@ def train():
       global_step_init = -1
 
     # Get images and labels for CARC-19.
-    images, labels = carc19.train_inputs()
+    num_holdout = (FLAGS.validation_examples
+                   if FLAGS.validation_frequency > 0 else 0)
+    images, labels = carc19.train_inputs(num_shards=num_workers,
+                                         shard_index=FLAGS.task_index,
+                                         num_holdout=num_holdout)
+    input_queue_size = tf.add_n(
+        [tf.cast(qr.queue.size(), tf.float32)
+         for qr in tf.get_collection(tf.GraphKeys.QUEUE_RUNNERS)],
+        name='input_queue_size')
+    memory_ops = {}
+    if FLAGS.log_memory:
+      memory_ops['input_queue_bytes'] = carc19_memory.queue_bytes()
+      memory_ops['device_high_water_bytes'] = (
+          carc19_memory.device_high_water_bytes())
+      memory_ops = dict((name, op) for name, op in memory_ops.items()
+                        if op is not None)
 
     # Build a Graph that computes the logits predictions from the
     # inference model.
-    logits = carc19.inference(images)
+    logits = carc19.inference(images, is_training=True)
 
     # Calculate loss.
     loss = carc19.loss(logits, labels)
 
     # Build a Graph that trains the model with one batch of examples and
-    # updates the model parameters.
-    train_op = carc19.train(loss, global_step)
+    # updates the model parameters. With gradient accumulation, a batch is
+    # accum_steps micro-batches of batch_size examples.
+    accum_steps = max(FLAGS.accum_steps, 1)
+    if accum_steps > 1:
+      accumulate_op, train_op = carc19.train_with_accumulation(
+          loss, global_step, accum_steps)
+    else:
+      train_op = carc19.train(loss, global_step)
 
     class _LoggerHook(tf.train.SessionRunHook):
       """Logs loss and runtime."""
 
       def begin(self):
         self._step = global_step_init
+        self._micro_step = 0
         self._start_time = time.time()
 
       def before_run(self, run_context):
-        self._step += 1
-        return tf.train.SessionRunArgs(loss)  # Asks for loss value.
+        self._micro_step += 1
+        if self._micro_step % accum_steps == 0:
+          self._step += 1
+        # Asks for loss value.
+        return tf.train.SessionRunArgs([loss, input_queue_size, memory_ops])
 
       def after_run(self, run_context, run_values):
-        if self._step % FLAGS.log_frequency == 0:
+        if (self._micro_step % accum_steps == 0 and
+            self._step % FLAGS.log_frequency == 0):
           current_time = time.time()
           duration = current_time - self._start_time
           self._start_time = current_time
 
-          loss_value = run_values.results
-          examples_per_sec = FLAGS.log_frequency * FLAGS.batch_size / duration
+          loss_value, queue_size, memory = run_values.results
+          examples_per_sec = (FLAGS.log_frequency * FLAGS.batch_size *
+                              accum_steps / duration)
           sec_per_batch = float(duration / FLAGS.log_frequency)
 
           format_str = ('%s: step %d, loss = %.2f (%.1f examples/sec; %.3f '
                         'sec/batch)')
           print (format_str % (datetime.now(), self._step, loss_value,
                                examples_per_sec, sec_per_batch))
+          metrics.record(self._step, {
+              'loss': loss_value, 'examples_per_sec': examples_per_sec,
+              'step_time_seconds': sec_per_batch,
+              'input_queue_size': queue_size,
+              'steps_total': FLAGS.log_frequency})
+          if FLAGS.log_memory:
+            memory['host_rss_bytes'], memory['host_peak_rss_bytes'] = (
+                carc19_memory.host_memory())
+            print ('%s: memory: %s' % (datetime.now(), ', '.join(
+                '%s %.1f MB' % (name, value / carc19_memory.MB)
+                for name, value in sorted(memory.items()))))
+            metrics.record(self._step, memory)
 
-    config = tf.ConfigProto(log_device_placement=False)
     config.gpu_options.allow_growth = True
-    config.gpu_options.per_process_gpu_memory_fraction = 0.8
+    config.gpu_options.per_process_gpu_memory_fraction = (
+        FLAGS.gpu_memory_fraction)
+
+    hooks = [tf.train.StopAtStepHook(last_step=FLAGS.max_steps),
+             tf.train.NanTensorHook(loss),
+             _LoggerHook()]
+    if FLAGS.validation_frequency > 0 and is_chief:
+      hooks.append(_ValidationHook(_build_validation(), global_step,
+                                   metrics))
 
     saver = tf.train.Saver()
+    # Only the chief saves checkpoints and summaries and initializes or
+    # restores the variables; the other workers wait for it. The checkpoint
+    # hook replaces the default one of MonitoredTrainingSession, with the
+    # same 10 minute period, to time the saves.
+    checkpoint_hook = tf.train.CheckpointSaverHook(
+        FLAGS.train_dir, save_secs=600, listeners=[_CheckpointTimer(metrics)])
     with tf.train.MonitoredTrainingSession(
+        master=master,
+        is_chief=is_chief,
         checkpoint_dir=FLAGS.train_dir,
-        hooks=[tf.train.StopAtStepHook(last_step=FLAGS.max_steps),
-               tf.train.NanTensorHook(loss),
-               _LoggerHook()],
+        hooks=hooks,
+        chief_only_hooks=[checkpoint_hook],
+        save_checkpoint_secs=None,
         config=config) as mon_sess:
       ckpt = tf.train.get_checkpoint_state(FLAGS.train_dir)
-      if ckpt and ckpt.model_checkpoint_path:
+      if is_chief and ckpt and ckpt.model_checkpoint_path:
         # Restores from checkpoint
         saver.restore(mon_sess, ckpt.model_checkpoint_path)
       while not mon_sess.should_stop():
+        for _ in range(accum_steps - 1):
+          mon_sess.run(accumulate_op)
         mon_sess.run(train_op)
 
 
+def _free_port():
+  """Return a localhost TCP port that is free right now."""
+  sock = socket.socket()
+  sock.bind(('localhost', 0))
+  port = sock.getsockname()[1]
+  sock.close()
+  return port
+
+
+def run_local_cluster(num_workers):
+  """Train with one parameter server and num_workers local processes.
+
+  Every process runs this binary with the same flags plus the cluster
+  flags. Returns when all the workers have exited.
+
+  Args:
+    num_workers: number of worker processes.
+
+  Returns:
+    int, the first non-zero worker exit code, or 0 if every worker
+    succeeded.
+  """
+  ps_hosts = 'localhost:%d' % _free_port()
+  worker_hosts = ','.join('localhost:%d' % _free_port()
+                          for _ in range(num_workers))
+  argv = [sys.executable, sys.argv[0]] + carc19.strip_flag(sys.argv[1:],
+                                                           'local_workers')
+  argv += ['--ps_hosts=%s' % ps_hosts, '--worker_hosts=%s' % worker_hosts]
+
+  ps = subprocess.Popen(argv + ['--job_name=ps', '--task_index=0'])
+  workers = [subprocess.Popen(argv + ['--job_name=worker',
+                                      '--task_index=%d' % i])
+             for i in range(num_workers)]
+  try:
+    # A worker killed by a signal has a negative exit code.
+    exit_codes = [worker.wait() for worker in workers]
+    return next((code for code in exit_codes if code), 0)
+  finally:
+    for process in workers + [ps]:
+      if process.poll() is None:
+        process.terminate()
+
+
 def main(argv=None):  # pylint: disable=unused-argument
   carc19.maybe_download_and_extract()
   ##if tf.gfile.Exists(FLAGS.train_dir):
   ##  tf.gfile.DeleteRecursively(FLAGS.train_dir)
   tf.gfile.MakeDirs(FLAGS.train_dir)
+  if FLAGS.local_workers > 0:
+    sys.exit(run_local_cluster(FLAGS.local_workers))
   train()
 
 
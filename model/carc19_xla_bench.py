@@ -0,0 +1,117 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Compares the XLA compiled CARC-19 graph with the plain one.
+
+Both graphs share the same randomly initialized weights and score the same
+random batch of --batch_size images, so no data or checkpoint is needed:
+
+  python carc19_xla_bench.py --batch_size=32 --stem=strided
+
+For the forward pass and for the forward and backward pass, prints the
+median step time of both graphs and the largest difference of their
+logits and gradients.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import carc19
+
+FLAGS = tf.app.flags.FLAGS
+
+tf.app.flags.DEFINE_integer('bench_steps', 50,
+                            """Timed steps per variant.""")
+tf.app.flags.DEFINE_integer('bench_warmup_steps', 5,
+                            """Untimed steps per variant, they include the """
+                            """XLA compilation.""")
+
+
+def _build(images, labels, xla, reuse):
+  """Build logits and gradients with FLAGS.xla set to xla."""
+  saved_xla = FLAGS.xla
+  FLAGS.xla = xla
+  try:
+    with tf.variable_scope(tf.get_variable_scope(), reuse=reuse):
+      logits = carc19.inference(images)
+    cross_entropy = tf.reduce_mean(
+        tf.nn.sparse_softmax_cross_entropy_with_logits(labels=labels,
+                                                       logits=logits))
+    grads = tf.gradients(cross_entropy, tf.trainable_variables())
+  finally:
+    FLAGS.xla = saved_xla
+  return logits, grads
+
+
+def _median_step_time(sess, fetches, feed):
+  for _ in range(FLAGS.bench_warmup_steps):
+    sess.run(fetches, feed)
+  durations = []
+  for _ in range(FLAGS.bench_steps):
+    start_time = time.time()
+    sess.run(fetches, feed)
+    durations.append(time.time() - start_time)
+  return float(np.median(durations))
+
+
+def bench():
+  """Time and compare the plain and the XLA graph."""
+  rng = np.random.RandomState(0)
+  feed_images = rng.randn(FLAGS.batch_size, FLAGS.image_size,
+                          FLAGS.image_size, 3).astype(np.float32)
+  feed_labels = rng.randint(0, carc19.NUM_CLASSES, FLAGS.batch_size)
+
+  with tf.Graph().as_default():
+    images = tf.placeholder(tf.float32, feed_images.shape)
+    labels = tf.placeholder(tf.int32, feed_labels.shape)
+    feed = {images: feed_images, labels: feed_labels}
+    plain = _build(images, labels, '', reuse=False)
+    compiled = _build(images, labels, 'model', reuse=True)
+
+    with tf.Session() as sess:
+      sess.run(tf.global_variables_initializer())
+      logits = sess.run([plain[0], compiled[0]], feed)
+      grads = sess.run([plain[1], compiled[1]], feed)
+      rows = []
+      for name, index in (('forward', 0), ('forward+backward', 1)):
+        rows.append((name,
+                     _median_step_time(sess, plain[index], feed),
+                     _median_step_time(sess, compiled[index], feed)))
+
+  logits_diff = np.max(np.abs(logits[0] - logits[1]))
+  grads_diff = max(np.max(np.abs(a - b)) / max(np.max(np.abs(a)), 1e-12)
+                   for a, b in zip(grads[0], grads[1]))
+  print('batch_size=%d image_size=%d stem=%s norm=%s' % (
+      FLAGS.batch_size, FLAGS.image_size, FLAGS.stem, FLAGS.norm))
+  print('%-18s | %10s | %10s | %7s' % ('pass', 'plain ms', 'xla ms',
+                                       'speedup'))
+  for name, plain_time, xla_time in rows:
+    print('%-18s | %10.2f | %10.2f | %6.2fx' % (
+        name, 1000 * plain_time, 1000 * xla_time, plain_time / xla_time))
+  print('max |logits difference| = %.2e' % logits_diff)
+  print('max relative gradient difference = %.2e' % grads_diff)
+
+
+def main(argv=None):  # pylint: disable=unused-argument
+  bench()
+
+
+if __name__ == '__main__':
+  tf.app.run()
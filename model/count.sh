@@ -1,4 +1,6 @@
 #/bin/bash
 
-
-grep prediction eval.out | cut -d' ' -f2,5 | sed "s/([^:]\+//g;s/)//g" | sort | uniq -c
+# Count target/prediction pairs of the misclassified examples in a manifest
+# written by: python carc19_eval.py --analyze
+# The manifest covers the training split unless --analyze_data=test is given.
+awk -F'\t' '$4 < 0 {print $2" "$3}' ${1:-hard_examples.tsv} | sort | uniq -c
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Incremental version of pre.sh: add the new entries of label_car_images.list
+# to an existing dataset without copying or preprocessing the old images.
+#
+#   cd $TFWORKDIR/carc19      # the data_dir holding label.dat and image/
+#   python append.py -s /path/to/label_car_images.list
+#
+# Every run is a new segment: its label.dat lines are kept in
+# segments/<version>.dat, appended to label.dat, label_for_train.dat and
+# label_for_test.dat, and recorded in manifest.json.
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+
+MANIFEST = 'manifest.json'
+SEGMENT_DIR = 'segments'
+
+
+def read_label_dat(path):
+    # class name -> label id, and the source files already in the dataset
+    labels = {}
+    known = set()
+    if not os.path.exists(path):
+        return labels, known
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            # bucket name label file class ...
+            labels[parts[4]] = int(parts[2])
+            known.add(parts[3])
+    return labels, known
+
+
+def new_entries(source_list, labels, known):
+    # label.dat lines of the listed images that are not in the dataset yet,
+    # formatted like pre.sh does; images of unknown classes are skipped,
+    # adding a class changes the label ids and needs a full pre.sh run
+    rows = []
+    skipped = {}
+    with open(source_list) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 2 or parts[0] in known:
+                continue
+            path, name = parts[0], parts[1]
+            if name not in labels:
+                skipped[name] = skipped.get(name, 0) + 1
+                continue
+            p = path.split('/')
+            bucket = 'image/%d/%s/' % (labels[name], p[1])
+            rows.append('%s %s %d %s' % (bucket, p[4], labels[name],
+                                         line.strip()))
+            known.add(path)
+    return rows, skipped
+
+
+def is_test(row, test_fraction):
+    # stable split: an image always falls on the same side
+    name = row.split()[1]
+    digest = int(hashlib.md5(name.encode('utf-8')).hexdigest()[:8], 16)
+    return digest < test_fraction * 0xffffffff
+
+
+def read_manifest(data_dir):
+    path = os.path.join(data_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'version': 0, 'segments': []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(data_dir, manifest):
+    path = os.path.join(data_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.rename(path + '.tmp', path)
+
+
+def append_lines(path, lines):
+    with open(path, 'a') as f:
+        for line in lines:
+            f.write(line + '\n')
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-s", "--source_list", required=True,
+        help="label_car_images.list with all the labeled images")
+    ap.add_argument("-d", "--data_dir", default=".",
+        help="dataset directory holding label.dat and image/")
+    ap.add_argument("-r", "--source_root", default=".",
+        help="directory the paths of the source list are relative to")
+    ap.add_argument("-t", "--test_fraction", type=float, default=0.12,
+        help="share of the new images added to label_for_test.dat")
+    ap.add_argument("-n", "--dry_run", action="store_true",
+        help="only count the new images")
+    args = ap.parse_args()
+
+    data_dir = args.data_dir
+    labels, known = read_label_dat(os.path.join(data_dir, 'label.dat'))
+    if not labels:
+        ap.error("no label.dat in %s, run pre.sh first" % data_dir)
+    rows, skipped = new_entries(args.source_list, labels, known)
+    for name, count in sorted(skipped.items()):
+        print('skipped %d images of unknown class %s' % (count, name))
+    print('%d new images' % len(rows))
+    if not rows or args.dry_run:
+        return
+
+    # copy and preprocess only the new files
+    cut_list = []
+    for row in rows:
+        bucket, name, _, path = row.split()[:4]
+        target_dir = os.path.join(data_dir, bucket)
+        if not os.path.isdir(target_dir):
+            os.makedirs(target_dir)
+        shutil.copy(os.path.join(args.source_root, path), target_dir)
+        cut_list.append(os.path.join(target_dir, name))
+    from image_cutter import cut_image
+    for image_path in cut_list:
+        cut_image(image_path)
+
+    manifest = read_manifest(data_dir)
+    version = manifest['version'] + 1
+    segment = os.path.join(SEGMENT_DIR, '%06d.dat' % version)
+    if not os.path.isdir(os.path.join(data_dir, SEGMENT_DIR)):
+        os.makedirs(os.path.join(data_dir, SEGMENT_DIR))
+    append_lines(os.path.join(data_dir, segment), rows)
+
+    test_rows = [row for row in rows if is_test(row, args.test_fraction)]
+    train_rows = [row for row in rows if not is_test(row, args.test_fraction)]
+    append_lines(os.path.join(data_dir, 'label_for_train.dat'), train_rows)
+    append_lines(os.path.join(data_dir, 'label_for_test.dat'), test_rows)
+    # label.dat marks the images as known to the next run, so it goes last
+    append_lines(os.path.join(data_dir, 'label.dat'), rows)
+
+    manifest['version'] = version
+    manifest['segments'].append({
+        'version': version,
+        'file': segment,
+        'created': datetime.datetime.now().isoformat(),
+        'num_train': len(train_rows),
+        'num_test': len(test_rows),
+    })
+    write_manifest(data_dir, manifest)
+    print('segment %s: %d train, %d test' % (segment, len(train_rows),
+                                            len(test_rows)))
+    if os.path.exists(os.path.join(data_dir, 'label_for_train.dat.stats')):
+        print('label_for_train.dat.stats is stale, rerun carc19_stats.py')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Tests of the label handling of append.py:
+#
+#   cd preprocess && python append_test.py
+import os
+import shutil
+import tempfile
+import unittest
+
+import append
+
+
+class AppendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_list(self, lines):
+        path = os.path.join(self.tmp_dir, 'label_car_images.list')
+        with open(path, 'w') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        return path
+
+    def test_new_entries(self):
+        source_list = self.write_list([
+            'cars/bj/a/b/old.jpg audi',
+            'cars/bj/a/b/new.jpg audi',
+            'cars/bj/a/b/new.jpg audi',  # listed twice, added once
+            'cars/sh/a/b/van.jpg tesla',
+            'cars/sh/a/b/bus.jpg tesla',
+            'short',
+        ])
+        known = set(['cars/bj/a/b/old.jpg'])
+        rows, skipped = append.new_entries(source_list, {'audi': 3}, known)
+        self.assertEqual(
+            ['image/3/bj/ new.jpg 3 cars/bj/a/b/new.jpg audi'], rows)
+        self.assertEqual({'tesla': 2}, skipped)
+        self.assertIn('cars/bj/a/b/new.jpg', known)
+
+    def test_is_test(self):
+        rows = ['image/3/bj/ %d.jpg 3 cars/bj/a/b/%d.jpg audi' % (i, i)
+                for i in range(1000)]
+        test = [row for row in rows if append.is_test(row, 0.2)]
+        # The split depends on the file name only, not on the run.
+        self.assertEqual(test, [row for row in rows
+                                if append.is_test(row, 0.2)])
+        self.assertTrue(150 < len(test) < 250)
+        self.assertFalse(any(append.is_test(row, 0.0) for row in rows))
+        self.assertTrue(all(append.is_test(row, 1.0) for row in rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
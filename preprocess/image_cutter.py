@@ -17,16 +17,7 @@ def gray_image_laplacian(image):
     return fm
 
 
-# construct the argument parse and parse the arguments
-ap = argparse.ArgumentParser()
-ap.add_argument("-i", "--images", required=True,
-    help="path to input directory of images")
-ap.add_argument("-t", "--threshold", type=float, default=100.0,
-    help="focus measures that fall below this value will be considered 'blurry'")
-args = vars(ap.parse_args())
-
-# loop over the input images
-for imagePath in paths.list_images(args["images"]):
+def cut_image(imagePath):
     # load the image, convert it to grayscale, and compute the
     # focus measure of the image using the Variance of Laplacian
     # method
@@ -64,3 +55,28 @@ for imagePath in paths.list_images(args["images"]):
     cv2.imwrite(imagePath, image)
 
 
+def list_images(images, image_list):
+    # images of a directory tree, or only the paths listed one per line in
+    # image_list, e.g. the new files of an incremental append
+    if image_list:
+        with open(image_list) as f:
+            return [line.strip() for line in f if line.strip()]
+    return list(paths.list_images(images))
+
+
+if __name__ == '__main__':
+    # construct the argument parse and parse the arguments
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--images",
+        help="path to input directory of images")
+    ap.add_argument("-l", "--list",
+        help="file listing the images to process, one path per line")
+    ap.add_argument("-t", "--threshold", type=float, default=100.0,
+        help="focus measures that fall below this value will be considered 'blurry'")
+    args = vars(ap.parse_args())
+    if not args["images"] and not args["list"]:
+        ap.error("one of --images or --list is required")
+
+    # loop over the input images
+    for imagePath in list_images(args["images"], args["list"]):
+        cut_image(imagePath)
@@ -1,3 +1,5 @@
+# Full rebuild of label.dat and image/ from label_car_images.list.
+# To add new images to an existing dataset, use append.py instead.
 
 cut -d' ' -f1,2 label_car_images.list | cut -d' ' -f2 | sort | uniq -c > label.stat
 awk 'NR==FNR{if($1>100){s[$2]=1}}NR!=FNR&&($2 in s){print}' label.stat label_car_images.list | 